@@ -1043,6 +1043,95 @@ let query = `
       return { success: false, error: error.message };
     }
   }
+
+  // ===== PLEX RESOURCE ALERTS =====
+
+  // Sends new anomaly alerts written by plex_resource_monitor.py (NDJSON, one event per line)
+  async processResourceAlerts() {
+    const fs = require('fs');
+    const path = require('path');
+    const dataDir = process.env.PLEX_MONITOR_DATA_DIR || path.join(__dirname, 'data', 'plex_monitor');
+    const alertPath = path.join(dataDir, 'alerts.ndjson');
+
+    try {
+      if (!fs.existsSync(alertPath)) {
+        this.alertOffset = 0;
+        return { success: true, sent: 0 };
+      }
+
+      const size = fs.statSync(alertPath).size;
+      // First run only remembers where the file ends; a smaller file means it was rotated
+      if (this.alertOffset === undefined) {
+        this.alertOffset = size;
+        return { success: true, sent: 0 };
+      }
+      if (size < this.alertOffset) {
+        this.alertOffset = 0;
+      }
+      if (size === this.alertOffset) {
+        return { success: true, sent: 0 };
+      }
+
+      const fd = fs.openSync(alertPath, 'r');
+      const buffer = Buffer.alloc(size - this.alertOffset);
+      fs.readSync(fd, buffer, 0, buffer.length, this.alertOffset);
+      fs.closeSync(fd);
+
+      // Only consume complete lines; a partial last line is read next time. The offset only moves
+      // past alerts once they're emailed, so a failed send is retried on the next run
+      const text = buffer.toString();
+      const complete = text.slice(0, text.lastIndexOf('\n') + 1);
+      const nextOffset = this.alertOffset + Buffer.byteLength(complete);
+
+      const alerts = complete.split('\n').filter(line => line.trim()).map(line => {
+        try {
+          return JSON.parse(line);
+        } catch (e) {
+          return null;
+        }
+      }).filter(alert => alert && alert.metric && alert.state);
+
+      if (alerts.length === 0) {
+        this.alertOffset = nextOffset;
+        return { success: true, sent: 0 };
+      }
+
+      const settings = await this.getEmailSettings();
+      const recipient = process.env.ALERT_EMAIL || settings.smtp_user;
+      if (!recipient) {
+        console.warn('⚠️ Plex resource alerts pending but no ALERT_EMAIL or smtp_user configured');
+        return { success: false, error: 'No alert recipient configured' };
+      }
+
+      const firing = alerts.filter(alert => alert.state === 'firing').length;
+      const subject = `Plex resource alerts: ${firing} firing, ${alerts.length - firing} resolved`;
+      const rows = alerts.map(alert => `
+        <tr>
+          <td>${alert.time}</td>
+          <td>${alert.server}</td>
+          <td>${alert.metric}</td>
+          <td>${alert.state === 'firing' ? '🔴 firing' : '🟢 resolved'} (${alert.direction})</td>
+          <td>${alert.value}</td>
+          <td>${alert.mean} ± ${alert.std}</td>
+        </tr>`).join('');
+      const htmlBody = `
+        <h3>Plex resource anomalies</h3>
+        <table border="1" cellpadding="4" cellspacing="0">
+          <tr><th>Time</th><th>Server</th><th>Metric</th><th>State</th><th>Value</th><th>Baseline</th></tr>
+          ${rows}
+        </table>`;
+
+      const result = await this.sendEmail(recipient, subject, htmlBody);
+      if (!result.success) {
+        return { ...result, sent: 0 };
+      }
+      this.alertOffset = nextOffset;
+      return { ...result, sent: alerts.length };
+    } catch (error) {
+      console.error('Error processing Plex resource alerts:', error);
+      return { success: false, error: error.message };
+    }
+  }
 }
 
 module.exports = new EmailService();
\ No newline at end of file
@@ -781,15 +781,17 @@ async refreshPlexStatsCache() {
         
         console.log('📊 Stats to store:', statsToStore);
         
-        await db.query('DELETE FROM plex_statistics WHERE stat_key IN (?, ?, ?, ?, ?, ?, ?, ?)', 
-          ['hd_movies', 'anime_movies', 'fourk_movies', 'tv_shows', 'anime_tv_shows', 'tv_seasons', 'tv_episodes', 'audiobooks']);
-        
-        for (const [key, value] of statsToStore) {
-          await db.query(
-            `INSERT INTO plex_statistics (stat_key, stat_value, last_updated) VALUES (?, ?, NOW())`,
-            [key, value]
-          );
-        }
+        // Swap the stats in one transaction so a failed insert keeps the old values
+        await db.transaction([
+          {
+            sql: `DELETE FROM plex_statistics WHERE stat_key IN (${statsToStore.map(() => '?').join(', ')})`,
+            params: statsToStore.map(([key]) => key)
+          },
+          {
+            sql: `INSERT INTO plex_statistics (stat_key, stat_value, last_updated) VALUES ${statsToStore.map(() => '(?, ?, NOW())').join(', ')}`,
+            params: statsToStore.flat()
+          }
+        ]);
         
         console.log('✅ Plex statistics cached in database');
         resolve();
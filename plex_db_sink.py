@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Plex DB Sink
+Writes plex_statistics / plex_user_activity rows straight from the Python scripts
+
+Sinks:
+  mysql        the app database (DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, like database-config.js); needs pymysql
+  sqlite:PATH  a local SQLite file with the same tables (testing / stand-in)
+  csv:DIR      DIR/<table>.csv plus DIR/<table>.sql, a LOAD DATA LOCAL INFILE script that swaps the rows in
+
+Every write is one transaction of batched multi-row statements: the rows are upserted on the
+table's key column, so a failure rolls back and leaves the previous rows in place. Given the
+complete list of current keys, rows for keys outside it are deleted in the same transaction.
+"""
+
+import csv
+import json
+import os
+import sys
+import sqlite3
+import argparse
+from datetime import datetime
+
+# Rows per multi-row statement
+BATCH_SIZE = 500
+
+# Stats the dashboard reads, from the Plex 1 servers (same mapping the Node refresh used)
+STAT_KEYS = ['hd_movies', 'anime_movies', 'fourk_movies', 'tv_shows', 'anime_tv_shows',
+             'tv_seasons', 'tv_episodes', 'audiobooks']
+
+TABLES = {
+    'plex_statistics': {
+        'key': 'stat_key',
+        'columns': ('stat_key', 'stat_value', 'last_updated')
+    },
+    'plex_user_activity': {
+        'key': 'plex_account_id',
+        'columns': ('plex_account_id', 'plex_account_name', 'plex_account_username', 'plex_account_email',
+                    'server_name', 'days_since_last_watch', 'last_watched_date', 'last_watched_title',
+                    'has_recent_activity', 'sync_timestamp'),
+        # Unchanged accounts aren't re-sent by the incremental sync, so rows older than this run are aged here
+        'synced_at': 'sync_timestamp',
+        'after': {
+            'mysql': "UPDATE plex_user_activity SET days_since_last_watch = DATEDIFF(NOW(), last_watched_date) "
+                     "WHERE last_watched_date IS NOT NULL AND sync_timestamp < {cutoff}",
+            'sqlite': "UPDATE plex_user_activity "
+                      "SET days_since_last_watch = CAST(julianday('now', 'localtime') - julianday(last_watched_date) AS INTEGER) "
+                      "WHERE last_watched_date IS NOT NULL AND sync_timestamp < {cutoff}"
+        }
+    }
+}
+
+def statistics_rows(all_stats, now=None):
+    """plex_statistics rows from plex_statistics.py output"""
+    now = now or datetime.now()
+    regular = ((all_stats.get('plex1') or {}).get('regular') or {}).get('stats') or {}
+    fourk = ((all_stats.get('plex1') or {}).get('fourk') or {}).get('stats') or {}
+    count = lambda stats, key: stats.get(key) or 0
+    values = {
+        'hd_movies': count(regular, 'hd_movies'),
+        'anime_movies': count(regular, 'anime_movies'),
+        'fourk_movies': count(fourk, 'hd_movies'),
+        'tv_shows': count(regular, 'regular_tv_shows') + count(regular, 'kids_tv_shows') + count(regular, 'fitness_tv_shows'),
+        'anime_tv_shows': count(regular, 'anime_tv_shows'),
+        'tv_seasons': count(regular, 'total_seasons'),
+        'tv_episodes': count(regular, 'total_episodes'),
+        'audiobooks': count(regular, 'audio_albums')
+    }
+    return [(key, values[key], now) for key in STAT_KEYS]
+
+def parse_timestamp(value):
+    """ISO timestamp from the scripts -> naive local datetime (None stays None)"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+
+def activity_rows(records):
+    """plex_user_activity rows from plex_last_watched_script.py output"""
+    return [(
+        record['plex_account_id'],
+        record['username'],
+        record['username'],
+        record['email'],
+        record['server'],
+        record['days_since_last_watch'],
+        parse_timestamp(record['last_watched_date']),
+        record['last_watched_title'],
+        record['days_since_last_watch'] is not None,
+        parse_timestamp(record['sync_timestamp'])
+    ) for record in records]
+
+ROW_BUILDERS = {
+    'plex_statistics': statistics_rows,
+    'plex_user_activity': activity_rows
+}
+
+def sql_value(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+def csv_value(value):
+    """LOAD DATA field with the default escaping: \\N is NULL, backslashes doubled"""
+    if value is None:
+        return '\\N'
+    value = sql_value(value)
+    return value.replace('\\', '\\\\') if isinstance(value, str) else value
+
+def sql_literal(value):
+    """Inline SQL literal for the LOAD DATA script"""
+    value = sql_value(value)
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace('\\', '\\\\').replace("'", "''") + "'"
+
+def run_cutoff(spec, rows):
+    """Start of the run that produced rows: the oldest synced_at among them (now if there are none)"""
+    index = spec['columns'].index(spec['synced_at'])
+    return min((row[index] for row in rows if row[index] is not None), default=None) or datetime.now()
+
+def batches(rows, size=BATCH_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def connect_mysql():
+    try:
+        import pymysql
+    except ImportError:
+        raise RuntimeError("pymysql not installed. Run: pip install pymysql")
+    return pymysql.connect(
+        host=os.environ.get('DB_HOST', 'localhost'),
+        user=os.environ.get('DB_USER', 'johnsonflix'),
+        password=os.environ.get('DB_PASSWORD', 'password'),
+        database=os.environ.get('DB_NAME', 'subsapp_db'),
+        charset='utf8mb4',
+        autocommit=False
+    )
+
+def has_unique_key(cursor, dialect, table, column):
+    """Whether `column` alone is a primary/unique key of `table` (so rows can be upserted on it)"""
+    if dialect == 'mysql':
+        cursor.execute(f"SHOW INDEX FROM {table}")
+        names = [description[0] for description in cursor.description]
+        indexes = {}
+        for row in cursor.fetchall():
+            index = dict(zip(names, row))
+            if not int(index['Non_unique']):
+                indexes.setdefault(index['Key_name'], set()).add(index['Column_name'])
+        return {column} in indexes.values()
+
+    cursor.execute(f"PRAGMA table_info({table})")
+    primary = [row[1] for row in cursor.fetchall() if row[5]]
+    if primary == [column]:
+        return True
+    cursor.execute(f"PRAGMA index_list({table})")
+    for index in cursor.fetchall():
+        if index[2]:
+            cursor.execute(f"PRAGMA index_info({index[1]})")
+            if [row[2] for row in cursor.fetchall()] == [column]:
+                return True
+    return False
+
+def upsert_rows(connection, dialect, table, rows, keep_keys=None):
+    """Upsert rows in one transaction: ON DUPLICATE KEY / ON CONFLICT when the key column is unique,
+    otherwise the key's old rows are deleted and re-inserted inside the same transaction.
+    With keep_keys, rows whose key isn't in it (accounts that left) are deleted in the same transaction."""
+    spec = TABLES[table]
+    key, columns = spec['key'], spec['columns']
+    mark = '%s' if dialect == 'mysql' else '?'
+    row_marks = f"({', '.join([mark] * len(columns))})"
+
+    cursor = connection.cursor()
+    try:
+        unique = has_unique_key(cursor, dialect, table, key)
+        if dialect == 'mysql':
+            upsert = ' ON DUPLICATE KEY UPDATE ' + ', '.join(f"{c} = VALUES({c})" for c in columns if c != key)
+        else:
+            upsert = f" ON CONFLICT({key}) DO UPDATE SET " + ', '.join(f"{c} = excluded.{c}" for c in columns if c != key)
+
+        for batch in batches(rows):
+            if not unique:
+                cursor.execute(f"DELETE FROM {table} WHERE {key} IN ({', '.join([mark] * len(batch))})",
+                               [row[0] for row in batch])
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([row_marks] * len(batch))}"
+                + (upsert if unique else ''),
+                [sql_value(value) for row in batch for value in row]
+            )
+
+        removed = 0
+        if keep_keys is not None:
+            cursor.execute(f"SELECT {key} FROM {table}")
+            stale = sorted({row[0] for row in cursor.fetchall()} - set(keep_keys))
+            for batch in batches(stale):
+                cursor.execute(f"DELETE FROM {table} WHERE {key} IN ({', '.join([mark] * len(batch))})", batch)
+            removed = len(stale)
+        
+        if spec.get('after'):
+            cursor.execute(spec['after'][dialect].format(cutoff=mark), [sql_value(run_cutoff(spec, rows))])
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    print(f"[SINK] Upserted {len(rows)} rows into {table} ({dialect}, {'unique key' if unique else 'replace by key'})"
+          + (f", removed {removed} missing from the user list" if removed else ''), file=sys.stderr)
+    return len(rows)
+
+def write_load_data(directory, table, rows, keep_keys=None):
+    """CSV plus a LOAD DATA script: loads into a staging copy, then swaps the keyed rows in one transaction"""
+    spec = TABLES[table]
+    key, columns = spec['key'], spec['columns']
+    os.makedirs(directory, exist_ok=True)
+    csv_path = os.path.abspath(os.path.join(directory, f"{table}.csv"))
+    sql_path = os.path.join(directory, f"{table}.sql")
+
+    with open(f"{csv_path}.tmp", 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        for row in rows:
+            writer.writerow([csv_value(value) for value in row])
+    os.replace(f"{csv_path}.tmp", csv_path)
+
+    column_list = ', '.join(columns)
+    statements = [
+        "START TRANSACTION;",
+        f"CREATE TEMPORARY TABLE {table}_load LIKE {table};",
+        f"LOAD DATA LOCAL INFILE '{csv_path}' INTO TABLE {table}_load "
+        f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\n' ({column_list});",
+        f"DELETE {table} FROM {table} JOIN {table}_load USING ({key});",
+        f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {table}_load;"
+    ]
+    if keep_keys is not None:
+        keep = ', '.join(sql_literal(value) for value in sorted(keep_keys))
+        statements.append(f"DELETE FROM {table} WHERE {key} NOT IN ({keep});" if keep else f"DELETE FROM {table};")
+    if spec.get('after'):
+        statements.append(f"{spec['after']['mysql'].format(cutoff=sql_literal(run_cutoff(spec, rows)))};")
+    statements += ["COMMIT;", f"DROP TEMPORARY TABLE {table}_load;"]
+
+    with open(sql_path, 'w') as f:
+        f.write('\n'.join(statements) + '\n')
+
+    print(f"[SINK] Wrote {len(rows)} rows to {csv_path} (load with: mysql --local-infile=1 < {sql_path})",
+          file=sys.stderr)
+    return len(rows)
+
+def write_rows(sink, table, rows, keep_keys=None):
+    """Write rows to a sink spec ('mysql', 'sqlite:PATH' or 'csv:DIR'); returns the row count.
+    keep_keys is the complete set of current keys: rows outside it are removed."""
+    kind, _, target = sink.partition(':')
+    if kind == 'csv':
+        return write_load_data(target or '.', table, rows, keep_keys)
+    if not rows and keep_keys is None:
+        return 0
+    if kind == 'mysql':
+        connection = connect_mysql()
+    elif kind == 'sqlite' and target:
+        connection = sqlite3.connect(target)
+    else:
+        raise ValueError(f"Unknown sink '{sink}' (use mysql, sqlite:PATH or csv:DIR)")
+
+    try:
+        return upsert_rows(connection, kind, table, rows, keep_keys)
+    finally:
+        connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Write plex_statistics.py / plex_last_watched_script.py JSON to the database')
+    parser.add_argument('--table', choices=sorted(TABLES), required=True,
+                        help='Target table (the JSON on stdin is the matching script\'s output)')
+    parser.add_argument('--sink', default='mysql',
+                        help='mysql, sqlite:PATH or csv:DIR (default: mysql)')
+
+    args = parser.parse_args()
+
+    try:
+        data = json.load(sys.stdin)
+        keep_keys, sync_id = None, None
+        if isinstance(data, dict) and 'records' in data:
+            # --incremental output: the delta plus the current account ids; once written, its
+            # sync_id goes back to plex_last_watched_script.py --commit-state
+            data, keep_keys, sync_id = data['records'], data.get('account_ids'), data.get('sync_id')
+        rows = ROW_BUILDERS[args.table](data)
+        count = write_rows(args.sink, args.table, rows, keep_keys)
+        print(json.dumps({'table': args.table, 'rows': count, 'sync_id': sync_id}))
+    except Exception as e:
+        print(f"[FATAL] Sink failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -4,12 +4,24 @@ Plex Users API Last Watched Script
 Uses the Plex Users API that has both emails and correct account IDs
 """
 
+import email.policy
+import hashlib
 import json
+import os
 import sys
+import time
+import threading
+import uuid
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import BytesParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
 import xml.etree.ElementTree as ET
-from datetime import datetime, timedelta
+from datetime import datetime
 import argparse
+import numpy as np
+from plex_db_sink import activity_rows, write_rows
 
 try:
     from plexapi.server import PlexServer
@@ -32,44 +44,290 @@ PLEX_SERVERS = {
     }
 }
 
-def get_users_with_emails_and_ids(server_config):
-    """Get users using the Plex Users API - has both emails and account IDs"""
+# History sweep: page through the server's global history newest first
+HISTORY_PAGE_SIZE = 500
+SWEEP_WINDOW_DAYS = 365
+
+# Per-account history queries: parallel requests per server, rate limit, timeout per request
+FETCH_CONCURRENCY = 8
+FETCH_RATE_PER_SECOND = 20
+REQUEST_TIMEOUT = 30
+
+# Incremental sync state: per-server high-water mark and latest view per account
+STATE_DIR = os.environ.get(
+    'PLEX_WATCH_DATA_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'plex_last_watched')
+)
+
+# plex.tv user directory cache, one file per token (by hash)
+USERS_CACHE_DIR = os.path.join(STATE_DIR, 'users')
+USERS_CACHE_TTL = 6 * 3600    # seconds before the directory is revalidated with plex.tv
+
+# Webhook receiver: Plex media events keep a per-account last-activity index between syncs
+WEBHOOK_HOST = os.environ.get('PLEX_WEBHOOK_HOST', '127.0.0.1')
+WEBHOOK_PORT = int(os.environ.get('PLEX_WEBHOOK_PORT', 9596))
+WEBHOOK_EVENTS = ('media.play', 'media.scrobble', 'media.stop')
+WEBHOOK_FLUSH_INTERVAL = 5    # seconds between index saves
+WEBHOOK_INDEX_PATH = os.path.join(STATE_DIR, 'webhook_activity.json')
+WEBHOOK_IDENTITY_REFRESH = 300    # seconds before an unknown Server.uuid triggers another /identity lookup
+
+# Viewing stats: windows in days, cached columnar history per server (kept for the longest window)
+VIEWING_WINDOWS = (7, 30, 90)
+FAVOURITE_LIBRARIES = 3
+METADATA_BATCH_SIZE = 100
+VIEW_DTYPE = np.dtype([
+    ('account', '<i8'),
+    ('viewed_at', '<i8'),
+    ('rating_key', '<i8'),
+    ('title_key', '<i8'),   # show for episodes, the item itself otherwise
+    ('section', '<i4'),
+    ('duration', '<i4')     # seconds
+])
+VIEWING_COLUMNS = (['user_id', 'email', 'username', 'server', 'account_id']
+                   + [f"{metric}_{window}d" for window in VIEWING_WINDOWS
+                      for metric in ('plays', 'hours', 'titles', 'active_days')]
+                   + ['peak_streams', 'favourite_libraries'])
+
+# Churn risk: logistic score over recency, 30-day vs prior 30-day trends and library breadth
+CHURN_TREND_DAYS = 30
+CHURN_TREND_CLIP = 4
+CHURN_RECENCY_CAP_DAYS = 90
+CHURN_WEIGHTS = {
+    'bias': -3.0,
+    'recency': 0.08,          # per day since the last watch (capped)
+    'frequency_trend': -0.8,  # per halving of plays
+    'session_trend': -0.4,    # per halving of average play length
+    'breadth': -0.3           # per library watched in the last 90 days
+}
+CHURN_BANDS = (0.33, 0.66)    # medium, high
+CHURN_COLUMNS = ['user_id', 'email', 'username', 'server', 'account_id', 'days_since_last_watch',
+                 'plays_30d', 'plays_prior_30d', 'frequency_trend', 'session_trend', 'libraries_90d',
+                 'churn_risk', 'churn_band']
+
+NO_WATCH_DATA = {
+    'days_since_last_watch': None,
+    'last_watched_date': None,
+    'last_watched_title': None
+}
+
+def parse_users_stream(stream):
+    """Compact [account_id, username, email] records from the plex.tv users XML, parsed as it streams"""
+    users = []
+    for event, element in ET.iterparse(stream, events=('end',)):
+        if element.tag != 'User':
+            continue
+        user_id = element.get('id')
+        username = element.get('username')
+        email = element.get('email')
+        if email and username and user_id:
+            users.append([int(user_id), username, email.lower()])
+        # Drop the parsed element (and its Server children) as we go
+        element.clear()
+    return users
+
+def users_cache_path(token):
+    return os.path.join(USERS_CACHE_DIR, f"{hashlib.sha256(token.encode()).hexdigest()[:16]}.json")
+
+_users_memo = {}
+
+def get_users_with_emails_and_ids(server_config, refresh=False):
+    """Get users using the Plex Users API - has both emails and account IDs.
+    The parsed directory is cached per token for USERS_CACHE_TTL; after that it is
+    revalidated with ETag/Last-Modified, so an unchanged directory isn't downloaded again."""
+    token = server_config['token']
+    if token in _users_memo:
+        return _users_memo[token]
+    
+    cache_path = users_cache_path(token)
     try:
-        print(f"[INFO] Getting users from {server_config['name']} using Users API", file=sys.stderr)
-        
-        url = f"https://plex.tv/api/users/?X-Plex-Token={server_config['token']}"
-        headers = {'Accept': 'application/xml'}
-        
-        response = requests.get(url, headers=headers, timeout=30)
-        
-        if response.status_code != 200:
-            print(f"[ERROR] Users API failed: HTTP {response.status_code}", file=sys.stderr)
-            return []
-        
-        # Parse XML response
-        root = ET.fromstring(response.text)
-        users = []
-        
-        for user in root.findall('.//User'):
-            user_id = user.get('id')
-            username = user.get('username')
-            email = user.get('email')
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        cache = None
+    
+    try:
+        if cache and not refresh and time.time() - cache['fetched_at'] < USERS_CACHE_TTL:
+            print(f"[CACHE] Using cached user directory for {server_config['name']} ({len(cache['users'])} users)", file=sys.stderr)
+            records = cache['users']
+        else:
+            print(f"[INFO] Getting users from {server_config['name']} using Users API", file=sys.stderr)
             
-            if email and username and user_id:
-                users.append({
-                    'email': email.lower(),
-                    'username': username,
-                    'account_id': int(user_id)
-                })
-                print(f"[USER] {username} ({email}) -> Account ID: {user_id}", file=sys.stderr)
+            url = f"https://plex.tv/api/users/?X-Plex-Token={token}"
+            headers = {'Accept': 'application/xml'}
+            if cache and cache.get('etag'):
+                headers['If-None-Match'] = cache['etag']
+            if cache and cache.get('last_modified'):
+                headers['If-Modified-Since'] = cache['last_modified']
+            
+            with requests.get(url, headers=headers, timeout=30, stream=True) as response:
+                if response.status_code == 304 and cache:
+                    print(f"[CACHE] User directory unchanged for {server_config['name']}", file=sys.stderr)
+                    records = cache['users']
+                elif response.status_code != 200:
+                    print(f"[ERROR] Users API failed: HTTP {response.status_code}", file=sys.stderr)
+                    if not cache:
+                        return []
+                    print("[CACHE] Falling back to the cached user directory", file=sys.stderr)
+                    records = cache['users']
+                else:
+                    response.raw.decode_content = True
+                    records = parse_users_stream(response.raw)
+                
+                if response.status_code in (200, 304):
+                    os.makedirs(USERS_CACHE_DIR, exist_ok=True)
+                    with open(f"{cache_path}.tmp", 'w') as f:
+                        json.dump({
+                            'fetched_at': time.time(),
+                            'etag': response.headers.get('ETag') or (cache or {}).get('etag'),
+                            'last_modified': response.headers.get('Last-Modified') or (cache or {}).get('last_modified'),
+                            'users': records
+                        }, f)
+                    os.replace(f"{cache_path}.tmp", cache_path)
         
+        users = [{'email': email, 'username': username, 'account_id': account_id}
+                 for account_id, username, email in records]
         print(f"[SUCCESS] Found {len(users)} users with emails and account IDs", file=sys.stderr)
+        _users_memo[token] = users
         return users
         
     except Exception as e:
         print(f"[ERROR] Failed to get users: {e}", file=sys.stderr)
         return []
 
+def directory_account_ids(server_keys):
+    """Account ids across every server's user directory, or None unless all servers were synced
+    and listed (a partial list would look like everyone else left)"""
+    if set(server_keys) != set(PLEX_SERVERS):
+        return None
+    account_ids = set()
+    for server_key in server_keys:
+        users = _users_memo.get(PLEX_SERVERS[server_key]['token'])
+        if not users:
+            return None
+        account_ids.update(user['account_id'] for user in users)
+    return sorted(account_ids)
+
+def load_watch_state(server_key):
+    """Saved high-water mark and per-account latest views for a server (None on first run)"""
+    try:
+        with open(os.path.join(STATE_DIR, f"{server_key}.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def save_watch_state(server_key, state, suffix='json'):
+    """Persist sync state via a temp file + rename"""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = os.path.join(STATE_DIR, f"{server_key}.{suffix}")
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(state, f)
+    os.replace(f"{path}.tmp", path)
+
+def commit_watch_state(sync_id):
+    """Promote the state a sync left pending once its output has been written; pending state
+    from any other sync is left alone, so a late commit can't skip changes it never saw"""
+    committed = []
+    for server_key in PLEX_SERVERS:
+        path = os.path.join(STATE_DIR, f"{server_key}.pending.json")
+        try:
+            with open(path) as f:
+                pending = json.load(f)
+        except (FileNotFoundError, ValueError):
+            continue
+        if pending.get('sync_id') != sync_id:
+            continue
+        save_watch_state(server_key, pending['state'])
+        os.remove(path)
+        committed.append(server_key)
+    print(f"[INCREMENTAL] Committed sync {sync_id}: {', '.join(committed) or 'nothing pending'}", file=sys.stderr)
+    return committed
+
+def build_watch_data(viewed_at, title, username):
+    """Watch fields for a user's most recent view"""
+    days_since = (datetime.now() - viewed_at.replace(tzinfo=None)).days
+    print(f"[WATCH] {username}: {days_since} days ago - {title}", file=sys.stderr)
+    return {
+        'days_since_last_watch': days_since,
+        'last_watched_date': viewed_at.isoformat(),
+        'last_watched_title': title
+    }
+
+def sweep_history(plex_server, account_ids, mindate, page_size=HISTORY_PAGE_SIZE):
+    """Latest view per account from one newest-first pass over the server's history.
+    Stops as soon as every account is covered or the history is older than mindate."""
+    remaining = set(account_ids)
+    latest = {}
+    start = 0
+    pages = 0
+    
+    while remaining:
+        container = plex_server.query(
+            '/status/sessions/history/all',
+            headers={'X-Plex-Container-Start': str(start), 'X-Plex-Container-Size': str(page_size)},
+            params={'sort': 'viewedAt:desc', 'viewedAt>=': int(mindate)}
+        )
+        entries = list(container)
+        pages += 1
+        
+        for entry in entries:
+            viewed_at = int(entry.get('viewedAt') or 0)
+            if viewed_at < mindate:
+                # Past the window (in case the server ignored the viewedAt filter)
+                remaining.clear()
+                break
+            account_id = int(entry.get('accountID') or 0)
+            if account_id in remaining:
+                remaining.discard(account_id)
+                latest[account_id] = {
+                    'viewed_at': datetime.fromtimestamp(viewed_at),
+                    'title': entry.get('title', 'Unknown')
+                }
+        
+        if len(entries) < page_size:
+            break
+        start += page_size
+    
+    print(f"[SWEEP] {pages} history page(s): found {len(latest)}/{len(account_ids)} accounts", file=sys.stderr)
+    return latest
+
+class RateLimiter:
+    """Spaces out calls shared by several threads to at most `rate` per second"""
+    
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_at = 0.0
+    
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+def fetch_last_watched(plex_server, users, concurrency=FETCH_CONCURRENCY, rate=FETCH_RATE_PER_SECOND):
+    """Per-account latest views for users, fetched by a bounded thread pool.
+    Results come back in the same order as users."""
+    if not users:
+        return []
+    limiter = RateLimiter(rate)
+    completed = [0]
+    progress_lock = threading.Lock()
+    
+    def fetch(user):
+        limiter.wait()
+        watch_data = get_last_watched_for_account(plex_server, user['account_id'], user['username'])
+        with progress_lock:
+            completed[0] += 1
+            if completed[0] % 20 == 0:
+                print(f"[PROGRESS] Queried {completed[0]}/{len(users)} accounts", file=sys.stderr)
+        return watch_data
+    
+    print(f"[FETCH] Querying {len(users)} accounts ({concurrency} at a time, max {rate}/s)", file=sys.stderr)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return list(executor.map(fetch, users))
+
 def get_last_watched_for_account(plex_server, account_id, username):
     """Get last watched date for a specific account ID"""
     try:
@@ -81,32 +339,103 @@ def get_last_watched_for_account(plex_server, account_id, username):
             viewed_at = getattr(latest_item, 'viewedAt', None) or getattr(latest_item, 'lastViewedAt', None)
             
             if viewed_at:
-                days_since = (datetime.now() - viewed_at.replace(tzinfo=None)).days
-                title = getattr(latest_item, 'title', 'Unknown')
-                
-                print(f"[WATCH] {username}: {days_since} days ago - {title}", file=sys.stderr)
-                return {
-                    'days_since_last_watch': days_since,
-                    'last_watched_date': viewed_at.isoformat(),
-                    'last_watched_title': title
-                }
+                return build_watch_data(viewed_at, getattr(latest_item, 'title', 'Unknown'), username)
         
         print(f"[NO_WATCH] {username}: No watch history found", file=sys.stderr)
-        return {
-            'days_since_last_watch': None,
-            'last_watched_date': None,
-            'last_watched_title': None
-        }
+        return dict(NO_WATCH_DATA)
         
     except Exception as e:
         print(f"[ERROR] Failed to get watch history for {username} (ID: {account_id}): {e}", file=sys.stderr)
-        return {
-            'days_since_last_watch': None,
-            'last_watched_date': None,
-            'last_watched_title': None
-        }
+        return dict(NO_WATCH_DATA)
 
-def process_server(server_key, server_config):
+def process_server_incremental(server_key, server_config, sweep_days, full=False,
+                               concurrency=FETCH_CONCURRENCY, rate=FETCH_RATE_PER_SECOND,
+                               request_timeout=REQUEST_TIMEOUT, sync_id=None):
+    """Sync only what changed since the last run: history newer than the saved
+    high-water mark, emitting just the accounts whose last watch moved (plus new accounts).
+    The new state is left pending under sync_id until commit_watch_state confirms the output was written."""
+    results = []
+    
+    users = get_users_with_emails_and_ids(server_config)
+    if not users:
+        return results
+    
+    try:
+        plex = PlexServer(server_config['url'], server_config['token'], timeout=request_timeout)
+    except Exception as e:
+        print(f"[ERROR] Failed to connect to {server_config['name']}: {e}", file=sys.stderr)
+        return results
+    
+    state = None if full else load_watch_state(server_key)
+    if state is None:
+        state = {'high_water': 0, 'accounts': {}}
+        mindate = time.time() - sweep_days * 86400
+        print(f"[INCREMENTAL] {server_config['name']}: no saved state, sweeping the last {sweep_days} days", file=sys.stderr)
+    else:
+        mindate = state['high_water'] + 1
+        print(f"[INCREMENTAL] {server_config['name']}: fetching history after {datetime.fromtimestamp(state['high_water']).isoformat()}", file=sys.stderr)
+    
+    # Without the sweep there is no delta; leave the state as it was so the next run retries
+    try:
+        latest_views = sweep_history(plex, [user['account_id'] for user in users], mindate)
+    except Exception as e:
+        print(f"[ERROR] History sweep failed on {server_config['name']}, skipping it this run: {e}", file=sys.stderr)
+        return results
+    # The high-water mark follows polled history only; webhook times aren't history positions
+    newest = max((int(view['viewed_at'].timestamp()) for view in latest_views.values()), default=0)
+    
+    # Webhook activity newer than the polled history
+    for account_id, view in webhook_views(server_key).items():
+        current = latest_views.get(account_id)
+        if current is None or view['viewed_at'] > current['viewed_at']:
+            latest_views[account_id] = view
+    
+    # New accounts with nothing in the window may still have older history
+    accounts = state['accounts']
+    unseen = [user for user in users
+              if str(user['account_id']) not in accounts and user['account_id'] not in latest_views]
+    fallback = dict(zip([user['account_id'] for user in unseen], fetch_last_watched(plex, unseen, concurrency, rate)))
+    
+    for user in users:
+        account_key = str(user['account_id'])
+        view = latest_views.get(user['account_id'])
+        saved = accounts.get(account_key)
+        
+        if view and (saved is None or view['viewed_at'].timestamp() > saved['viewed_at']):
+            accounts[account_key] = {'viewed_at': int(view['viewed_at'].timestamp()), 'title': view['title']}
+            watch_data = build_watch_data(view['viewed_at'], view['title'], user['username'])
+        elif saved is None:
+            watch_data = fallback[user['account_id']]
+            viewed_at = watch_data['last_watched_date']
+            accounts[account_key] = {
+                'viewed_at': int(datetime.fromisoformat(viewed_at).timestamp()) if viewed_at else 0,
+                'title': watch_data['last_watched_title']
+            }
+        else:
+            continue
+        
+        results.append({
+            'email': user['email'],
+            'username': user['username'],
+            'server': server_config['name'],
+            'days_since_last_watch': watch_data['days_since_last_watch'],
+            'last_watched_date': watch_data['last_watched_date'],
+            'last_watched_title': watch_data['last_watched_title'],
+            'plex_account_id': user['account_id'],
+            'sync_timestamp': datetime.now().isoformat()
+        })
+    
+    state['high_water'] = max(state['high_water'], newest)
+    # Accounts that left the server drop out of the state with it
+    current = {str(user['account_id']) for user in users}
+    state['accounts'] = {account_key: saved for account_key, saved in accounts.items() if account_key in current}
+    save_watch_state(server_key, {'sync_id': sync_id, 'state': state}, 'pending.json')
+    
+    print(f"[INCREMENTAL] {server_config['name']}: {len(results)} changed of {len(users)} accounts", file=sys.stderr)
+    return results
+
+def process_server(server_key, server_config, sweep_days=None, concurrency=FETCH_CONCURRENCY,
+                   rate=FETCH_RATE_PER_SECOND, request_timeout=REQUEST_TIMEOUT):
     """Process one server and return email + watch data"""
     results = []
     
@@ -115,23 +444,47 @@ def process_server(server_key, server_config):
     if not users:
         return results
     
-    # Connect to Plex server
+    # Connect to Plex server (the timeout applies to every request made over it)
     try:
-        plex = PlexServer(server_config['url'], server_config['token'], timeout=30)
+        plex = PlexServer(server_config['url'], server_config['token'], timeout=request_timeout)
     except Exception as e:
         print(f"[ERROR] Failed to connect to {server_config['name']}: {e}", file=sys.stderr)
         return results
     
+    # One pass over the server's history instead of one request per user
+    latest_views = None
+    if sweep_days:
+        mindate = time.time() - sweep_days * 86400
+        try:
+            latest_views = sweep_history(plex, [user['account_id'] for user in users], mindate)
+        except Exception as e:
+            print(f"[ERROR] History sweep failed on {server_config['name']}, querying per account: {e}", file=sys.stderr)
+    
+    # Per-account queries for everyone the sweep didn't cover (everyone without a sweep)
+    pending = [user for user in users if latest_views is None or user['account_id'] not in latest_views]
+    if latest_views is not None and pending:
+        print(f"[SWEEP] {len(pending)} accounts have no history in the last {sweep_days} days, querying them directly", file=sys.stderr)
+    per_account = dict(zip([user['account_id'] for user in pending], fetch_last_watched(plex, pending, concurrency, rate)))
+    recent_webhooks = webhook_views(server_key)
+    
     # Process each user
-    for i, user in enumerate(users, 1):
+    for user in users:
         email = user['email']
         username = user['username']
         account_id = user['account_id']
         
-        print(f"[PROCESSING] {i}/{len(users)}: {username} ({email}) -> Account ID: {account_id}", file=sys.stderr)
-        
         # Get watch history using the account ID
-        watch_data = get_last_watched_for_account(plex, account_id, username)
+        if account_id in per_account:
+            watch_data = per_account[account_id]
+        else:
+            view = latest_views[account_id]
+            watch_data = build_watch_data(view['viewed_at'], view['title'], username)
+        
+        # Webhook activity newer than the polled history
+        webhook = recent_webhooks.get(account_id)
+        last_date = watch_data['last_watched_date']
+        if webhook and (last_date is None or webhook['viewed_at'] > datetime.fromisoformat(last_date).replace(tzinfo=None)):
+            watch_data = build_watch_data(webhook['viewed_at'], webhook['title'], username)
         
         results.append({
             'email': email,
@@ -143,40 +496,753 @@ def process_server(server_key, server_config):
             'plex_account_id': account_id,
             'sync_timestamp': datetime.now().isoformat()
         })
-        
-        # Small delay to avoid rate limiting
-        if i % 20 == 0:
-            print(f"[PROGRESS] Processed {i}/{len(users)} users", file=sys.stderr)
     
     return results
 
+def load_users_export(path):
+    """Rows of the app's users table (id, name, plex_email, plex_username, tags); '-' reads stdin"""
+    if path == '-':
+        return json.load(sys.stdin)
+    with open(path) as f:
+        return json.load(f)
+
+def parse_tags(tags):
+    if isinstance(tags, list):
+        return tags
+    try:
+        return json.loads(tags) if tags else []
+    except ValueError:
+        return []
+
+def allowed_servers(tags):
+    """Server names whose activity counts for a user: their tagged servers, or any if untagged"""
+    tagged = {server_config['name'] for server_config in PLEX_SERVERS.values() if server_config['name'] in tags}
+    return tagged or None
+
+def state_record(server_config, saved, record):
+    """A saved latest view turned back into an output record (for servers that didn't change)"""
+    viewed_at = datetime.fromtimestamp(saved['viewed_at']) if saved['viewed_at'] else None
+    return dict(
+        record,
+        server=server_config['name'],
+        days_since_last_watch=(datetime.now() - viewed_at).days if viewed_at else None,
+        last_watched_date=viewed_at.isoformat() if viewed_at else None,
+        last_watched_title=saved['title']
+    )
+
+def build_user_lookup(db_users):
+    """Hash indexes of the users export on plex_email and plex_username (lowercased)"""
+    by_email = {}
+    by_username = {}
+    for user in db_users:
+        if user.get('plex_email'):
+            by_email.setdefault(user['plex_email'].lower(), user)
+        if user.get('plex_username'):
+            by_username.setdefault(user['plex_username'].lower(), user)
+    return by_email, by_username
+
+def match_user(lookup, email, username):
+    by_email, by_username = lookup
+    return by_email.get((email or '').lower()) or by_username.get((username or '').lower())
+
+def merge_user_records(records, db_users, incremental=False):
+    """One row per app user: records joined to users by plex_email/plex_username (hash lookups),
+    kept only for servers the user's Plex 1/Plex 2 tags allow, most recent watch wins.
+    In incremental mode, servers without a new record compete with their saved state."""
+    lookup = build_user_lookup(db_users)
+    
+    candidates = {}
+    for record in records:
+        user = match_user(lookup, record['email'], record['username'])
+        if user is None:
+            continue
+        allowed = allowed_servers(parse_tags(user.get('tags')))
+        if allowed is None or record['server'] in allowed:
+            candidates.setdefault(user['id'], (user, allowed, []))[2].append(record)
+    
+    if incremental:
+        states = {server_config['name']: (server_config, load_watch_state(server_key))
+                  for server_key, server_config in PLEX_SERVERS.items()}
+        for user, allowed, user_records in candidates.values():
+            changed = {record['server'] for record in user_records}
+            template = user_records[0]
+            for server_name, (server_config, state) in states.items():
+                if server_name in changed or (allowed is not None and server_name not in allowed) or not state:
+                    continue
+                saved = state['accounts'].get(str(template['plex_account_id']))
+                if saved:
+                    user_records.append(state_record(server_config, saved, template))
+    
+    merged = []
+    for user, allowed, user_records in candidates.values():
+        best = max(user_records, key=lambda record: record['last_watched_date'] or '')
+        merged.append(dict(best, user_id=user['id'], user_name=user.get('name')))
+    
+    print(f"[MERGE] {len(records)} records -> {len(merged)} users", file=sys.stderr)
+    return merged
+
+def history_cache_path(server_key):
+    return os.path.join(STATE_DIR, f"{server_key}.history.npy")
+
+def load_view_history(server_key):
+    try:
+        return np.load(history_cache_path(server_key))
+    except (FileNotFoundError, ValueError):
+        return np.empty(0, dtype=VIEW_DTYPE)
+
+def save_view_history(server_key, views):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = history_cache_path(server_key)
+    with open(f"{path}.tmp", 'wb') as f:
+        np.save(f, views)
+    os.replace(f"{path}.tmp", path)
+
+def trailing_int(value):
+    """Rating key from '123' or '/library/metadata/123' (0 if missing)"""
+    try:
+        return int(str(value).rstrip('/').rsplit('/', 1)[-1])
+    except (TypeError, ValueError):
+        return 0
+
+def pull_view_history(plex_server, after, page_size=HISTORY_PAGE_SIZE):
+    """Columnar history entries viewed after `after` (epoch seconds), paged newest first"""
+    columns = {name: [] for name in VIEW_DTYPE.names if name != 'duration'}
+    start = 0
+    
+    while True:
+        container = plex_server.query(
+            '/status/sessions/history/all',
+            headers={'X-Plex-Container-Start': str(start), 'X-Plex-Container-Size': str(page_size)},
+            params={'sort': 'viewedAt:desc', 'viewedAt>': int(after)}
+        )
+        entries = list(container)
+        for entry in entries:
+            viewed_at = int(entry.get('viewedAt') or 0)
+            if viewed_at <= after:
+                # Older than the cache (in case the server ignored the viewedAt filter)
+                entries = []
+                break
+            rating_key = trailing_int(entry.get('ratingKey') or entry.get('key'))
+            columns['account'].append(int(entry.get('accountID') or 0))
+            columns['viewed_at'].append(viewed_at)
+            columns['rating_key'].append(rating_key)
+            columns['title_key'].append(trailing_int(entry.get('grandparentKey')) or rating_key)
+            columns['section'].append(int(entry.get('librarySectionID') or 0))
+        
+        if len(entries) < page_size:
+            break
+        start += page_size
+    
+    views = np.zeros(len(columns['account']), dtype=VIEW_DTYPE)
+    for name, values in columns.items():
+        views[name] = values
+    return views
+
+def fetch_durations(plex_server, rating_keys, batch_size=METADATA_BATCH_SIZE):
+    """Durations in seconds for rating keys, from batched /library/metadata/<k1,k2,...> lookups"""
+    durations = {}
+    for start in range(0, len(rating_keys), batch_size):
+        batch = rating_keys[start:start + batch_size]
+        try:
+            container = plex_server.query(f"/library/metadata/{','.join(str(key) for key in batch)}")
+        except Exception as e:
+            # Deleted items (the whole batch missing) just count as zero length
+            print(f"[WARN] Duration lookup failed for {len(batch)} items: {e}", file=sys.stderr)
+            continue
+        for item in container:
+            durations[int(item.get('ratingKey') or 0)] = int(item.get('duration') or 0) // 1000
+    return durations
+
+def update_view_history(server_key, plex_server, window_days, full=False):
+    """Cached columnar history for the last window_days, topped up with entries newer than the cache"""
+    now = int(time.time())
+    cutoff = now - window_days * 86400
+    views = np.empty(0, dtype=VIEW_DTYPE) if full else load_view_history(server_key)
+    views = views[views['viewed_at'] >= cutoff]
+    after = max(int(views['viewed_at'].max()) if len(views) else 0, cutoff - 1)
+    
+    new_views = pull_view_history(plex_server, after)
+    if len(new_views):
+        # Durations only for items the cache hasn't seen (same item, same length)
+        known_keys, known_index = np.unique(views['rating_key'], return_index=True)
+        known = dict(zip(known_keys.tolist(), views['duration'][known_index].tolist()))
+        missing = sorted(set(np.unique(new_views['rating_key']).tolist()) - known.keys())
+        known.update(fetch_durations(plex_server, missing))
+        new_views['duration'] = [known.get(key, 0) for key in new_views['rating_key'].tolist()]
+        views = np.concatenate([views, new_views])
+    
+    views = views[np.argsort(views['viewed_at'], kind='stable')]
+    save_view_history(server_key, views)
+    print(f"[VIEWS] {server_key}: {len(new_views)} new history entries, {len(views)} cached", file=sys.stderr)
+    return views
+
+def run_starts(*keys):
+    """Mask of the rows where any sorted key changes (True for the first row; empty stays empty)"""
+    first = np.ones(len(keys[0]), dtype=bool)
+    first[1:] = np.any([key[1:] != key[:-1] for key in keys], axis=0)
+    return first
+
+def distinct_counts(groups, values, n):
+    """Number of distinct values per group (groups are 0..n-1)"""
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    return np.bincount(groups[run_starts(groups, values)], minlength=n)
+
+def top_values(groups, values, k):
+    """Up to k most frequent values per group, as (group, value) arrays ordered by group then count"""
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    starts = np.flatnonzero(run_starts(groups, values))
+    run_groups, run_values = groups[starts], values[starts]
+    run_counts = np.diff(np.r_[starts, len(groups)])
+    
+    order = np.lexsort((-run_counts, run_groups))
+    run_groups, run_values = run_groups[order], run_values[order]
+    group_starts = np.flatnonzero(run_starts(run_groups))
+    rank = np.arange(len(run_groups)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(run_groups)]))
+    keep = rank < k
+    return run_groups[keep], run_values[keep]
+
+def peak_concurrency(groups, starts, ends, n):
+    """Most overlapping [start, end) intervals per group, from one sorted sweep over all groups"""
+    peaks = np.zeros(n, dtype=np.int64)
+    if not len(groups):
+        return peaks
+    times = np.r_[starts, ends]
+    deltas = np.r_[np.ones(len(starts), dtype=np.int64), -np.ones(len(ends), dtype=np.int64)]
+    event_groups = np.r_[groups, groups]
+    # Ends sort before starts at the same instant, so back-to-back plays don't overlap
+    order = np.lexsort((deltas, times, event_groups))
+    event_groups, levels = event_groups[order], np.cumsum(deltas[order])
+    # Every group's intervals all close, so the running level is back to 0 at each group boundary
+    first = np.flatnonzero(np.r_[True, event_groups[1:] != event_groups[:-1]])
+    peaks[event_groups[first]] = np.maximum.reduceat(levels, first)
+    return peaks
+
+def compute_viewing_stats(views, account_ids, now=None, windows=VIEWING_WINDOWS):
+    """Per-account plays, hours, distinct titles and active days per window, favourite
+    sections and peak concurrent streams, as arrays aligned with account_ids"""
+    now = int(now if now is not None else time.time())
+    accounts = np.asarray(sorted(account_ids), dtype=np.int64)
+    n = len(accounts)
+    
+    position = np.searchsorted(accounts, views['account'])
+    matched = position < n
+    matched[matched] = accounts[position[matched]] == views['account'][matched]
+    views, groups = views[matched], position[matched]
+    
+    stats = {'account_id': accounts}
+    for window in windows:
+        inside = views['viewed_at'] >= now - window * 86400
+        window_groups = groups[inside]
+        window_views = views[inside]
+        stats[f"plays_{window}d"] = np.bincount(window_groups, minlength=n)
+        stats[f"hours_{window}d"] = np.round(np.bincount(window_groups, weights=window_views['duration'], minlength=n) / 3600, 1)
+        stats[f"titles_{window}d"] = distinct_counts(window_groups, window_views['title_key'], n)
+        stats[f"active_days_{window}d"] = distinct_counts(window_groups, window_views['viewed_at'] // 86400, n)
+    
+    stats['favourite_sections'] = top_values(groups, views['section'].astype(np.int64), FAVOURITE_LIBRARIES)
+    # History only records when a play ended; it started roughly one duration earlier
+    stats['peak_streams'] = peak_concurrency(groups, views['viewed_at'] - views['duration'], views['viewed_at'], n)
+    return stats
+
+def get_section_titles(plex_server):
+    try:
+        return {int(section.get('key')): section.get('title') for section in plex_server.query('/library/sections')}
+    except Exception as e:
+        print(f"[WARN] Could not read library sections: {e}", file=sys.stderr)
+        return {}
+
+def viewing_stats_table(server_key, server_config, full=False, request_timeout=REQUEST_TIMEOUT, lookup=None):
+    """Columns + rows of per-user viewing stats for one server"""
+    users = get_users_with_emails_and_ids(server_config)
+    if not users:
+        return []
+    
+    plex = None
+    try:
+        plex = PlexServer(server_config['url'], server_config['token'], timeout=request_timeout)
+        views = update_view_history(server_key, plex, max(VIEWING_WINDOWS), full)
+    except Exception as e:
+        print(f"[WARN] Could not refresh history on {server_config['name']}, using the cache: {e}", file=sys.stderr)
+        views = load_view_history(server_key)
+    stats = compute_viewing_stats(views, [user['account_id'] for user in users])
+    
+    section_titles = {}
+    if plex is not None:
+        try:
+            section_titles = get_section_titles(plex)
+        except Exception as e:
+            print(f"[WARN] Could not read library names on {server_config['name']}: {e}", file=sys.stderr)
+    
+    favourite_groups, favourite_sections = stats.pop('favourite_sections')
+    favourites = [[] for _ in stats['account_id']]
+    for group, section in zip(favourite_groups.tolist(), favourite_sections.tolist()):
+        favourites[group].append(section_titles.get(section, str(section)))
+    
+    columns = list(stats)
+    values = [stats[column].tolist() for column in columns]
+    by_account = {row[0]: (list(row), favourite) for row, favourite in zip(zip(*values), favourites)}
+    
+    rows = []
+    for user in users:
+        row, favourite = by_account[user['account_id']]
+        matched = match_user(lookup, user['email'], user['username']) if lookup else None
+        rows.append([matched['id'] if matched else None, user['email'], user['username'], server_config['name']]
+                    + row + [favourite])
+    return rows
+
+def compute_churn_scores(views, account_ids, last_watched=None, now=None):
+    """Churn risk per account from the cached history: recency, plays and play length over the
+    last 30 days against the 30 before, and library breadth. last_watched (epoch seconds, 0 if
+    unknown) covers accounts whose last watch is older than the cache; arrays align with account_ids."""
+    now = int(now if now is not None else time.time())
+    accounts = np.asarray(account_ids, dtype=np.int64)
+    order = np.argsort(accounts, kind='stable')
+    sorted_accounts = accounts[order]
+    n = len(accounts)
+    
+    position = np.searchsorted(sorted_accounts, views['account'])
+    matched = position < n
+    matched[matched] = sorted_accounts[position[matched]] == views['account'][matched]
+    views, groups = views[matched], order[position[matched]]
+    
+    latest = np.zeros(n, dtype=np.int64)
+    np.maximum.at(latest, groups, views['viewed_at'])
+    if last_watched is not None:
+        latest = np.maximum(latest, np.asarray(last_watched, dtype=np.int64))
+    days_since = np.where(latest > 0, (now - latest) / 86400, CHURN_RECENCY_CAP_DAYS)
+    
+    age = now - views['viewed_at']
+    recent = age < CHURN_TREND_DAYS * 86400
+    prior = ~recent & (age < 2 * CHURN_TREND_DAYS * 86400)
+    plays_recent = np.bincount(groups[recent], minlength=n)
+    plays_prior = np.bincount(groups[prior], minlength=n)
+    length_recent = np.bincount(groups[recent], weights=views['duration'][recent], minlength=n) / np.maximum(plays_recent, 1)
+    length_prior = np.bincount(groups[prior], weights=views['duration'][prior], minlength=n) / np.maximum(plays_prior, 1)
+    
+    # log2 ratios: 0 = steady, negative = watching less / shorter than the month before
+    frequency_trend = np.clip(np.log2((plays_recent + 1) / (plays_prior + 1)), -CHURN_TREND_CLIP, CHURN_TREND_CLIP)
+    session_trend = np.where((plays_recent > 0) & (plays_prior > 0),
+                             np.log2((length_recent + 60) / (length_prior + 60)), 0.0)
+    session_trend = np.clip(session_trend, -CHURN_TREND_CLIP, CHURN_TREND_CLIP)
+    breadth = distinct_counts(groups, views['section'].astype(np.int64), n)
+    
+    z = (CHURN_WEIGHTS['bias']
+         + CHURN_WEIGHTS['recency'] * np.minimum(days_since, CHURN_RECENCY_CAP_DAYS)
+         + CHURN_WEIGHTS['frequency_trend'] * frequency_trend
+         + CHURN_WEIGHTS['session_trend'] * session_trend
+         + CHURN_WEIGHTS['breadth'] * breadth)
+    risk = 1 / (1 + np.exp(-z))
+    
+    return {
+        'account_id': accounts,
+        'days_since_last_watch': np.floor(days_since).astype(np.int64),
+        'plays_30d': plays_recent,
+        'plays_prior_30d': plays_prior,
+        'frequency_trend': np.round(frequency_trend, 2),
+        'session_trend': np.round(session_trend, 2),
+        'libraries_90d': breadth,
+        'churn_risk': np.round(risk, 3)
+    }
+
+def churn_band(risk):
+    return 'high' if risk >= CHURN_BANDS[1] else 'medium' if risk >= CHURN_BANDS[0] else 'low'
+
+def attach_churn_scores(server_key, server_config, records, request_timeout=REQUEST_TIMEOUT):
+    """Add churn_risk/churn_band to a server's sync records (one top-up request for the history cache)"""
+    if not records:
+        return
+    try:
+        plex = PlexServer(server_config['url'], server_config['token'], timeout=request_timeout)
+        views = update_view_history(server_key, plex, max(VIEWING_WINDOWS))
+    except Exception as e:
+        print(f"[WARN] Could not refresh history for churn scores on {server_config['name']}, using the cache: {e}", file=sys.stderr)
+        views = load_view_history(server_key)
+    
+    last_watched = [int(datetime.fromisoformat(record['last_watched_date']).timestamp()) if record['last_watched_date'] else 0
+                    for record in records]
+    scores = compute_churn_scores(views, [record['plex_account_id'] for record in records], last_watched)
+    for record, risk in zip(records, scores['churn_risk'].tolist()):
+        record['churn_risk'] = risk
+        record['churn_band'] = churn_band(risk)
+
+def churn_report_table(server_key, server_config, full=False, request_timeout=REQUEST_TIMEOUT, lookup=None):
+    """Columns + rows of churn features and risk for one server's users"""
+    users = get_users_with_emails_and_ids(server_config)
+    if not users:
+        return []
+    
+    try:
+        plex = PlexServer(server_config['url'], server_config['token'], timeout=request_timeout)
+        views = update_view_history(server_key, plex, max(VIEWING_WINDOWS), full)
+    except Exception as e:
+        print(f"[WARN] Could not refresh history on {server_config['name']}, using the cache: {e}", file=sys.stderr)
+        views = load_view_history(server_key)
+    
+    # Saved latest views reach further back than the 90-day cache
+    saved = (load_watch_state(server_key) or {}).get('accounts', {})
+    last_watched = [(saved.get(str(user['account_id'])) or {}).get('viewed_at') or 0 for user in users]
+    scores = compute_churn_scores(views, [user['account_id'] for user in users], last_watched)
+    
+    columns = list(scores)
+    values = [scores[column].tolist() for column in columns]
+    rows = []
+    for user, row in zip(users, zip(*values)):
+        matched = match_user(lookup, user['email'], user['username']) if lookup else None
+        rows.append([matched['id'] if matched else None, user['email'], user['username'], server_config['name']]
+                    + list(row) + [churn_band(row[-1])])
+    return rows
+
+_machine_ids = {}
+_machine_ids_checked = [0.0]
+
+def server_key_for_uuid(machine_id):
+    """PLEX_SERVERS key of the server with this machineIdentifier (webhook Server.uuid); the servers
+    share a friendly name, so the uuid is the only reliable way to tell them apart"""
+    if machine_id not in _machine_ids and time.time() - _machine_ids_checked[0] > WEBHOOK_IDENTITY_REFRESH:
+        _machine_ids_checked[0] = time.time()
+        for server_key, server_config in PLEX_SERVERS.items():
+            try:
+                response = requests.get(f"{server_config['url']}/identity",
+                                        headers={'X-Plex-Token': server_config['token']}, timeout=10)
+                response.raise_for_status()
+                _machine_ids[ET.fromstring(response.content).get('machineIdentifier')] = server_key
+            except Exception as e:
+                print(f"[ERROR] Failed to read identity of {server_config['name']}: {e}", file=sys.stderr)
+    return _machine_ids.get(machine_id)
+
+def report_rows(table, server_keys, full, request_timeout, lookup):
+    """Rows of a per-server report table for every server; a server that fails is reported in errors
+    ({server, error}) instead of aborting the whole report"""
+    rows, errors = [], []
+    for server_key in server_keys:
+        server_config = PLEX_SERVERS[server_key]
+        try:
+            rows.extend(table(server_key, server_config, full, request_timeout, lookup))
+        except Exception as e:
+            print(f"[ERROR] {server_config['name']}: {e}", file=sys.stderr)
+            errors.append({'server': server_config['name'], 'error': str(e)})
+    return rows, errors
+
+def load_webhook_index(path=WEBHOOK_INDEX_PATH):
+    """Persisted webhook activity: {server key: {account id: latest event}}"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def webhook_views(server_key):
+    """Webhook activity for a server in the sweep's shape (account_id -> view)"""
+    activity = load_webhook_index().get(server_key, {})
+    return {int(account_key): {'viewed_at': datetime.fromtimestamp(entry['viewed_at']), 'title': entry['title']}
+            for account_key, entry in activity.items()}
+
+def parse_webhook_payload(content_type, body):
+    """The JSON 'payload' part of a Plex webhook (multipart/form-data); plain JSON bodies are accepted too"""
+    if content_type.startswith('application/json'):
+        return json.loads(body)
+    message = BytesParser(policy=email.policy.HTTP).parsebytes(
+        b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+    if not message.is_multipart():
+        raise ValueError('expected multipart/form-data')
+    for part in message.iter_parts():
+        if part.get_param('name', header='content-disposition') == 'payload':
+            return json.loads(part.get_payload(decode=True))
+    raise ValueError('no payload part')
+
+def recorded_timestamp(value):
+    """Receipt time of a replayed recording, clamped to now so a replay can't date activity in the future"""
+    try:
+        recorded = int(float(value))
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid X-Webhook-Timestamp {value!r}")
+    if recorded <= 0:
+        raise ValueError(f"invalid X-Webhook-Timestamp {value!r}")
+    return min(recorded, int(time.time()))
+
+class WebhookIndex:
+    """Latest play activity per server and account from Plex webhooks, flushed to disk in the background"""
+    
+    def __init__(self, path=WEBHOOK_INDEX_PATH, record_path=None):
+        self.path = path
+        self.record_path = record_path
+        self.lock = threading.Lock()
+        self.servers = load_webhook_index(path)
+        self.dirty = False
+    
+    def apply(self, payload, received_at=None):
+        """Record a media event at received_at (receipt time unless replaying a recording);
+        returns the stored entry, or None if ignored or older than what's known"""
+        received_at = int(time.time()) if received_at is None else received_at
+        if self.record_path:
+            with self.lock, open(self.record_path, 'a') as f:
+                f.write(json.dumps({'received_at': received_at, 'payload': payload}) + '\n')
+        
+        event = payload.get('event')
+        account = payload.get('Account') or {}
+        server = payload.get('Server') or {}
+        if event not in WEBHOOK_EVENTS or account.get('id') is None or not server.get('uuid'):
+            return None
+        server_key = server_key_for_uuid(server['uuid'])
+        if server_key is None:
+            print(f"[WEBHOOK] Ignoring {event} from unknown server {server.get('title')} ({server['uuid']})", file=sys.stderr)
+            return None
+        
+        metadata = payload.get('Metadata') or {}
+        entry = {
+            'account_id': int(account['id']),
+            'username': account.get('title'),
+            'server_key': server_key,
+            'server': PLEX_SERVERS[server_key]['name'],
+            'viewed_at': received_at,
+            'title': metadata.get('title', 'Unknown'),
+            'event': event,
+            'player': (payload.get('Player') or {}).get('title')
+        }
+        with self.lock:
+            accounts = self.servers.setdefault(server_key, {})
+            current = accounts.get(str(entry['account_id']))
+            if current and current['viewed_at'] > received_at:
+                return None
+            accounts[str(entry['account_id'])] = entry
+            self.dirty = True
+        print(f"[WEBHOOK] {event} {entry['username']} on {entry['server']}: {entry['title']}", file=sys.stderr)
+        return entry
+    
+    def snapshot(self, server_key=None):
+        with self.lock:
+            if server_key:
+                return {server_key: dict(self.servers.get(server_key, {}))}
+            return {name: dict(accounts) for name, accounts in self.servers.items()}
+    
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = json.dumps(self.servers)
+            self.dirty = False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f"{self.path}.tmp", 'w') as f:
+            f.write(data)
+        os.replace(f"{self.path}.tmp", self.path)
+    
+    def run_flusher(self, interval=WEBHOOK_FLUSH_INTERVAL):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[ERROR] Failed to save webhook index: {e}", file=sys.stderr)
+
+def make_webhook_handler(index):
+    """HTTP handler: POST /webhook takes Plex webhooks (timed on receipt), POST /replay takes
+    recordings with their X-Webhook-Timestamp, GET /state returns the activity index"""
+    
+    class WebhookRequestHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            path = urlparse(self.path).path
+            if path not in ('/webhook', '/replay'):
+                self.send_error(404)
+                return
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            try:
+                payload = parse_webhook_payload(self.headers.get('Content-Type', ''), body)
+                received_at = recorded_timestamp(self.headers.get('X-Webhook-Timestamp')) if path == '/replay' else None
+            except ValueError as e:
+                self.send_json(400, {'error': f"Bad webhook payload: {e}"})
+                return
+            entry = index.apply(payload, received_at)
+            self.send_json(200, {'applied': entry is not None, 'entry': entry})
+        
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != '/state':
+                self.send_error(404)
+                return
+            self.send_json(200, index.snapshot(parse_qs(url.query).get('server', [None])[0]))
+        
+        def send_json(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    return WebhookRequestHandler
+
+def run_webhook_receiver(port, record_path=None):
+    """Serve the webhook receiver until interrupted, saving the index every few seconds"""
+    index = WebhookIndex(record_path=record_path)
+    server = ThreadingHTTPServer((WEBHOOK_HOST, port), make_webhook_handler(index))
+    threading.Thread(target=index.run_flusher, daemon=True).start()
+    print(f"[START] Plex webhook receiver on http://{WEBHOOK_HOST}:{port}/webhook", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        index.flush()
+
+def replay_webhooks(paths, url):
+    """POST recorded webhooks (receiver --webhook-record NDJSON, or JSON payload files) as multipart
+    to the receiver's /replay endpoint; payloads without a recorded time are timed on receipt"""
+    summary = {'sent': 0, 'applied': 0, 'failed': 0}
+    for path in paths:
+        with open(path) as f:
+            if path.endswith('.ndjson'):
+                recordings = [json.loads(line) for line in f if line.strip()]
+            else:
+                data = json.load(f)
+                recordings = data if isinstance(data, list) else [data]
+        
+        for recording in recordings:
+            payload = recording.get('payload', recording)
+            headers = {'X-Webhook-Timestamp': str(recording.get('received_at') or int(time.time()))}
+            try:
+                response = requests.post(url, files={'payload': (None, json.dumps(payload), 'application/json')},
+                                         headers=headers, timeout=REQUEST_TIMEOUT)
+                response.raise_for_status()
+                summary['sent'] += 1
+                summary['applied'] += int(response.json().get('applied', False))
+            except Exception as e:
+                summary['failed'] += 1
+                print(f"[ERROR] Replay of {payload.get('event')} failed: {e}", file=sys.stderr)
+    
+    print(f"[REPLAY] {summary['sent']} sent, {summary['applied']} applied, {summary['failed']} failed", file=sys.stderr)
+    return summary
+
 def main():
     parser = argparse.ArgumentParser(description='Plex Users API Last Watched Script')
     parser.add_argument('--servers', nargs='+', choices=['plex1', 'plex2'], default=['plex1', 'plex2'],
                        help='Which servers to check (default: plex1)')
     parser.add_argument('--format', choices=['json', 'simple'], default='json',
                        help='Output format')
+    parser.add_argument('--sweep', action='store_true',
+                       help='Read each server\'s history once (newest first) instead of querying every account')
+    parser.add_argument('--sweep-days', type=int, default=SWEEP_WINDOW_DAYS,
+                       help=f'How far back the history sweep looks (default: {SWEEP_WINDOW_DAYS})')
+    parser.add_argument('--concurrency', type=int, default=FETCH_CONCURRENCY,
+                       help=f'Parallel per-account history queries per server (default: {FETCH_CONCURRENCY})')
+    parser.add_argument('--rate', type=float, default=FETCH_RATE_PER_SECOND,
+                       help=f'Max per-account history queries per second per server (default: {FETCH_RATE_PER_SECOND})')
+    parser.add_argument('--request-timeout', type=int, default=REQUEST_TIMEOUT,
+                       help=f'Seconds before a single Plex request times out (default: {REQUEST_TIMEOUT})')
+    parser.add_argument('--refresh-users', action='store_true',
+                       help='Revalidate the cached plex.tv user directory even if it is still fresh')
+    parser.add_argument('--incremental', action='store_true',
+                       help='Only fetch history since the last run and only output accounts whose last watch changed')
+    parser.add_argument('--full', action='store_true',
+                       help='With --incremental or --viewing-stats, ignore saved state and rebuild it')
+    parser.add_argument('--users-file',
+                       help="Users table export (JSON: id, name, plex_email, plex_username, tags; '-' for stdin) "
+                            "to merge into one row per user")
+    parser.add_argument('--viewing-stats', action='store_true',
+                       help=f"Per-user plays, hours, titles and active days over {'/'.join(map(str, VIEWING_WINDOWS))} days, "
+                            "favourite libraries and peak streams, as a columns + rows table")
+    parser.add_argument('--churn-report', action='store_true',
+                       help='Churn risk per user (recency, play and length trends, library breadth) as a columns + rows table')
+    parser.add_argument('--churn', action='store_true',
+                       help='Add churn_risk/churn_band to the sync output (scored from the cached history)')
+    parser.add_argument('--webhook', action='store_true',
+                       help=f'Run the Plex webhook receiver (POST /webhook, GET /state) on {WEBHOOK_HOST}')
+    parser.add_argument('--webhook-port', type=int, default=WEBHOOK_PORT,
+                       help=f'Webhook receiver port (default: {WEBHOOK_PORT})')
+    parser.add_argument('--webhook-record', metavar='PATH',
+                       help='With --webhook, append every received payload to an NDJSON file for --replay')
+    parser.add_argument('--replay', nargs='+', metavar='FILE',
+                       help='POST recorded webhook payloads (NDJSON recordings or JSON files) to a receiver')
+    parser.add_argument('--webhook-url', default=f"http://127.0.0.1:{WEBHOOK_PORT}/replay",
+                       help='Receiver replay URL for --replay (POST /replay keeps the recorded times)')
+    parser.add_argument('--commit-state', metavar='SYNC_ID',
+                       help='Mark an --incremental sync as written (its sync_id), so the next run continues from it')
+    parser.add_argument('--sink', metavar='SINK',
+                       help='Also write plex_user_activity rows: mysql, sqlite:PATH or csv:DIR (one transaction)')
     
     args = parser.parse_args()
     
+    if args.webhook:
+        run_webhook_receiver(args.webhook_port, args.webhook_record)
+        return
+    
+    if args.replay:
+        print(json.dumps(replay_webhooks(args.replay, args.webhook_url)))
+        return
+    
+    if args.commit_state:
+        print(json.dumps({'committed': commit_watch_state(args.commit_state)}))
+        return
+    
     try:
         start_time = datetime.now()
         print(f"[START] Processing servers: {', '.join(args.servers)}", file=sys.stderr)
         
+        if args.refresh_users:
+            # Revalidated directories are memoized, so the servers below reuse them
+            for server_key in args.servers:
+                get_users_with_emails_and_ids(PLEX_SERVERS[server_key], refresh=True)
+        
+        db_users = load_users_export(args.users_file) if args.users_file else None
+        
+        if args.viewing_stats:
+            lookup = build_user_lookup(db_users) if db_users is not None else None
+            rows, errors = report_rows(viewing_stats_table, args.servers, args.full, args.request_timeout, lookup)
+            print(json.dumps({'columns': VIEWING_COLUMNS, 'rows': rows, 'errors': errors,
+                              'generated_at': datetime.now().isoformat()}, separators=(',', ':')))
+            print(f"[COMPLETE] Viewing stats for {len(rows)} users in {(datetime.now() - start_time).total_seconds():.2f} seconds", file=sys.stderr)
+            return
+        
+        if args.churn_report:
+            lookup = build_user_lookup(db_users) if db_users is not None else None
+            rows, errors = report_rows(churn_report_table, args.servers, args.full, args.request_timeout, lookup)
+            rows.sort(key=lambda row: row[CHURN_COLUMNS.index('churn_risk')], reverse=True)
+            print(json.dumps({'columns': CHURN_COLUMNS, 'rows': rows, 'errors': errors,
+                              'generated_at': datetime.now().isoformat()}, separators=(',', ':')))
+            print(f"[COMPLETE] Churn scores for {len(rows)} users in {(datetime.now() - start_time).total_seconds():.2f} seconds", file=sys.stderr)
+            return
+        
         all_results = []
+        sync_id = uuid.uuid4().hex if args.incremental else None
         
         for server_key in args.servers:
             if server_key in PLEX_SERVERS:
                 server_config = PLEX_SERVERS[server_key]
-                results = process_server(server_key, server_config)
+                fetch_options = {'concurrency': args.concurrency, 'rate': args.rate,
+                                 'request_timeout': args.request_timeout}
+                if args.incremental:
+                    results = process_server_incremental(server_key, server_config, args.sweep_days, args.full,
+                                                         sync_id=sync_id, **fetch_options)
+                else:
+                    results = process_server(server_key, server_config, args.sweep_days if args.sweep else None,
+                                             **fetch_options)
+                if args.churn:
+                    attach_churn_scores(server_key, server_config, results, args.request_timeout)
                 all_results.extend(results)
         
+        if db_users is not None:
+            all_results = merge_user_records(all_results, db_users, args.incremental)
+        
+        account_ids = directory_account_ids(args.servers)
+        if args.sink:
+            write_rows(args.sink, 'plex_user_activity', activity_rows(all_results), account_ids)
+            if sync_id:
+                commit_watch_state(sync_id)
+        
         # Output results
         if args.format == 'simple':
             # Simple format: email, days_since_last_watch
             for result in all_results:
                 days = result['days_since_last_watch']
                 print(f"{result['email']},{days if days is not None else 'NULL'}")
+        elif args.incremental:
+            # The delta plus what the caller needs to apply it: the current accounts (to drop the rest)
+            # and the sync_id to pass back to --commit-state once it's written
+            print(json.dumps({'sync_id': sync_id, 'records': all_results, 'account_ids': account_ids}, indent=2))
         else:
             # JSON format
             print(json.dumps(all_results, indent=2))
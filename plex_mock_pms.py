@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Mock Plex Media Server for testing plex_resource_monitor.py locally
+Serves synthetic resource, session, library, activity, account, bandwidth and history data
+"""
+
+import json
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+import xml.etree.ElementTree as ET
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+MOCK_HOST = '127.0.0.1'
+MOCK_PORT = 32499
+MOCK_TOKEN = 'mock-token'
+MOCK_MACHINE_ID = 'mock0000000000000000000000000000000000pms'
+MOCK_ACCOUNTS = {1: 'owner', 2: 'alice', 3: 'bob', 4: 'carol'}
+MOCK_DEVICES = {11: 'Living Room TV', 12: 'iPhone', 13: 'Chrome'}
+MOCK_SECTIONS = (('1', 'movie', 'Movies', 1200), ('2', 'show', 'TV Shows', 300))
+MOCK_ITEMS = 50                   # rating keys 1000.. used for sessions and history
+MOCK_SESSIONS = 3
+RESOURCE_ENTRIES = 10             # /statistics/resources entries per response (6 seconds apart)
+BANDWIDTH_STEP = 6                # seconds between /statistics/bandwidth entries
+HISTORY_STEP = 600                # seconds between /status/sessions/history/all entries
+HISTORY_SPAN = 7 * 86400
+
+def container(**attrib):
+    return ET.Element('MediaContainer', {key: str(value) for key, value in attrib.items()})
+
+def child(parent, tag, **attrib):
+    return ET.SubElement(parent, tag, {key: str(value) for key, value in attrib.items()})
+
+def paged(items, headers, query):
+    """Slice a listing by X-Plex-Container-Start/Size (header or query parameter)"""
+    def option(name, default):
+        return int(headers.get(name) or query.get(name, [default])[0])
+    start = option('X-Plex-Container-Start', 0)
+    size = option('X-Plex-Container-Size', len(items))
+    return items[start:start + size]
+
+class MockState:
+    """Synthetic server state, reproducible for a seed and moving with the clock"""
+    
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.started = int(time.time())
+    
+    def uniform(self, low, high):
+        with self.lock:
+            return self.random.uniform(low, high)
+    
+    def root(self):
+        return container(machineIdentifier=MOCK_MACHINE_ID, friendlyName='Mock PMS', version='1.40.0.0000-mock',
+                         platform='Linux', platformVersion='mock', myPlex=0)
+    
+    def accounts(self):
+        element = container(size=len(MOCK_ACCOUNTS))
+        for account, name in MOCK_ACCOUNTS.items():
+            child(element, 'Account', id=account, key=f"/accounts/{account}", name=name)
+        return element
+    
+    def resources(self):
+        now = int(time.time())
+        element = container(size=RESOURCE_ENTRIES)
+        for i in range(RESOURCE_ENTRIES):
+            child(element, 'StatisticsResources', timespan=6, at=now - (RESOURCE_ENTRIES - 1 - i) * 6,
+                  hostCpuUtilization=round(self.uniform(10, 80), 3),
+                  hostMemoryUtilization=round(self.uniform(30, 60), 3),
+                  processCpuUtilization=round(self.uniform(5, 40), 3),
+                  processMemoryUtilization=round(self.uniform(5, 20), 3))
+        return element
+    
+    def sessions(self):
+        element = container(size=MOCK_SESSIONS)
+        for i in range(MOCK_SESSIONS):
+            account = 2 + i % (len(MOCK_ACCOUNTS) - 1)
+            device = list(MOCK_DEVICES)[i % len(MOCK_DEVICES)]
+            transcoding = i % 2 == 1
+            video = child(element, 'Video', type='movie', ratingKey=1000 + i, key=f"/library/metadata/{1000 + i}",
+                          title=f"Mock Movie {i}", duration=5400000, viewOffset=600000 * (i + 1), sessionKey=i + 1)
+            media = child(video, 'Media', videoResolution='4k' if i == 2 else '1080', container='mkv',
+                          videoCodec='hevc', audioCodec='eac3', bitrate=20000)
+            child(media, 'Part', container='mkv', size=4 * 1024 ** 3)
+            child(video, 'User', id=account, title=MOCK_ACCOUNTS[account])
+            child(video, 'Player', title=MOCK_DEVICES[device], machineIdentifier=f"device-{device}",
+                  address=f"203.0.113.{device}", remotePublicAddress=f"203.0.113.{device}",
+                  local=int(i == 0), state='playing', product='Plex Web', platform='Chrome')
+            child(video, 'Session', id=f"session-{i}", bandwidth=8000 + 4000 * i, location='lan' if i == 0 else 'wan')
+            if transcoding:
+                child(video, 'TranscodeSession', key=f"/transcode/sessions/mock-{i}", videoDecision='transcode',
+                      audioDecision='copy', subtitleDecision='', sourceVideoCodec='hevc', videoCodec='h264',
+                      container='mpegts', height=720, throttled=0, speed=round(self.uniform(1, 3), 1),
+                      transcodeHwRequested=1, transcodeHwEncoding='vaapi' if i == 1 else '',
+                      transcodeHwDecoding='vaapi' if i == 1 else '')
+        return element
+    
+    def sections(self):
+        element = container(size=len(MOCK_SECTIONS))
+        for key, section_type, title, _ in MOCK_SECTIONS:
+            child(element, 'Directory', key=key, type=section_type, title=title, agent='tv.plex.agents.none',
+                  scanner='Plex Movie', language='en-US', uuid=f"mock-section-{key}",
+                  updatedAt=self.started, scannedAt=self.started)
+        return element
+    
+    def section_all(self, section_key):
+        totals = {key: total for key, _, _, total in MOCK_SECTIONS}
+        return container(size=0, totalSize=totals.get(section_key, 0))
+    
+    def activities(self):
+        element = container(size=1)
+        child(element, 'Activity', uuid='mock-scan', type='library.update.section', cancellable=1, userID=1,
+              title='Scanning TV Shows', subtitle='Mock Show', progress=int(time.time() - self.started) % 100)
+        return element
+    
+    def bandwidth(self, since_ts):
+        now = int(time.time())
+        element = container()
+        for account, name in MOCK_ACCOUNTS.items():
+            child(element, 'Account', id=account, key=f"/accounts/{account}", name=name)
+        for device, name in MOCK_DEVICES.items():
+            child(element, 'Device', id=device, name=name, platform='Chrome', clientIdentifier=f"device-{device}")
+        first = max(since_ts + 1, now - 3600)
+        for at in range(first - first % BANDWIDTH_STEP + BANDWIDTH_STEP, now + 1, BANDWIDTH_STEP):
+            for i, account in enumerate(list(MOCK_ACCOUNTS)[1:]):
+                child(element, 'StatisticsBandwidth', accountID=account, deviceID=list(MOCK_DEVICES)[i % len(MOCK_DEVICES)],
+                      timespan=6, at=at, lan=int(i == 0), bytes=int(self.uniform(1, 5) * 1024 ** 2))
+        return element
+    
+    def history(self, since_ts, headers, query):
+        now = int(time.time())
+        first = max(since_ts + 1, now - HISTORY_SPAN)
+        views = [(at, 2 + (at // HISTORY_STEP) % (len(MOCK_ACCOUNTS) - 1), list(MOCK_DEVICES)[(at // HISTORY_STEP) % len(MOCK_DEVICES)],
+                  1000 + (at // HISTORY_STEP) % MOCK_ITEMS)
+                 for at in range(now - now % HISTORY_STEP, first - 1, -HISTORY_STEP)]
+        page = paged(views, headers, query)
+        element = container(size=len(page), totalSize=len(views))
+        for at, account, device, rating_key in page:
+            child(element, 'Video', type='movie', ratingKey=rating_key, title=f"Mock Movie {rating_key - 1000}",
+                  viewedAt=at, accountID=account, deviceID=device)
+        return element
+    
+    def metadata(self, rating_keys):
+        element = container(size=len(rating_keys))
+        for rating_key in rating_keys:
+            if rating_key.isdigit() and 1000 <= int(rating_key) < 1000 + MOCK_ITEMS:
+                child(element, 'Video', type='movie', ratingKey=rating_key, title=f"Mock Movie {int(rating_key) - 1000}",
+                      duration=(60 + int(rating_key) % 60) * 60000)
+        return element
+
+def make_mock_handler(state, token=MOCK_TOKEN):
+    """HTTP handler answering the PMS endpoints the resource monitor uses"""
+    
+    class MockRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            path = url.path.rstrip('/') or '/'
+            if (self.headers.get('X-Plex-Token') or query.get('X-Plex-Token', [None])[0]) != token:
+                self.send_error(401)
+                return
+            
+            def number(name):
+                return int(query.get(name, ['0'])[0])
+            
+            if path in ('/', '/identity'):
+                body = state.root()
+            elif path == '/accounts':
+                body = state.accounts()
+            elif path == '/statistics/resources':
+                body = state.resources()
+            elif path == '/status/sessions':
+                body = state.sessions()
+            elif path in ('/library', '/library/sections'):
+                body = state.sections()
+            elif path.startswith('/library/sections/') and path.endswith('/all'):
+                body = state.section_all(path.split('/')[3])
+            elif path == '/activities':
+                body = state.activities()
+            elif path == '/statistics/bandwidth':
+                body = state.bandwidth(number('at>'))
+            elif path == '/status/sessions/history/all':
+                body = state.history(number('viewedAt>'), self.headers, query)
+            elif path.startswith('/library/metadata/'):
+                body = state.metadata(path.split('/')[3].split(','))
+            else:
+                self.send_error(404)
+                return
+            
+            payload = ET.tostring(body, encoding='utf-8', xml_declaration=True)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/xml;charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    return MockRequestHandler
+
+def mock_servers(port, token=MOCK_TOKEN):
+    """Server list for the monitor's --servers-file with one group on this mock PMS"""
+    url = f"http://{MOCK_HOST}:{port}"
+    return {
+        'mock': {
+            'regular': {'name': 'Mock', 'server_id': MOCK_MACHINE_ID, 'url': url, 'token': token,
+                        'friendly_name': 'Mock PMS'}
+        }
+    }
+
+def start_mock_pms(port=0, seed=0, token=MOCK_TOKEN):
+    """Serve the mock PMS from a background thread; returns the server (port 0 picks a free one)"""
+    server = ThreadingHTTPServer((MOCK_HOST, port), make_mock_handler(MockState(seed), token))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock Plex Media Server for local monitor testing')
+    parser.add_argument('--port', type=int, default=MOCK_PORT,
+                       help=f'Port on {MOCK_HOST} (default: {MOCK_PORT})')
+    parser.add_argument('--seed', type=int, default=0,
+                       help='Random seed for the synthetic resource and bandwidth values')
+    parser.add_argument('--write-servers', metavar='PATH',
+                       help='Write a --servers-file for plex_resource_monitor.py pointing at this mock')
+    
+    args = parser.parse_args()
+    
+    if args.write_servers:
+        os.makedirs(os.path.dirname(os.path.abspath(args.write_servers)), exist_ok=True)
+        with open(args.write_servers, 'w') as f:
+            json.dump(mock_servers(args.port), f, indent=2)
+        print(f"[INFO] Wrote servers file {args.write_servers}", file=sys.stderr)
+    
+    server = start_mock_pms(args.port, args.seed)
+    print(f"[START] Mock PMS on http://{MOCK_HOST}:{args.port} (token {MOCK_TOKEN})", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
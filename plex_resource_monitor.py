@@ -5,10 +5,18 @@ Using the correct PlexAPI resources() method
 """
 
 import json
+import os
 import sys
+import time
+import argparse
+import threading
+import zlib
 import requests
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from datetime import datetime
-import xml.etree.ElementTree as ET
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
 
 try:
     from plexapi.server import PlexServer
@@ -53,12 +61,571 @@ PLEX_SERVERS = {
     }
 }
 
-def get_plex_resources(server_config):
+# Sampling daemon: polls every server and answers queries from its sample store
+DAEMON_HOST = os.environ.get('PLEX_MONITOR_HOST', '127.0.0.1')
+DAEMON_PORT = int(os.environ.get('PLEX_MONITOR_PORT', 9595))
+SAMPLE_INTERVAL = 30          # seconds between polls
+RAW_RETENTION = 24 * 3600     # seconds of raw samples kept per server
+RING_CAPACITY = 14400         # raw slots per server (a day of Plex's 6-second resource entries)
+
+# Sample store on disk (fixed-size memory-mapped .npy rings, one set per server)
+MONITOR_DATA_DIR = os.environ.get(
+    'PLEX_MONITOR_DATA_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'plex_monitor')
+)
+
+# Rollup tiers: (name, bucket seconds, buckets kept)
+ROLLUP_TIERS = (
+    ('1m', 60, 7 * 24 * 60),        # 1-minute buckets for 7 days
+    ('15m', 900, 365 * 24 * 4)      # 15-minute buckets for a year
+)
+
+# One row per sample; NaN marks a metric that wasn't measured for that row
+SAMPLE_DTYPE = np.dtype([
+    ('ts', '<i8'),
+    ('host_cpu', '<f4'),
+    ('host_memory', '<f4'),
+    ('process_cpu', '<f4'),
+    ('process_memory', '<f4'),
+    ('sessions', '<f4'),
+    ('transcodes', '<f4'),
+    ('direct_plays', '<f4'),
+    ('hw_transcodes', '<f4'),
+    ('transcodes_4k', '<f4')
+])
+SAMPLE_METRICS = SAMPLE_DTYPE.names[1:]
+
+# Capacity model: (sessions, transcodes, 4K sources, hw accel) -> (CPU, memory)
+CAPACITY_FEATURES = ('direct_plays', 'sw_transcodes', 'hw_transcodes', 'transcodes_4k')
+CAPACITY_TARGETS = ('host_cpu', 'host_memory')
+CAPACITY_FORGETTING = 0.9995  # per sample, so old hardware/settings fade out over a few days
+CAPACITY_RIDGE = 1e-3
+CAPACITY_MIN_SAMPLES = 30
+CAPACITY_CPU_LIMIT = 90
+
+# Session inspector columns (one list per column, one index per playing session)
+SESSION_COLUMNS = (
+    'server', 'session_key', 'user', 'player', 'product', 'location', 'media_type', 'title',
+    'source_video_codec', 'source_resolution', 'source_bitrate_kbps',
+    'video_decision', 'audio_decision', 'subtitle_decision',
+    'target_video_codec', 'target_resolution', 'transcoding',
+    'hw_requested', 'hw_decoding', 'hw_encoding', 'throttled', 'speed',
+    'bandwidth_kbps', 'transcode_reasons'
+)
+SESSION_RESOLUTION_HEIGHTS = ((240, '240'), (360, '360'), (480, '480'), (576, 'sd'), (720, '720'), (1080, '1080'))
+SESSION_RESOLUTION_RANK = {'sd': 480, '240': 240, '360': 360, '480': 480, '576': 576, '720': 720, '1080': 1080, '4k': 2160}
+
+# Bandwidth statistics: one row per (6-second slot, account, device, lan/wan) entry from PMS
+BANDWIDTH_DTYPE = np.dtype([
+    ('ts', '<i8'),
+    ('account', '<i4'),
+    ('device', '<i4'),
+    ('lan', 'u1'),
+    ('bytes', '<i8')
+])
+BANDWIDTH_TIMESPAN = 6        # /statistics/bandwidth timespan id for per-6-second entries
+BANDWIDTH_CAPACITY = 100000   # raw bandwidth slots per server
+BANDWIDTH_BUCKET = 60         # default seconds per throughput bucket
+
+# Anomaly detection: EWMA baseline per metric, z-score thresholds with hysteresis
+ANOMALY_ALPHA = 0.02              # EWMA weight per sample (~50-sample memory)
+ANOMALY_WARMUP = 50               # samples before a metric can alert
+ANOMALY_ENTER_Z = 4.0
+ANOMALY_ENTER_SAMPLES = 5         # consecutive samples beyond ENTER_Z to fire
+ANOMALY_EXIT_Z = 2.0
+ANOMALY_EXIT_SAMPLES = 10         # consecutive samples within EXIT_Z to resolve
+ANOMALY_FIRING_DAMPING = 0.1      # baseline adapts 10x slower for outliers and while firing
+ANOMALY_MIN_STD = {               # floor on the deviation scale, in metric units
+    'host_cpu': 5.0, 'host_memory': 2.0, 'process_cpu': 5.0, 'process_memory': 2.0,
+    'sessions': 2.0, 'transcodes': 1.0, 'direct_plays': 2.0, 'hw_transcodes': 1.0, 'transcodes_4k': 1.0
+}
+ALERT_LOG_MAX_BYTES = 5 * 1024 * 1024
+
+# Server activities (library scans, media analysis, butler tasks) as start/progress/end events
+ACTIVITY_DTYPE = np.dtype([
+    ('ts', '<i8'),
+    ('activity', '<u4'),    # crc32 of the activity uuid
+    ('kind', 'u1'),         # index into ACTIVITY_KINDS
+    ('event', 'u1'),        # index into ACTIVITY_EVENTS
+    ('progress', '<f4'),
+    ('section', '<i4')      # library section id, -1 if none
+])
+ACTIVITY_KINDS = ('other', 'scan', 'analysis', 'butler')
+ACTIVITY_EVENTS = ('start', 'progress', 'end')
+ACTIVITY_CAPACITY = 20000
+ACTIVITY_PROGRESS_STEP = 10       # record a progress event every 10 percentage points
+ACTIVITY_NAMES_KEPT = 1000
+ACTIVITY_LOOKBACK = 24 * 3600     # how far back to look for activities running at a given moment
+
+# Sharing detection: observed streams (first to last poll) and the server's play history, per server
+STREAM_DTYPE = np.dtype([
+    ('ts', '<i8'),          # last seen (plus one poll interval)
+    ('start', '<i8'),       # first seen
+    ('account', '<i8'),
+    ('device', '<u4'),      # crc32 of the player's machineIdentifier
+    ('address', '<u4'),     # crc32 of the player's public address, 0 for LAN streams
+    ('transcode', 'u1')     # 1 if any poll saw the stream transcoding
+])
+STREAM_CAPACITY = 200000
+PLAY_DTYPE = np.dtype([
+    ('ts', '<i8'),          # viewedAt (when the play was recorded)
+    ('account', '<i8'),
+    ('device', '<u4'),      # PMS deviceID
+    ('duration', '<i4')     # seconds
+])
+PLAY_CAPACITY = 200000
+PLAY_PAGE_SIZE = 500
+PLAY_METADATA_BATCH = 100
+PLAY_POLL_INTERVAL = 300          # seconds between the daemon's play history fetches
+SHARING_DAYS = 90
+SHARING_WINDOWS = (('24h', 24 * 3600), ('7d', 7 * 24 * 3600))
+SHARING_DEVICE_ALLOWANCE = 2      # distinct devices in a day allowed beyond device_count (phone, tablet, ...)
+
+# Placement: which server group a user should be tagged onto
+PLACEMENT_GROUP_TAGS = {'Plex 1': 'plex1', 'Plex 2': 'plex2'}
+PLACEMENT_WINDOW_DAYS = 7
+PLACEMENT_PEAK_PERCENTILE = 95
+PLACEMENT_MIN_GAIN = 1.0          # CPU percentage points a rebalance move must save
+PLACEMENT_MAX_MOVES = 50
+PLACEMENT_IDLE_SHARE = 0.25       # share of an average user's peak cost each idle shared user may bring back
+
+# OpenMetrics exporter: (metric name, resources field, help) per server gauge
+METRIC_GAUGES = (
+    ('plex_host_cpu_percent', 'cpu_usage_percent', 'Host CPU utilization'),
+    ('plex_host_memory_percent', 'memory_usage_percent', 'Host memory utilization'),
+    ('plex_sessions', 'active_sessions', 'Playing sessions'),
+    ('plex_transcodes', 'transcoding_sessions', 'Transcoding sessions'),
+    ('plex_hw_transcodes', 'hw_transcoding_sessions', 'Hardware-accelerated transcoding sessions'),
+    ('plex_direct_plays', 'direct_play_sessions', 'Direct play sessions'),
+    ('plex_libraries', 'library_count', 'Library sections'),
+    ('plex_library_items', 'total_media_items', 'Items across all library sections')
+)
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# One row per rollup bucket: min/avg/max of every metric
+ROLLUP_DTYPE = np.dtype(
+    [('ts', '<i8'), ('samples', '<i4')] +
+    [(f"{metric}_{stat}", '<f4') for metric in SAMPLE_METRICS for stat in ('min', 'avg', 'max')]
+)
+
+def write_json_atomic(path, data):
+    """Write JSON via a temp file + rename so readers never see a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def open_ring_array(path, dtype, capacity, read_only=False):
+    """Memory-map a fixed-size .npy ring, recreating it if the layout changed.
+    Read-only opens never create or recreate the file (the daemon owns it): a missing or
+    differently laid out ring reads as empty."""
+    if os.path.exists(path):
+        data = np.lib.format.open_memmap(path, mode='r' if read_only else 'r+')
+        if data.dtype == dtype and data.shape == (capacity,):
+            return data
+        del data
+        if read_only:
+            return np.zeros(0, dtype=dtype)
+        print(f"[INFO] Store layout changed, starting a new {os.path.basename(path)}", file=sys.stderr)
+    if read_only:
+        return np.zeros(0, dtype=dtype)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(capacity,))
+
+class RingBuffer:
+    """Fixed-size array of samples; once full, the oldest sample is overwritten.
+    With a path the array is a memory-mapped .npy file, so it survives restarts."""
+    
+    def __init__(self, capacity, dtype=SAMPLE_DTYPE, path=None, read_only=False):
+        self.data = open_ring_array(path, dtype, capacity, read_only) if path else np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        
+        # Empty slots have ts == 0; the newest row has the largest ts
+        filled = int(np.count_nonzero(self.data['ts']))
+        newest = int(np.argmax(self.data['ts'])) if filled else -1
+        self.count = filled if filled < capacity else capacity + newest + 1
+    
+    def append(self, row):
+        self.data[self.count % self.capacity] = row
+        self.count += 1
+    
+    def flush(self):
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+    
+    @property
+    def last_ts(self):
+        return int(self.data[(self.count - 1) % self.capacity]['ts']) if self.count else 0
+    
+    def segments(self):
+        """The stored rows as at most two views, oldest first (no copying)"""
+        if self.count <= self.capacity:
+            return [self.data[:self.count]]
+        head = self.count % self.capacity
+        return [self.data[head:], self.data[:head]]
+    
+    def since_views(self, ts):
+        """Views of the rows at or after a timestamp, oldest first (no copying)"""
+        return [segment[np.searchsorted(segment['ts'], ts):] for segment in self.segments()]
+    
+    def since(self, ts):
+        """Rows at or after a timestamp as one array, oldest first"""
+        views = [view for view in self.since_views(ts) if len(view)]
+        return np.concatenate(views) if len(views) > 1 else (views[0] if views else self.data[:0])
+
+class RollupTier:
+    """Aggregates samples into fixed time buckets (min/avg/max) stored in a ring"""
+    
+    def __init__(self, bucket_seconds, capacity, path=None, read_only=False):
+        self.bucket_seconds = bucket_seconds
+        self.ring = RingBuffer(capacity, ROLLUP_DTYPE, path, read_only)
+        self.bucket_start = 0
+        self.reset()
+    
+    def reset(self):
+        count = len(SAMPLE_METRICS)
+        self.samples = 0
+        self.mins = np.full(count, np.nan)
+        self.maxs = np.full(count, np.nan)
+        self.sums = np.zeros(count)
+        self.counts = np.zeros(count)
+    
+    def add(self, sample):
+        """Add one sample row; closes the current bucket when the sample is past it"""
+        bucket_start = int(sample['ts']) // self.bucket_seconds * self.bucket_seconds
+        if bucket_start != self.bucket_start:
+            self.close_bucket()
+            self.bucket_start = bucket_start
+        
+        values = np.array([sample[metric] for metric in SAMPLE_METRICS], dtype=np.float64)
+        measured = ~np.isnan(values)
+        self.mins = np.fmin(self.mins, values)
+        self.maxs = np.fmax(self.maxs, values)
+        self.sums[measured] += values[measured]
+        self.counts += measured
+        self.samples += 1
+    
+    def close_bucket(self):
+        if self.samples and self.bucket_start > self.ring.last_ts:
+            avgs = np.divide(self.sums, self.counts, out=np.full(len(self.sums), np.nan), where=self.counts > 0)
+            stats = np.column_stack((self.mins, avgs, self.maxs)).ravel()
+            self.ring.append((self.bucket_start, self.samples, *stats))
+        self.reset()
+
+class ServerStore:
+    """All stored samples of one server: a raw ring plus its rollup tiers.
+    Only the sampler daemon writes a store; one-shot commands open it read_only, since a second
+    writer would keep its own ring positions and overwrite the daemon's rows."""
+    
+    def __init__(self, server_key, capacity=RING_CAPACITY, data_dir=MONITOR_DATA_DIR, read_only=False):
+        path = lambda name: os.path.join(data_dir, f"{server_key}.{name}.npy") if data_dir else None
+        self.raw = RingBuffer(capacity, SAMPLE_DTYPE, path('raw'), read_only)
+        self.tiers = {name: RollupTier(seconds, buckets, path(name), read_only)
+                      for name, seconds, buckets in ROLLUP_TIERS}
+        self.bandwidth = RingBuffer(BANDWIDTH_CAPACITY, BANDWIDTH_DTYPE, path('bandwidth'), read_only)
+        self.activities = RingBuffer(ACTIVITY_CAPACITY, ACTIVITY_DTYPE, path('activities'), read_only)
+        self.streams = RingBuffer(STREAM_CAPACITY, STREAM_DTYPE, path('streams'), read_only)
+        self.plays = RingBuffer(PLAY_CAPACITY, PLAY_DTYPE, path('plays'), read_only)
+        
+        # Account/device names for the ids in the bandwidth ring (accounts also cover the stream ring)
+        self.names_path = os.path.join(data_dir, f"{server_key}.bandwidth.json") if data_dir else None
+        self.bandwidth_names = {'accounts': {}, 'devices': {}}
+        if self.names_path and os.path.exists(self.names_path):
+            with open(self.names_path) as f:
+                self.bandwidth_names = json.load(f)
+        
+        # Type/title/subtitle for the activity ids in the activity ring (most recent ones only)
+        self.activity_names_path = os.path.join(data_dir, f"{server_key}.activities.json") if data_dir else None
+        self.activity_names = {}
+        if self.activity_names_path and os.path.exists(self.activity_names_path):
+            with open(self.activity_names_path) as f:
+                self.activity_names = json.load(f)
+    
+    @property
+    def last_ts(self):
+        return self.raw.last_ts
+    
+    def append(self, sample):
+        self.raw.append(sample)
+        row = self.raw.data[(self.raw.count - 1) % self.raw.capacity]
+        for tier in self.tiers.values():
+            tier.add(row)
+    
+    def append_bandwidth(self, rows, accounts, devices):
+        for row in rows:
+            self.bandwidth.append(row)
+        
+        known = self.bandwidth_names
+        new_accounts = {str(key): name for key, name in accounts.items() if known['accounts'].get(str(key)) != name}
+        new_devices = {str(key): name for key, name in devices.items() if known['devices'].get(str(key)) != name}
+        if (new_accounts or new_devices) and self.names_path:
+            known['accounts'].update(new_accounts)
+            known['devices'].update(new_devices)
+            write_json_atomic(self.names_path, known)
+    
+    def append_activities(self, rows, activities):
+        for row in rows:
+            self.activities.append(row)
+        
+        new_names = {str(activity['id']): {'type': activity['type'], 'title': activity['title'],
+                                           'subtitle': activity['subtitle']}
+                     for activity in activities.values() if str(activity['id']) not in self.activity_names}
+        if new_names:
+            self.activity_names.update(new_names)
+            # Dicts keep insertion order, so the oldest names are dropped first
+            for stale in list(self.activity_names)[:-ACTIVITY_NAMES_KEPT]:
+                del self.activity_names[stale]
+            if self.activity_names_path:
+                write_json_atomic(self.activity_names_path, self.activity_names)
+    
+    def append_streams(self, rows, accounts):
+        for row in rows:
+            self.streams.append(row)
+        self.append_bandwidth([], accounts, {})
+    
+    def append_plays(self, rows):
+        for row in rows:
+            self.plays.append(row)
+    
+    def activities_since(self, minutes):
+        return self.activities.since(int(time.time()) - minutes * 60)
+    
+    def bandwidth_since(self, minutes):
+        return self.bandwidth.since(int(time.time()) - minutes * 60)
+    
+    def flush(self):
+        self.raw.flush()
+        self.bandwidth.flush()
+        self.activities.flush()
+        self.streams.flush()
+        self.plays.flush()
+        for tier in self.tiers.values():
+            tier.ring.flush()
+    
+    def ring_for(self, minutes, resolution='auto'):
+        """Pick the finest ring that covers the requested span"""
+        if resolution == 'auto':
+            span = minutes * 60
+            if span <= RAW_RETENTION:
+                resolution = 'raw'
+            else:
+                resolution = next((name for name, seconds, buckets in ROLLUP_TIERS if span <= seconds * buckets),
+                                  ROLLUP_TIERS[-1][0])
+        return self.raw if resolution == 'raw' else self.tiers[resolution].ring
+    
+    def since(self, minutes, resolution='auto'):
+        return self.ring_for(minutes, resolution).since(int(time.time()) - minutes * 60)
+
+class AnomalyDetector:
+    """Streaming EWMA mean/variance per metric for one server, flagging sustained deviations.
+    An alert fires after ANOMALY_ENTER_SAMPLES consecutive samples beyond ANOMALY_ENTER_Z and
+    resolves after ANOMALY_EXIT_SAMPLES consecutive samples back within ANOMALY_EXIT_Z."""
+    
+    def __init__(self, server_key, alpha=ANOMALY_ALPHA):
+        count = len(SAMPLE_METRICS)
+        self.server_key = server_key
+        self.alpha = alpha
+        self.min_std = np.array([ANOMALY_MIN_STD.get(metric, 1.0) for metric in SAMPLE_METRICS])
+        self.mean = np.zeros(count)
+        self.var = np.zeros(count)
+        self.seen = np.zeros(count, dtype=np.int64)
+        self.over = np.zeros(count, dtype=np.int64)
+        self.under = np.zeros(count, dtype=np.int64)
+        self.firing = np.zeros(count, dtype=bool)
+    
+    def update(self, sample):
+        """Fold one sample row in; returns the alert events it triggered"""
+        values = np.array([sample[metric] for metric in SAMPLE_METRICS], dtype=np.float64)
+        measured = ~np.isnan(values)
+        
+        std = np.maximum(np.sqrt(self.var), self.min_std)
+        z = np.where(measured, (values - self.mean) / std, 0.0)
+        warm = measured & (self.seen >= ANOMALY_WARMUP)
+        
+        # Hysteresis: separate enter/exit thresholds, each needing a run of samples
+        outside = warm & (np.abs(z) > ANOMALY_ENTER_Z)
+        inside = warm & (np.abs(z) < ANOMALY_EXIT_Z)
+        self.over = np.where(outside, self.over + 1, np.where(warm, 0, self.over))
+        self.under = np.where(inside, self.under + 1, np.where(warm, 0, self.under))
+        fire = ~self.firing & (self.over >= ANOMALY_ENTER_SAMPLES)
+        resolve = self.firing & (self.under >= ANOMALY_EXIT_SAMPLES)
+        self.firing = (self.firing | fire) & ~resolve
+        
+        events = [self.event(sample['ts'], i, 'firing', values, z, std) for i in np.flatnonzero(fire)]
+        events += [self.event(sample['ts'], i, 'resolved', values, z, std) for i in np.flatnonzero(resolve)]
+        
+        # EWMA update; outliers and firing metrics move the baseline slowly so a
+        # sustained deviation isn't absorbed into the variance before it can fire
+        alpha = np.where(self.firing | outside, self.alpha * ANOMALY_FIRING_DAMPING, self.alpha)
+        alpha = np.where(self.seen == 0, 1.0, alpha)
+        diff = np.where(measured, values - self.mean, 0.0)
+        increment = alpha * diff
+        self.mean += increment
+        self.var = np.where(measured, (1 - alpha) * (self.var + diff * increment), self.var)
+        self.seen += measured
+        return events
+    
+    def event(self, ts, index, state, values, z, std):
+        return {
+            'ts': int(ts),
+            'time': datetime.fromtimestamp(int(ts)).isoformat(),
+            'server': self.server_key,
+            'metric': SAMPLE_METRICS[index],
+            'state': state,
+            'direction': 'high' if z[index] > 0 else 'low',
+            'value': round(float(values[index]), 2),
+            'mean': round(float(self.mean[index]), 2),
+            'std': round(float(std[index]), 2),
+            'z': round(float(z[index]), 2)
+        }
+    
+    def active(self):
+        return [SAMPLE_METRICS[i] for i in np.flatnonzero(self.firing)]
+
+def append_alerts(events, path):
+    """Append alert events as NDJSON, rotating the file once it grows past ALERT_LOG_MAX_BYTES"""
+    if not events or not path:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path) and os.path.getsize(path) > ALERT_LOG_MAX_BYTES:
+        os.replace(path, f"{path}.1")
+    with open(path, 'a') as f:
+        for event in events:
+            f.write(json.dumps(event) + '\n')
+    for event in events:
+        print(f"[ALERT] {event['server']} {event['metric']} {event['state']}: {event['value']} "
+              f"(mean {event['mean']}, z {event['z']})", file=sys.stderr)
+
+class CapacityModel:
+    """Per-server least-squares fit of host CPU/memory against the session mix.
+    Keeps only the normal equations (with slow forgetting), so every new sample
+    refits the model in constant time."""
+    
+    def __init__(self, path=None):
+        size = len(CAPACITY_FEATURES) + 1
+        self.path = path
+        self.xtx = np.zeros((size, size))
+        self.xty = np.zeros((size, len(CAPACITY_TARGETS)))
+        self.samples = 0
+        self.coef = None
+        
+        if path and os.path.exists(path):
+            with np.load(path) as saved:
+                self.xtx, self.xty, self.samples = saved['xtx'], saved['xty'], int(saved['samples'])
+            self.refit()
+    
+    @staticmethod
+    def features(counts):
+        """[1, direct plays, software transcodes, hardware transcodes, 4K-source transcodes]"""
+        transcodes = counts['transcodes']
+        hw_transcodes = counts['hw_transcodes']
+        return np.array([1.0, counts['direct_plays'], transcodes - hw_transcodes,
+                         hw_transcodes, counts['transcodes_4k']], dtype=np.float64)
+    
+    @property
+    def ready(self):
+        return self.coef is not None and self.samples >= CAPACITY_MIN_SAMPLES
+    
+    def update(self, sample):
+        """Fold one sample into the fit; samples without CPU/memory or sessions are skipped"""
+        x = self.features(sample)
+        y = np.array([sample[target] for target in CAPACITY_TARGETS], dtype=np.float64)
+        if np.isnan(x).any() or np.isnan(y).any():
+            return False
+        
+        self.xtx = self.xtx * CAPACITY_FORGETTING + np.outer(x, x)
+        self.xty = self.xty * CAPACITY_FORGETTING + np.outer(x, y)
+        self.samples += 1
+        self.refit()
+        return True
+    
+    def refit(self):
+        # A small ridge keeps the fit defined before every session type has been seen
+        ridge = CAPACITY_RIDGE * np.eye(len(self.xtx))
+        ridge[0, 0] = 0
+        self.coef = np.linalg.lstsq(self.xtx + ridge, self.xty, rcond=None)[0]
+    
+    def predict(self, counts):
+        """Predicted (cpu %, memory %) for a session mix"""
+        cpu, memory = self.features(counts) @ self.coef
+        return float(np.clip(cpu, 0, 100)), float(np.clip(memory, 0, 100))
+    
+    def fourk_transcode_headroom(self, current_cpu, hardware):
+        """How many more 4K->1080p transcodes fit before CAPACITY_CPU_LIMIT"""
+        transcode_column = 3 if hardware else 2
+        marginal_cpu = self.coef[transcode_column, 0] + self.coef[4, 0]
+        if marginal_cpu <= 0:
+            return None
+        return max(0, int((CAPACITY_CPU_LIMIT - current_cpu) // marginal_cpu))
+    
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez(tmp_path, xtx=self.xtx, xty=self.xty, samples=self.samples)
+        os.replace(tmp_path, self.path)
+
+def describe_capacity_model(model):
+    """JSON view of a fitted model: per-session costs in CPU/memory percentage points"""
+    if not model.ready:
+        return {'ready': False, 'model_samples': model.samples}
+    
+    names = ('baseline',) + CAPACITY_FEATURES
+    return {
+        'ready': True,
+        'model_samples': model.samples,
+        'cpu_percent_per_session': {name: round(float(value), 2) for name, value in zip(names, model.coef[:, 0])},
+        'memory_percent_per_session': {name: round(float(value), 2) for name, value in zip(names, model.coef[:, 1])},
+        'idle_fourk_transcode_capacity': {
+            'software': model.fourk_transcode_headroom(float(np.clip(model.coef[0, 0], 0, 100)), False),
+            'hardware': model.fourk_transcode_headroom(float(np.clip(model.coef[0, 0], 0, 100)), True)
+        }
+    }
+
+def get_capacity_report(data_dir=MONITOR_DATA_DIR):
+    """Fitted capacity models for every configured server, as saved by the daemon"""
+    report = {}
+    for server_group, server_type, _ in iter_server_configs():
+        server_key = f"{server_group}.{server_type}"
+        report.setdefault(server_group, {})[server_type] = describe_capacity_model(
+            CapacityModel(capacity_model_path(server_key, data_dir)))
+    return report
+
+def capacity_model_path(server_key, data_dir=MONITOR_DATA_DIR):
+    return os.path.join(data_dir, f"{server_key}.capacity.npz") if data_dir else None
+
+def apply_capacity_model(resources, model):
+    """Add model-based capacity figures to a server's resource dict"""
+    counts = {
+        'direct_plays': resources.get('direct_play_sessions', 0),
+        'transcodes': resources.get('transcoding_sessions', 0),
+        'hw_transcodes': resources.get('hw_transcoding_sessions', 0),
+        'transcodes_4k': resources.get('fourk_transcoding_sessions', 0)
+    }
+    predicted_cpu, predicted_memory = model.predict(counts)
+    current_cpu = resources['cpu_usage_percent'] if resources.get('found_real_data') else predicted_cpu
+    
+    # Assume hardware transcoding if the server is using it right now
+    hardware = counts['hw_transcodes'] > 0
+    resources['capacity'] = {
+        'predicted_cpu_percent': round(predicted_cpu, 1),
+        'predicted_memory_percent': round(predicted_memory, 1),
+        'fourk_transcode_headroom': model.fourk_transcode_headroom(current_cpu, hardware),
+        'cpu_limit_percent': CAPACITY_CPU_LIMIT,
+        'hardware_transcoding': hardware,
+        'model_samples': model.samples
+    }
+
+def connect_server(server_config, session=None):
+    """Open the one PlexServer connection used for every phase of a poll"""
+    return PlexServer(server_config['url'], server_config['token'], session=session, timeout=10)
+
+def get_plex_resources(plex, server_config):
     """Get real CPU/Memory resources using PlexAPI's resources() method"""
     try:
-        # Use PlexAPI to get the server object
-        plex = PlexServer(server_config['url'], server_config['token'], timeout=10)
-        
         print(f"[DEBUG] Getting resource statistics for {server_config['name']}", file=sys.stderr)
         
         # Use the correct PlexAPI method: plex.resources()
@@ -93,6 +660,16 @@ def get_plex_resources(server_config):
                 print(f"[DEBUG] - Process Memory: {process_memory}", file=sys.stderr)
                 print(f"[DEBUG] - Timestamp: {timestamp}", file=sys.stderr)
                 
+                # Keep the whole history the server returned, not just the latest entry
+                history = [
+                    (int(entry.at.timestamp()),
+                     getattr(entry, 'hostCpuUtilization', None),
+                     getattr(entry, 'hostMemoryUtilization', None),
+                     getattr(entry, 'processCpuUtilization', None),
+                     getattr(entry, 'processMemoryUtilization', None))
+                    for entry in resources if getattr(entry, 'at', None)
+                ]
+                
                 if host_cpu > 0 or host_memory > 0:
                     print(f"[REAL] {server_config['name']}: CPU {host_cpu:.1f}%, Memory {host_memory:.1f}% (resources method)", file=sys.stderr)
                     
@@ -103,7 +680,8 @@ def get_plex_resources(server_config):
                         'found_data': True,
                         'process_cpu': round(process_cpu, 1),
                         'process_memory': round(process_memory, 1),
-                        'timestamp': str(timestamp) if timestamp else None
+                        'timestamp': str(timestamp) if timestamp else None,
+                        'history': history
                     }
                 else:
                     print(f"[INFO] {server_config['name']}: Got resource data but CPU/Memory are 0", file=sys.stderr)
@@ -144,11 +722,27 @@ def estimate_resources_from_sessions(transcoding_sessions, direct_play_sessions)
     
     return estimated_cpu, estimated_memory
 
-def get_server_resource_usage(server_config):
+def session_stream(element, username):
+    """[session id, account id, username, device id, address id, transcoding] of a /status/sessions item (ids are crc32s)"""
+    user, player, session = [element.find(tag) for tag in ('User', 'Player', 'Session')]
+    user, player, session = [item.attrib if item is not None else {} for item in (user, player, session)]
+    lan = (session.get('location') or ('lan' if player.get('local') == '1' else 'wan')) == 'lan'
+    address = '' if lan else player.get('remotePublicAddress') or player.get('address') or ''
+    return [
+        zlib.crc32((session.get('id') or element.get('sessionKey') or '').encode()),
+        int(user.get('id') or 0),
+        username,
+        zlib.crc32((player.get('machineIdentifier') or '').encode()),
+        zlib.crc32(address.encode()) if address else 0,
+        int(element.find('TranscodeSession') is not None)
+    ]
+
+def get_server_resource_usage(server_config, include_history=False, plex=None, capacity_model=None):
     """Get server resource usage information with REAL monitoring"""
     try:
-        print(f"[TEST] Connecting to {server_config['name']}...", file=sys.stderr)
-        plex = PlexServer(server_config['url'], server_config['token'], timeout=10)
+        if plex is None:
+            print(f"[TEST] Connecting to {server_config['name']}...", file=sys.stderr)
+            plex = connect_server(server_config)
         
         resource_data = {
             'success': True,
@@ -175,16 +769,29 @@ def get_server_resource_usage(server_config):
             sessions = plex.sessions()
             transcoding_sessions = 0
             direct_play_sessions = 0
+            hw_transcoding_sessions = 0
+            fourk_transcoding_sessions = 0
+            session_streams = []
             
             for session in sessions:
-                if hasattr(session, 'transcodeSession') and session.transcodeSession:
+                transcode = getattr(session, 'transcodeSession', None)
+                user = (getattr(session, 'usernames', None) or [None])[0]
+                session_streams.append(session_stream(session._data, user))
+                if transcode:
                     transcoding_sessions += 1
+                    if getattr(transcode, 'transcodeHwEncoding', None) or getattr(transcode, 'transcodeHwDecoding', None):
+                        hw_transcoding_sessions += 1
+                    if any(getattr(media, 'videoResolution', None) == '4k' for media in getattr(session, 'media', [])):
+                        fourk_transcoding_sessions += 1
                 else:
                     direct_play_sessions += 1
             
             resource_data['resources']['active_sessions'] = len(sessions)
             resource_data['resources']['transcoding_sessions'] = transcoding_sessions
             resource_data['resources']['direct_play_sessions'] = direct_play_sessions
+            resource_data['resources']['hw_transcoding_sessions'] = hw_transcoding_sessions
+            resource_data['resources']['fourk_transcoding_sessions'] = fourk_transcoding_sessions
+            resource_data['resources']['session_streams'] = session_streams
             
             print(f"[SUCCESS] Got {len(sessions)} sessions for {server_config['name']}", file=sys.stderr)
             
@@ -193,20 +800,24 @@ def get_server_resource_usage(server_config):
             resource_data['resources']['active_sessions'] = 0
             resource_data['resources']['transcoding_sessions'] = 0
             resource_data['resources']['direct_play_sessions'] = 0
+            resource_data['resources']['hw_transcoding_sessions'] = 0
+            resource_data['resources']['fourk_transcoding_sessions'] = 0
         
-        # Get library count
+        # Get library count (the section list is fetched once and reused below)
         try:
-            library_count = len(plex.library.sections())
+            sections = plex.library.sections()
+            library_count = len(sections)
             resource_data['resources']['library_count'] = library_count
             print(f"[SUCCESS] Got {library_count} libraries for {server_config['name']}", file=sys.stderr)
         except Exception as e:
             print(f"[ERROR] Library count failed: {e}", file=sys.stderr)
+            sections = []
             resource_data['resources']['library_count'] = 0
         
         # Get total media items
         try:
             total_items = 0
-            for section in plex.library.sections():
+            for section in sections:
                 try:
                     total_items += section.totalSize
                 except:
@@ -219,7 +830,7 @@ def get_server_resource_usage(server_config):
         
         # GET REAL SYSTEM RESOURCES from Plex API
         print(f"[SEARCH] Looking for CPU/Memory endpoints on {server_config['name']}...", file=sys.stderr)
-        system_resources = get_plex_resources(server_config)
+        system_resources = get_plex_resources(plex, server_config)
         
         # If we got real data, use it
         if system_resources.get('found_data'):
@@ -233,7 +844,24 @@ def get_server_resource_usage(server_config):
                 resource_data['resources']['process_cpu_percent'] = system_resources['process_cpu']
                 resource_data['resources']['process_memory_percent'] = system_resources['process_memory']
             
+            # The sampling daemon keeps every entry the server returned
+            if include_history:
+                resource_data['resource_history'] = system_resources.get('history', [])
+            
             print(f"[REAL] {server_config['name']}: CPU {system_resources['cpu_usage_percent']:.1f}%, Memory {system_resources['memory_usage_percent']:.1f}%", file=sys.stderr)
+        elif capacity_model is not None and capacity_model.ready:
+            # Fall back to the capacity model fitted on this server's own history
+            transcoding = resource_data['resources']['transcoding_sessions']
+            direct_play = resource_data['resources']['direct_play_sessions']
+            apply_capacity_model(resource_data['resources'], capacity_model)
+            
+            resource_data['resources']['cpu_usage_percent'] = resource_data['resources']['capacity']['predicted_cpu_percent']
+            resource_data['resources']['memory_usage_percent'] = resource_data['resources']['capacity']['predicted_memory_percent']
+            resource_data['resources']['monitoring_source'] = 'capacity_model'
+            resource_data['resources']['found_real_data'] = False
+            resource_data['resources']['estimation_note'] = f'Model fitted on {capacity_model.samples} samples for {transcoding} transcoding + {direct_play} direct play sessions'
+            
+            print(f"[ESTIMATE] {server_config['name']}: CPU {resource_data['resources']['cpu_usage_percent']}% (capacity model)", file=sys.stderr)
         else:
             # Fall back to estimation based on sessions
             transcoding = resource_data['resources']['transcoding_sessions']
@@ -249,6 +877,10 @@ def get_server_resource_usage(server_config):
             
             print(f"[ESTIMATE] {server_config['name']}: CPU {estimated_cpu}%, Memory {estimated_memory}% (based on sessions)", file=sys.stderr)
         
+        # Capacity headroom from the fitted model, alongside real measurements
+        if capacity_model is not None and capacity_model.ready and 'capacity' not in resource_data['resources']:
+            apply_capacity_model(resource_data['resources'], capacity_model)
+        
         resource_data['resources']['server_status'] = 'online'
         
         if 'error_message' in system_resources:
@@ -266,45 +898,1256 @@ def get_server_resource_usage(server_config):
         
     except Exception as e:
         print(f"[ERROR] Connection failed for {server_config['name']}: {e}", file=sys.stderr)
-        return {
-            'success': False,
-            'server_name': server_config['name'],
-            'error': str(e),
-            'resources': {
-                'server_status': 'error',
-                'error_message': str(e),
-                'active_sessions': 0,
-                'transcoding_sessions': 0,
-                'direct_play_sessions': 0,
-                'cpu_usage_percent': 0,
-                'memory_usage_percent': 0,
-                'library_count': 0,
-                'total_media_items': 0
-            }
+        return connection_error_result(server_config, e)
+
+def connection_error_result(server_config, error):
+    """Resource result for a server that could not be reached"""
+    return {
+        'success': False,
+        'server_name': server_config['name'],
+        'error': str(error),
+        'resources': {
+            'server_status': 'error',
+            'error_message': str(error),
+            'active_sessions': 0,
+            'transcoding_sessions': 0,
+            'direct_play_sessions': 0,
+            'cpu_usage_percent': 0,
+            'memory_usage_percent': 0,
+            'library_count': 0,
+            'total_media_items': 0
         }
+    }
+
+def iter_server_configs():
+    """(server_group, server_type, server_config) for every configured server"""
+    for server_group, servers in PLEX_SERVERS.items():
+        for server_type in ('regular', 'fourk'):
+            if server_type in servers:
+                yield server_group, server_type, servers[server_type]
 
 def get_all_server_resources():
-    """Get resource usage from all configured Plex servers"""
-    all_resources = {}
+    """Get resource usage from all configured Plex servers, polled concurrently"""
+    all_resources = {server_group: {} for server_group in PLEX_SERVERS}
+    server_list = list(iter_server_configs())
     
-    for server_group, servers in PLEX_SERVERS.items():
-        print(f"[TEST] Processing {server_group} server resources...", file=sys.stderr)
-        all_resources[server_group] = {}
+    print(f"[TEST] Polling {len(server_list)} servers concurrently...", file=sys.stderr)
+    # Capacity models are fitted by the sampling daemon; a one-shot run only reads them
+    models = {f"{server_group}.{server_type}": CapacityModel(capacity_model_path(f"{server_group}.{server_type}"))
+              for server_group, server_type, _ in server_list}
+    
+    with ThreadPoolExecutor(max_workers=len(server_list)) as executor:
+        results = executor.map(
+            lambda server: get_server_resource_usage(server[2], capacity_model=models[f"{server[0]}.{server[1]}"]),
+            server_list
+        )
+        for (server_group, server_type, _), resource_data in zip(server_list, results):
+            all_resources[server_group][server_type] = resource_data
+    
+    return all_resources
+
+def resolution_label(height):
+    """Nearest Plex-style resolution label for a transcode target height"""
+    if not height:
+        return None
+    for limit, label in SESSION_RESOLUTION_HEIGHTS:
+        if height <= limit:
+            return label
+    return '4k'
+
+def transcode_reasons(media, transcode):
+    """Why a session is being transcoded, derived from its source media and transcode decisions"""
+    reasons = []
+    source_height = SESSION_RESOLUTION_RANK.get(media.get('videoResolution'), 0)
+    target_height = int(float(transcode.get('height') or 0))
+    
+    if transcode.get('videoDecision') == 'transcode':
+        if transcode.get('sourceVideoCodec') and transcode.get('sourceVideoCodec') != transcode.get('videoCodec'):
+            reasons.append('video_codec')
+        if target_height and source_height and target_height < source_height * 0.9:
+            reasons.append('video_resolution')
+        if not reasons:
+            reasons.append('video_bitrate')
+    if transcode.get('audioDecision') == 'transcode':
+        reasons.append('audio_codec')
+    if transcode.get('subtitleDecision') == 'burn':
+        reasons.append('subtitle_burn')
+    if not reasons and transcode.get('container') and transcode.get('container') != media.get('container'):
+        reasons.append('container')
+    return reasons
+
+def get_server_sessions(server_config, plex=None):
+    """One row per playing session on a server, read from the raw /status/sessions XML"""
+    if plex is None:
+        plex = connect_server(server_config)
+    
+    rows = []
+    for item in plex.query('/status/sessions'):
+        user = item.find('User')
+        player = item.find('Player')
+        session = item.find('Session')
+        media = item.find('Media')
+        transcode = item.find('TranscodeSession')
+        user, player, session, media = [element.attrib if element is not None else {}
+                                        for element in (user, player, session, media)]
+        transcoding = transcode is not None and 'transcode' in (
+            transcode.get('videoDecision'), transcode.get('audioDecision'), transcode.get('subtitleDecision'))
+        transcode = transcode.attrib if transcode is not None else {}
+        
+        rows.append({
+            'server': server_config['name'],
+            'session_key': item.get('sessionKey'),
+            'user': user.get('title'),
+            'player': player.get('title'),
+            'product': player.get('product'),
+            'location': session.get('location') or ('lan' if player.get('local') == '1' else 'wan'),
+            'media_type': item.get('type'),
+            'title': item.get('grandparentTitle') or item.get('title'),
+            'source_video_codec': transcode.get('sourceVideoCodec') or media.get('videoCodec'),
+            'source_resolution': media.get('videoResolution'),
+            'source_bitrate_kbps': int(media.get('bitrate') or 0),
+            'video_decision': transcode.get('videoDecision', 'direct play'),
+            'audio_decision': transcode.get('audioDecision', 'direct play'),
+            'subtitle_decision': transcode.get('subtitleDecision'),
+            'target_video_codec': transcode.get('videoCodec') or media.get('videoCodec'),
+            'target_resolution': resolution_label(int(float(transcode.get('height') or 0))) or media.get('videoResolution'),
+            'transcoding': transcoding,
+            'hw_requested': transcode.get('transcodeHwRequested') == '1',
+            'hw_decoding': bool(transcode.get('transcodeHwDecoding')),
+            'hw_encoding': bool(transcode.get('transcodeHwEncoding')),
+            'throttled': transcode.get('throttled') == '1',
+            'speed': float(transcode.get('speed') or 0),
+            'bandwidth_kbps': int(session.get('bandwidth') or 0),
+            'transcode_reasons': transcode_reasons(media, transcode) if transcoding else []
+        })
+    return rows
+
+def summarize_sessions(columns):
+    """Totals, hw vs sw transcode share and transcode reason histogram over session columns"""
+    transcoding = np.array(columns['transcoding'], dtype=bool)
+    hardware = transcoding & (np.array(columns['hw_encoding'], dtype=bool) | np.array(columns['hw_decoding'], dtype=bool))
+    bandwidth = np.array(columns['bandwidth_kbps'], dtype=np.int64)
+    wan = np.array(columns['location']) == 'wan'
+    
+    reasons = {}
+    for session_reasons in columns['transcode_reasons']:
+        for reason in session_reasons:
+            reasons[reason] = reasons.get(reason, 0) + 1
+    
+    transcodes = int(transcoding.sum())
+    return {
+        'sessions': len(transcoding),
+        'transcodes': transcodes,
+        'direct': int(len(transcoding) - transcodes),
+        'hw_transcodes': int(hardware.sum()),
+        'sw_transcodes': int(transcodes - hardware.sum()),
+        'hw_share': round(float(hardware.sum()) / transcodes, 3) if transcodes else None,
+        'throttled': int(np.array(columns['throttled'], dtype=bool).sum()),
+        'total_bandwidth_kbps': int(bandwidth.sum()),
+        'wan_bandwidth_kbps': int(bandwidth[wan].sum()),
+        'lan_bandwidth_kbps': int(bandwidth[~wan].sum()),
+        'transcode_reasons': dict(sorted(reasons.items(), key=lambda item: -item[1]))
+    }
+
+def get_session_snapshot(connections=None, connect=None):
+    """Every playing session on every server, fetched in parallel, as flat columns plus aggregates.
+    connect(server_key, server_config) opens a missing connection (the sampler passes its own, timed one)."""
+    connections = {} if connections is None else connections
+    connect = connect or (lambda server_key, server_config: connect_server(server_config))
+    server_list = list(iter_server_configs())
+    
+    def fetch(server):
+        server_group, server_type, server_config = server
+        server_key = f"{server_group}.{server_type}"
+        try:
+            plex = connections.get(server_key)
+            if plex is None:
+                plex = connections[server_key] = connect(server_key, server_config)
+            return server_key, get_server_sessions(server_config, plex), None
+        except Exception as e:
+            print(f"[ERROR] Session snapshot failed for {server_config['name']}: {e}", file=sys.stderr)
+            connections.pop(server_key, None)
+            return server_key, [], str(e)
+    
+    with ThreadPoolExecutor(max_workers=len(server_list)) as executor:
+        results = list(executor.map(fetch, server_list))
+    
+    columns = {name: [] for name in SESSION_COLUMNS}
+    servers = {}
+    for server_key, rows, error in results:
+        servers[server_key] = {'success': error is None, 'sessions': len(rows)}
+        if error:
+            servers[server_key]['error'] = error
+        for row in rows:
+            for name in SESSION_COLUMNS:
+                columns[name].append(row[name])
+    
+    return {
+        'captured_at': datetime.now().isoformat(),
+        'servers': servers,
+        'columns': columns,
+        'aggregates': summarize_sessions(columns)
+    }
+
+def fetch_bandwidth(plex, since_ts):
+    """Per-account/device bandwidth entries newer than since_ts, plus their account and device names"""
+    container = plex.query('/statistics/bandwidth', params={'timespan': BANDWIDTH_TIMESPAN, 'at>': since_ts})
+    accounts = {int(element.get('id')): element.get('name') for element in container.iter('Account')}
+    devices = {int(element.get('id')): element.get('name') or element.get('platform')
+               for element in container.iter('Device')}
+    
+    rows = [(int(element.get('at')), int(element.get('accountID') or 0), int(element.get('deviceID') or 0),
+             element.get('lan') in ('1', 'true'), int(element.get('bytes') or 0))
+            for element in container.iter('StatisticsBandwidth')]
+    # The at> filter keeps the transfer small; re-check in case the server ignores it
+    rows = sorted(row for row in rows if row[0] > since_ts)
+    return rows, accounts, devices
+
+def group_sum(keys, values):
+    """Sum values per distinct key row; returns (unique keys, sums)"""
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    return unique, np.bincount(inverse.ravel(), weights=values, minlength=len(unique))
+
+def summarize_bandwidth(rows, names, bucket_seconds):
+    """Per-server and per-user throughput series (bytes and kbps per bucket) from stored entries"""
+    if len(rows) == 0:
+        return {'bucket_seconds': bucket_seconds, 'server': [], 'users': {}, 'devices': {}}
+    
+    buckets = rows['ts'] // bucket_seconds * bucket_seconds
+    byte_counts = rows['bytes'].astype(np.float64)
+    lan = rows['lan'].astype(np.int64)
+    to_kbps = 8 / 1000 / bucket_seconds
+    accounts, devices = names.get('accounts', {}), names.get('devices', {})
+    
+    # Server series: bucket x (wan, lan)
+    keys, sums = group_sum(np.column_stack((buckets, lan)), byte_counts)
+    series = {}
+    for (bucket, is_lan), total in zip(keys.tolist(), sums.tolist()):
+        entry = series.setdefault(bucket, {'ts': bucket, 'lan_bytes': 0, 'wan_bytes': 0})
+        entry['lan_bytes' if is_lan else 'wan_bytes'] = int(total)
+    server = [dict(entry, kbps=round((entry['lan_bytes'] + entry['wan_bytes']) * to_kbps, 1))
+              for _, entry in sorted(series.items())]
+    
+    # Per-user series: account x bucket x (wan, lan)
+    users = {}
+    keys, sums = group_sum(np.column_stack((rows['account'], buckets, lan)), byte_counts)
+    for (account, bucket, is_lan), total in zip(keys.tolist(), sums.tolist()):
+        user = users.setdefault(accounts.get(str(account), str(account)),
+                                {'account_id': account, 'lan_bytes': 0, 'wan_bytes': 0, 'series': {}})
+        field = 'lan_bytes' if is_lan else 'wan_bytes'
+        user[field] += int(total)
+        user['series'].setdefault(bucket, {'ts': bucket, 'lan_bytes': 0, 'wan_bytes': 0})[field] = int(total)
+    for user in users.values():
+        user['series'] = [dict(entry, kbps=round((entry['lan_bytes'] + entry['wan_bytes']) * to_kbps, 1))
+                          for _, entry in sorted(user['series'].items())]
+    
+    # Per-device totals
+    keys, sums = group_sum(np.column_stack((rows['account'], rows['device'], lan)), byte_counts)
+    device_totals = {}
+    for (account, device, is_lan), total in zip(keys.tolist(), sums.tolist()):
+        entry = device_totals.setdefault(f"{account}:{device}", {
+            'user': accounts.get(str(account), str(account)),
+            'device': devices.get(str(device), str(device)),
+            'lan_bytes': 0, 'wan_bytes': 0
+        })
+        entry['lan_bytes' if is_lan else 'wan_bytes'] += int(total)
+    
+    return {'bucket_seconds': bucket_seconds, 'server': server, 'users': users,
+            'devices': list(device_totals.values())}
+
+def collect_all_bandwidth(minutes, bucket_seconds=BANDWIDTH_BUCKET, port=DAEMON_PORT):
+    """Bandwidth summary for every server from the sampler daemon, which owns the bandwidth store
+    and fetches only the entries newer than it has seen. Without the daemon nothing would persist
+    the high-water mark, so every one-shot run would refetch the same history; fail instead."""
+    try:
+        response = requests.get(f"http://{DAEMON_HOST}:{port}/bandwidth",
+                                params={'minutes': minutes, 'bucket': bucket_seconds}, timeout=30)
+    except requests.ConnectionError:
+        raise RuntimeError(f"Resource sampler daemon not running on {DAEMON_HOST}:{port} "
+                           f"(start it with --daemon; it collects bandwidth incrementally)")
+    response.raise_for_status()
+    
+    report = {server_group: {} for server_group in PLEX_SERVERS}
+    for server_key, summary in response.json().items():
+        server_group, server_type = server_key.split('.', 1)
+        report.setdefault(server_group, {})[server_type] = summary
+    return report
+
+class LatencyHistograms:
+    """Cumulative Plex API response-time histograms per (server, endpoint)"""
+    
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = np.array(buckets)
+        self.lock = threading.Lock()
+        self.series = {}
+    
+    def observe(self, server_key, endpoint, seconds):
+        with self.lock:
+            entry = self.series.setdefault((server_key, endpoint), [np.zeros(len(self.buckets), dtype=np.int64), 0.0, 0])
+            entry[0][np.searchsorted(self.buckets, seconds):] += 1
+            entry[1] += seconds
+            entry[2] += 1
+    
+    def timed_session(self, server_key):
+        """requests session that records every Plex API call's latency"""
+        def record(response, *args, **kwargs):
+            self.observe(server_key, api_endpoint(response.request.path_url), response.elapsed.total_seconds())
+        session = requests.Session()
+        session.hooks['response'].append(record)
+        return session
+    
+    def snapshot(self):
+        with self.lock:
+            return {key: (counts.copy(), total, count) for key, (counts, total, count) in self.series.items()}
+
+def api_endpoint(path_url):
+    """Low-cardinality endpoint label: no query string, numeric ids (and batched id lists) collapsed"""
+    path = path_url.split('?', 1)[0]
+    return '/'.join(':id' if part.replace(',', '').isdigit() else part for part in path.split('/')) or '/'
+
+def format_labels(labels):
+    return '{' + ','.join(f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                          for name, value in labels.items()) + '}'
+
+def render_openmetrics(current, bandwidth_totals, latency):
+    """OpenMetrics text for the sampler's cached state; never touches Plex"""
+    lines = []
+    
+    def family(name, metric_type, help_text, samples):
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.append(f"# HELP {name} {help_text}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{format_labels(labels)} {value}")
+    
+    servers = [({'server': f"{server_group}.{server_type}", 'name': data.get('server_name', '')}, data)
+               for server_group, group_data in current.items() for server_type, data in group_data.items()]
+    
+    family('plex_up', 'gauge', 'Whether the last poll reached the server',
+           [('', labels, int(bool(data.get('success')))) for labels, data in servers])
+    for name, field, help_text in METRIC_GAUGES:
+        samples = [('', labels, data['resources'][field]) for labels, data in servers
+                   if data.get('success') and isinstance(data.get('resources', {}).get(field), (int, float))]
+        family(name, 'gauge', help_text, samples)
+    family('plex_resources_measured', 'gauge', 'Whether CPU/memory came from Plex rather than an estimate',
+           [('', labels, int(bool(data.get('resources', {}).get('found_real_data')))) for labels, data in servers
+            if data.get('success')])
+    
+    family('plex_bandwidth_bytes', 'counter', 'Bytes streamed since the sampler started',
+           [('_total', {'server': server_key, 'location': location}, int(total))
+            for server_key, totals in sorted(bandwidth_totals.items()) for location, total in sorted(totals.items())])
+    
+    histogram_samples = []
+    for (server_key, endpoint), (counts, total, count) in sorted(latency.snapshot().items()):
+        labels = {'server': server_key, 'endpoint': endpoint}
+        for bound, bucket_count in zip(latency.buckets.tolist(), counts.tolist()):
+            histogram_samples.append(('_bucket', dict(labels, le=repr(float(bound))), bucket_count))
+        histogram_samples.append(('_bucket', dict(labels, le='+Inf'), count))
+        histogram_samples.append(('_count', labels, count))
+        histogram_samples.append(('_sum', labels, round(total, 6)))
+    family('plex_api_request_duration_seconds', 'histogram', 'Plex API response time per endpoint', histogram_samples)
+    
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+def load_servers_file(path):
+    """Replace the built-in server list, e.g. to point the monitor at a local mock PMS"""
+    with open(path) as f:
+        servers = json.load(f)
+    PLEX_SERVERS.clear()
+    PLEX_SERVERS.update(servers)
+
+def load_users_file(path):
+    """Users export (JSON list of {name, plex_email, plex_username, tags, device_count}); '-' reads stdin"""
+    if path == '-':
+        return json.load(sys.stdin)
+    with open(path) as f:
+        return json.load(f)
+
+def user_group(user):
+    """Server group from a user's Plex tags, or None if untagged"""
+    tags = user.get('tags') or []
+    if isinstance(tags, str):
+        tags = json.loads(tags or '[]')
+    return next((PLACEMENT_GROUP_TAGS[tag] for tag in tags if tag in PLACEMENT_GROUP_TAGS), None)
+
+def user_identities(user):
+    """Lowercased Plex names a user can appear under in sessions (plex_username / plex_email only;
+    the app's display name and contact email aren't unique or tied to a Plex account)"""
+    return [str(user[field]).lower() for field in ('plex_username', 'plex_email') if user.get(field)]
+
+def user_label(user):
+    return user.get('name') or next(iter(user_identities(user)), None)
+
+def server_load_profile(store, model, window_minutes):
+    """(peak CPU, peak/average session ratio, per-direct-play cost, per-transcode cost) for one server"""
+    rows = store.since(window_minutes)
+    cpu = rows['host_cpu'] if 'host_cpu' in rows.dtype.names else rows['host_cpu_max']
+    sessions = rows['sessions'] if 'sessions' in rows.dtype.names else rows['sessions_avg']
+    peak_cpu = float(np.nanpercentile(cpu, PLACEMENT_PEAK_PERCENTILE)) if np.any(~np.isnan(cpu)) else 0.0
+    
+    peak_factor = 1.0
+    if np.any(sessions > 0):
+        peak_factor = max(1.0, float(np.nanpercentile(sessions, PLACEMENT_PEAK_PERCENTILE) / np.nanmean(sessions)))
+    
+    if model.ready:
+        # Transcode cost blends sw/hw by how often this server actually used hardware
+        transcodes = rows['transcodes'] if 'transcodes' in rows.dtype.names else rows['transcodes_avg']
+        hw_transcodes = rows['hw_transcodes'] if 'hw_transcodes' in rows.dtype.names else rows['hw_transcodes_avg']
+        total = np.nansum(transcodes)
+        hw_share = float(np.nansum(hw_transcodes) / total) if total > 0 else 0.0
+        direct_cost = max(0.0, float(model.coef[1, 0]))
+        transcode_cost = max(0.0, float((1 - hw_share) * model.coef[2, 0] + hw_share * model.coef[3, 0]))
+    else:
+        # Same per-session figures as estimate_resources_from_sessions
+        direct_cost, transcode_cost = 2.0, 15.0
+    return peak_cpu, peak_factor, direct_cost, transcode_cost
+
+def build_placement_inputs(users, data_dir=MONITOR_DATA_DIR, window_minutes=PLACEMENT_WINDOW_DAYS * 24 * 60,
+                           refresh=True):
+    """Arrays for placement: group loads (G x T), per-user per-group costs (U x G x T), current groups.
+    Each user's average concurrency comes from the play history (and the sampler's observed streams)
+    over the window, their transcode ratio from the observed streams."""
+    groups = list(PLEX_SERVERS)
+    types = ('regular', 'fourk')
+    window_seconds = window_minutes * 60
+    since = int(time.time()) - window_seconds
+    
+    loads = np.zeros((len(groups), len(types)))
+    direct_cost = np.zeros_like(loads)
+    transcode_cost = np.zeros_like(loads)
+    peak_factor = np.ones_like(loads)
+    servers, names = [], {}
+    for server_group, server_type, server_config in iter_server_configs():
+        server_key = f"{server_group}.{server_type}"
+        g, t = groups.index(server_group), types.index(server_type)
+        store = ServerStore(server_key, data_dir=data_dir, read_only=True)
+        model = CapacityModel(capacity_model_path(server_key, data_dir))
+        loads[g, t], peak_factor[g, t], direct_cost[g, t], transcode_cost[g, t] = server_load_profile(
+            store, model, window_minutes)
+        plays, accounts = stored_plays(store, server_config, since, refresh)
+        names.update(accounts)
+        servers.append((g, t, plays, np.array(store.streams.since(since))))
+    
+    # Viewing seconds per server (G x T) and account; the extra last column is the empty slot for
+    # users whose account never shows up
+    accounts = np.unique(np.concatenate([np.r_[plays['account'], streams['account']]
+                                         for _, _, plays, streams in servers] or [np.zeros(0, dtype=np.int64)]))
+    shape = (len(groups), len(types), len(accounts) + 1)
+    play_seconds = np.zeros(shape)
+    stream_seconds = np.zeros(shape)
+    transcode_seconds = np.zeros(shape)
+    for g, t, plays, streams in servers:
+        play_seconds[g, t, :-1] = np.bincount(np.searchsorted(accounts, plays['account']),
+                                              weights=plays['duration'], minlength=len(accounts))
+        index = np.searchsorted(accounts, streams['account'])
+        durations = (streams['ts'] - streams['start']).astype(np.float64)
+        stream_seconds[g, t, :-1] = np.bincount(index, weights=durations, minlength=len(accounts))
+        transcode_seconds[g, t, :-1] = np.bincount(index, weights=durations * streams['transcode'],
+                                                   minlength=len(accounts))
+    
+    # Users to accounts by plex_username / plex_email against the servers' account names
+    by_name = {name.lower(): int(account) for account, name in names.items() if name}
+    account_index = {account: i for i, account in enumerate(accounts.tolist())}
+    picked = np.array([next((account_index[by_name[identity]] for identity in user_identities(user)
+                             if by_name.get(identity) in account_index), len(accounts)) for user in users],
+                      dtype=np.int64)
+    
+    # Per-user stream profile per server type over their own group (every group for untagged users).
+    # Plays and observed streams are the same viewing seen twice, so take the larger of the two.
+    current = np.array([groups.index(group) if group in groups else -1 for group in map(user_group, users)],
+                       dtype=np.int64)
+    allowed = ((current[None] == np.arange(len(groups))[:, None]) | (current[None] < 0)).astype(np.float64)
+    over_allowed = lambda seconds: np.einsum('gu,gtu->ut', allowed, seconds[:, :, picked])
+    streams = over_allowed(np.maximum(play_seconds, stream_seconds)) / window_seconds
+    user_stream_seconds = over_allowed(stream_seconds)
+    # Users the sampler never saw streaming get the server type's overall transcode ratio
+    type_stream_seconds = stream_seconds.sum(axis=(0, 2))
+    type_ratio = np.divide(transcode_seconds.sum(axis=(0, 2)), type_stream_seconds,
+                           out=np.zeros(len(types)), where=type_stream_seconds > 0)
+    transcode_ratio = np.divide(over_allowed(transcode_seconds), user_stream_seconds,
+                                out=np.tile(type_ratio, (len(users), 1)), where=user_stream_seconds > 0)
+    
+    # Expected contribution at peak: average concurrency scaled up to the server's peak/average ratio
+    per_stream = (1 - transcode_ratio)[:, None, :] * direct_cost[None] + transcode_ratio[:, None, :] * transcode_cost[None]
+    costs = streams[:, None, :] * peak_factor[None] * per_stream
+    
+    # A newcomer is assumed to look like the average active user
+    active = streams.sum(axis=1) > 0
+    newcomer = costs[active].mean(axis=0) if active.any() else (direct_cost + transcode_cost) / 2
+    
+    # Share counts: users shared on a group but idle in the window can come back, so each reserves
+    # a fraction of a newcomer's cost on top of the measured peak
+    idle = np.bincount(current[(current >= 0) & ~active], minlength=len(groups))
+    reserve = idle[:, None] * PLACEMENT_IDLE_SHARE * newcomer
+    return groups, types, loads, reserve, costs, current, newcomer
+
+def plan_rebalance(loads, costs, current, max_moves=PLACEMENT_MAX_MOVES, min_gain=PLACEMENT_MIN_GAIN):
+    """Greedy moves that lower the highest projected peak the most, stopping when no move gains min_gain.
+    Each step scores every (user on the hottest group, destination group) pair at once."""
+    loads = loads.copy()
+    assigned = current.copy()
+    moved = np.zeros(len(current), dtype=bool)
+    moves = []
+    users = np.arange(len(current))
+    
+    for _ in range(max_moves):
+        group_peaks = loads.max(axis=1)
+        hottest = int(np.argmax(group_peaks))
+        candidates = users[(assigned == hottest) & ~moved]
+        if len(candidates) == 0:
+            break
+        
+        # New peaks of the source (U x 1) and each destination (U x G) after moving each candidate
+        source_after = (loads[hottest][None] - costs[candidates, hottest]).max(axis=1)
+        dest_after = (loads[None] + costs[candidates]).max(axis=2)
+        others = np.where(np.arange(len(loads)) == hottest, -np.inf, group_peaks)
+        
+        # Highest peak anywhere if user u moves to group h (the peak of a third group is unchanged)
+        rest = np.array([np.max(np.delete(others, h)) if len(loads) > 2 else -np.inf for h in range(len(loads))])
+        objective = np.maximum(np.maximum(source_after[:, None], dest_after), rest[None])
+        objective[:, hottest] = np.inf
         
-        # Get regular server resources
-        if 'regular' in servers:
-            regular_resources = get_server_resource_usage(servers['regular'])
-            all_resources[server_group]['regular'] = regular_resources
+        u, h = np.unravel_index(np.argmin(objective), objective.shape)
+        gain = group_peaks.max() - objective[u, h]
+        if gain < min_gain:
+            break
+        
+        user = candidates[u]
+        loads[hottest] -= costs[user, hottest]
+        loads[h] += costs[user, h]
+        assigned[user] = h
+        moved[user] = True
+        moves.append((int(user), hottest, int(h), float(gain)))
+    return moves, loads
+
+def get_placement_report(users, rebalance=False, data_dir=MONITOR_DATA_DIR):
+    """Recommend a server group for every untagged user and optionally a rebalance plan for tagged ones"""
+    groups, types, measured, reserve, costs, current, newcomer = build_placement_inputs(users, data_dir)
+    round_loads = lambda values: {group: {server_type: round(float(value), 1) for server_type, value in zip(types, row)}
+                                  for group, row in zip(groups, values)}
+    # Scores start from the measured peak plus the reserve for each group's idle shared users
+    loads = measured + reserve
+    
+    report = {
+        'groups': {group: {'users': int((current == g).sum()),
+                           'peak_cpu_percent': round_loads(measured)[group],
+                           'idle_share_reserve_percent': round_loads(reserve)[group]} for g, group in enumerate(groups)},
+        'new_user_recommendation': groups[int(np.argmin((loads + newcomer).max(axis=1)))],
+        'recommendations': []
+    }
+    
+    # Untagged users: the group whose highest projected server peak is lowest
+    unplaced = np.flatnonzero(current < 0)
+    if len(unplaced):
+        projected = (loads[None] + costs[unplaced]).max(axis=2)
+        best = np.argmin(projected, axis=1)
+        for i, g, peaks in zip(unplaced.tolist(), best.tolist(), projected.tolist()):
+            report['recommendations'].append({
+                'user': user_label(users[i]),
+                'recommended_group': groups[g],
+                'projected_peak_cpu_percent': {group: round(peak, 1) for group, peak in zip(groups, peaks)}
+            })
+    
+    if rebalance:
+        moves, balanced = plan_rebalance(loads, costs, current)
+        report['rebalance'] = {
+            'moves': [{'user': user_label(users[user]),
+                       'from': groups[source], 'to': groups[dest], 'peak_reduction': round(gain, 1)}
+                      for user, source, dest, gain in moves],
+            'projected_peak_cpu_percent': round_loads(balanced)
+        }
+    return report
+
+def fetch_plays(plex, since_ts, page_size=PLAY_PAGE_SIZE):
+    """Play history rows (PLAY_DTYPE, oldest first) recorded after since_ts, with durations from batched metadata"""
+    entries = []
+    start = 0
+    while True:
+        container = plex.query(
+            '/status/sessions/history/all',
+            headers={'X-Plex-Container-Start': str(start), 'X-Plex-Container-Size': str(page_size)},
+            params={'sort': 'viewedAt:desc', 'viewedAt>': int(since_ts)}
+        )
+        page = [(int(element.get('viewedAt') or 0), int(element.get('accountID') or 0),
+                 int(element.get('deviceID') or 0), element.get('ratingKey')) for element in container]
+        # The viewedAt> filter keeps the transfer small; re-check in case the server ignores it
+        fresh = [entry for entry in page if entry[0] > since_ts]
+        entries += fresh
+        if len(page) < page_size or len(fresh) < len(page):
+            break
+        start += page_size
+    
+    rating_keys = sorted({entry[3] for entry in entries if entry[3]})
+    durations = {}
+    for i in range(0, len(rating_keys), PLAY_METADATA_BATCH):
+        batch = rating_keys[i:i + PLAY_METADATA_BATCH]
+        try:
+            for element in plex.query(f"/library/metadata/{','.join(batch)}"):
+                durations[element.get('ratingKey')] = int(element.get('duration') or 0) // 1000
+        except Exception as e:
+            # Deleted items (the whole batch missing) just count as zero length
+            print(f"[WARNING] Duration lookup failed for {len(batch)} items: {e}", file=sys.stderr)
+    return sorted((ts, account, device, durations.get(key, 0)) for ts, account, device, key in entries)
+
+def fetch_account_names(plex):
+    """{account id: name} for the server's accounts (ids as strings, like the stored names)"""
+    return {element.get('id'): element.get('name') for element in plex.query('/accounts').iter('Account')}
+
+def stored_plays(store, server_config, since, refresh=True):
+    """A server's plays since a timestamp (as a copy) and its account names: the daemon's ring, read-only,
+    plus with refresh the plays newer than its last fetch and the current names, pulled live and kept in memory"""
+    plays = store.plays.since(since)
+    names = dict(store.bandwidth_names.get('accounts', {}))
+    if refresh:
+        try:
+            plex = connect_server(server_config)
+            names.update(fetch_account_names(plex))
+            fresh = fetch_plays(plex, max(store.plays.last_ts, since))
+            plays = np.concatenate([plays, np.array(fresh, dtype=PLAY_DTYPE)])
+            print(f"[PLAYS] {server_config['name']}: {len(fresh)} plays newer than the store", file=sys.stderr)
+        except Exception as e:
+            print(f"[ERROR] Play history fetch failed for {server_config['name']}: {e}", file=sys.stderr)
+    return np.array(plays), names
+
+def merge_intervals(keys, starts, ends):
+    """Union of overlapping [start, end) intervals per key, as (keys, starts, ends) of the merged runs"""
+    if len(keys) == 0:
+        return keys, starts, ends
+    # Lay the keys end to end on one time axis: one sort key, and a running maximum that never crosses keys
+    base = int(min(starts.min(), ends.min()))
+    span = int(max(starts.max(), ends.max())) - base + 1
+    unique_keys, rank = np.unique(keys, return_inverse=True)
+    offset = rank.ravel().astype(np.int64) * span - base
+    order = np.argsort(offset + starts)
+    rank, starts, ends, offset = rank.ravel()[order], starts[order], ends[order], offset[order]
+    reach = np.maximum.accumulate(offset + ends)
+    first = np.flatnonzero(np.r_[True, (offset + starts)[1:] > reach[:-1]])
+    return unique_keys[rank[first]], starts[first], np.maximum.reduceat(ends, first)
+
+def interval_peaks(groups, starts, ends, n):
+    """Most overlapping [start, end) intervals per group (0..n-1) and when that peak began, from one sorted sweep"""
+    peaks = np.zeros(n, dtype=np.int64)
+    peak_at = np.zeros(n, dtype=np.int64)
+    keep = ends > starts
+    groups, starts, ends = groups[keep], starts[keep], ends[keep]
+    if len(groups) == 0:
+        return peaks, peak_at
+    
+    times = np.r_[starts, ends]
+    event_groups = np.r_[groups, groups].astype(np.int64)
+    is_start = np.r_[np.ones(len(starts), dtype=np.int64), np.zeros(len(ends), dtype=np.int64)]
+    # One sort key: group, then time, then ends before starts at the same instant (back-to-back doesn't overlap)
+    base = int(times.min())
+    span = int(times.max()) - base + 1
+    order = np.argsort((event_groups * span + (times - base)) * 2 + is_start)
+    event_groups, times = event_groups[order], times[order]
+    levels = np.cumsum(is_start[order] * 2 - 1)
+    
+    # Every group's intervals all close, so the running level is back to 0 at each group boundary
+    first = np.flatnonzero(np.r_[True, event_groups[1:] != event_groups[:-1]])
+    group_peaks = np.maximum.reduceat(levels, first)
+    peaks[event_groups[first]] = group_peaks
+    at_peak = np.flatnonzero(levels == np.repeat(group_peaks, np.diff(np.r_[first, len(levels)])))
+    peak_groups, index = np.unique(event_groups[at_peak], return_index=True)
+    peak_at[peak_groups] = times[at_peak[index]]
+    return peaks, peak_at
+
+def window_distinct(groups, items, starts, ends, window, n):
+    """Most distinct items (devices, addresses) per group active within any `window` seconds"""
+    # An item counts for the window ending at x when it was active somewhere in [x - window, x]
+    pairs = groups.astype(np.int64) << 32 | items.astype(np.int64)
+    pairs, merged_starts, merged_ends = merge_intervals(pairs, starts, ends + window)
+    return interval_peaks(pairs >> 32, merged_starts, merged_ends, n)[0]
+
+def get_sharing_report(users=None, days=SHARING_DAYS, refresh=True, data_dir=MONITOR_DATA_DIR):
+    """Per-account peak concurrent streams and distinct devices/addresses per window from the sampler's
+    stream observations and the servers' play history, flagged against each user's device_count.
+    The daemon's rings are read-only here; plays newer than its last fetch are pulled live and kept in memory."""
+    now = int(time.time())
+    since = now - days * 86400
+    stream_parts, play_parts, names = [], [], {}
+    
+    for index, (server_group, server_type, server_config) in enumerate(iter_server_configs()):
+        server_key = f"{server_group}.{server_type}"
+        store = ServerStore(server_key, data_dir=data_dir, read_only=True)
+        plays, accounts = stored_plays(store, server_config, since, refresh)
+        stream_parts.append(np.array(store.streams.since(since)))
+        # PMS device ids are per server
+        plays['device'] |= index << 24
+        play_parts.append(plays)
+        names.update(accounts)
+    
+    streams = np.concatenate(stream_parts) if stream_parts else np.zeros(0, dtype=STREAM_DTYPE)
+    plays = np.concatenate(play_parts) if play_parts else np.zeros(0, dtype=PLAY_DTYPE)
+    accounts = np.unique(np.r_[streams['account'], plays['account']])
+    n = len(accounts)
+    stream_groups = np.searchsorted(accounts, streams['account'])
+    play_groups = np.searchsorted(accounts, plays['account'])
+    play_starts = plays['ts'] - plays['duration']
+    
+    # Observed streams and recorded plays are the same viewing seen twice, so take the larger of each
+    stream_peaks, stream_peak_at = interval_peaks(stream_groups, streams['start'], streams['ts'], n)
+    play_peaks, play_peak_at = interval_peaks(play_groups, play_starts, plays['ts'], n)
+    metrics = {
+        'peak_streams': np.maximum(stream_peaks, play_peaks),
+        'peak_at': np.where(stream_peaks >= play_peaks, stream_peak_at, play_peak_at)
+    }
+    wan = streams['address'] != 0
+    for label, seconds in SHARING_WINDOWS:
+        metrics[f"devices_{label}"] = np.maximum(
+            window_distinct(stream_groups, streams['device'], streams['start'], streams['ts'], seconds, n),
+            window_distinct(play_groups, plays['device'], play_starts, plays['ts'], seconds, n))
+        metrics[f"addresses_{label}"] = window_distinct(
+            stream_groups[wan], streams['address'][wan], streams['start'][wan], streams['ts'][wan], seconds, n)
+    
+    by_identity = {}
+    for user in users or []:
+        for identity in user_identities(user):
+            by_identity.setdefault(identity, user)
+    
+    values = {metric: array.tolist() for metric, array in metrics.items()}
+    report_accounts = []
+    for i, account in enumerate(accounts.tolist()):
+        username = names.get(str(account))
+        user = by_identity.get(username.lower()) if username else None
+        entry = {'account_id': account, 'username': username, 'user': user.get('name') if user else None}
+        entry.update({metric: column[i] for metric, column in values.items()})
+        entry['device_count'] = int(user.get('device_count') or 1) if user else None
+        
+        entry['flags'] = []
+        if entry['device_count'] is not None:
+            if entry['peak_streams'] > entry['device_count']:
+                entry['flags'].append('concurrent_streams')
+            if entry['addresses_24h'] > entry['device_count']:
+                entry['flags'].append('addresses')
+            if entry['devices_24h'] > entry['device_count'] + SHARING_DEVICE_ALLOWANCE:
+                entry['flags'].append('devices')
+        report_accounts.append(entry)
+    
+    report_accounts.sort(key=lambda entry: (not entry['flags'], -entry['peak_streams']))
+    return {
+        'days': days,
+        'streams': int(len(streams)),
+        'plays': int(len(plays)),
+        'flagged': sum(1 for entry in report_accounts if entry['flags']),
+        'accounts': report_accounts
+    }
+
+def activity_kind(activity_type):
+    """Index into ACTIVITY_KINDS for a PMS activity type such as library.update.section"""
+    activity_type = activity_type or ''
+    if activity_type.startswith('butler'):
+        return ACTIVITY_KINDS.index('butler')
+    if 'analy' in activity_type or activity_type.startswith('media.generate'):
+        return ACTIVITY_KINDS.index('analysis')
+    if activity_type.startswith('library'):
+        return ACTIVITY_KINDS.index('scan')
+    return ACTIVITY_KINDS.index('other')
+
+def parse_activities(container):
+    """{uuid: activity dict} from a raw /activities MediaContainer"""
+    activities = {}
+    for element in container.iter('Activity'):
+        context = element.find('Context')
+        section = context.get('librarySectionID') if context is not None else None
+        activities[element.get('uuid')] = {
+            'id': zlib.crc32(element.get('uuid', '').encode()),
+            'type': element.get('type'),
+            'kind': ACTIVITY_KINDS[activity_kind(element.get('type'))],
+            'title': element.get('title'),
+            'subtitle': element.get('subtitle'),
+            'section': int(section) if section and section.isdigit() else -1,
+            'progress': float(element.get('progress') or 0)
+        }
+    return activities
+
+class ActivityTracker:
+    """Turns successive /activities snapshots of one server into start/progress/end events"""
+    
+    def __init__(self):
+        self.active = {}
+        self.recorded_progress = {}
+    
+    def update(self, activities, ts):
+        """Event rows (ACTIVITY_DTYPE) for what changed since the previous snapshot"""
+        rows = []
+        for uuid, activity in activities.items():
+            kind = ACTIVITY_KINDS.index(activity['kind'])
+            if uuid not in self.active:
+                event = ACTIVITY_EVENTS.index('start')
+            elif activity['progress'] - self.recorded_progress[uuid] >= ACTIVITY_PROGRESS_STEP:
+                event = ACTIVITY_EVENTS.index('progress')
+            else:
+                continue
+            self.recorded_progress[uuid] = activity['progress']
+            rows.append((ts, activity['id'], kind, event, activity['progress'], activity['section']))
+        
+        for uuid in set(self.active) - set(activities):
+            activity = self.active[uuid]
+            rows.append((ts, activity['id'], ACTIVITY_KINDS.index(activity['kind']), ACTIVITY_EVENTS.index('end'),
+                         100.0, activity['section']))
+            self.recorded_progress.pop(uuid, None)
+        
+        self.active = activities
+        return rows
+    
+    def scanning_sections(self):
+        return sorted({activity['section'] for activity in self.active.values()
+                       if activity['kind'] == 'scan' and activity['section'] >= 0})
+
+class StreamTracker:
+    """Turns successive session snapshots of one server into one row per stream once it ends"""
+    
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.active = {}
+    
+    def update(self, streams, ts):
+        """Stream rows (STREAM_DTYPE) for sessions that disappeared since the previous snapshot"""
+        seen = set()
+        for session_id, account, _, device, address, transcode in streams:
+            seen.add(session_id)
+            entry = self.active.get(session_id)
+            if entry is None:
+                self.active[session_id] = [ts, ts, account, device, address, transcode]
+            else:
+                entry[1] = ts
+                entry[5] |= transcode
+        
+        rows = []
+        for session_id in set(self.active) - seen:
+            start, last, account, device, address, transcode = self.active.pop(session_id)
+            # It was still playing at the last poll, so it ran until somewhere before this one
+            rows.append((last + self.interval, start, account, device, address, transcode))
+        return rows
+
+def active_at(rows, ts):
+    """Activity ids running at a timestamp, from a slice of the activity event ring"""
+    rows = rows[rows['ts'] <= ts]
+    if len(rows) == 0:
+        return []
+    # Last event per activity id (rows are oldest first, so look from the end)
+    ids, last = np.unique(rows['activity'][::-1], return_index=True)
+    last_events = rows['event'][::-1][last]
+    return ids[last_events != ACTIVITY_EVENTS.index('end')].tolist()
+
+def activity_rows_to_dicts(rows, names):
+    return [{
+        'ts': int(row['ts']),
+        'event': ACTIVITY_EVENTS[row['event']],
+        'kind': ACTIVITY_KINDS[row['kind']],
+        'progress': round(float(row['progress']), 1),
+        'section': int(row['section']) if row['section'] >= 0 else None,
+        **names.get(str(int(row['activity'])), {})
+    } for row in rows]
+
+def write_activity_state(path, trackers):
+    """Publish each server's running activities for other scripts (plex_statistics.py skips sections mid-scan)"""
+    if not path:
+        return
+    state = {
+        server_key: {
+            'updated_at': int(time.time()),
+            'scanning_sections': tracker.scanning_sections(),
+            'activities': list(tracker.active.values())
+        }
+        for server_key, tracker in trackers.items()
+    }
+    write_json_atomic(path, state)
+
+def get_all_activities():
+    """What every server is doing right now, fetched in parallel"""
+    server_list = list(iter_server_configs())
+    
+    def fetch(server):
+        server_config = server[2]
+        try:
+            return list(parse_activities(connect_server(server_config).query('/activities')).values())
+        except Exception as e:
+            print(f"[ERROR] Activity fetch failed for {server_config['name']}: {e}", file=sys.stderr)
+            return None
+    
+    report = {server_group: {} for server_group in PLEX_SERVERS}
+    with ThreadPoolExecutor(max_workers=len(server_list)) as executor:
+        for (server_group, server_type, _), activities in zip(server_list, executor.map(fetch, server_list)):
+            report[server_group][server_type] = activities
+    return report
+
+def build_samples(resource_data, last_ts):
+    """Turn one poll into sample rows newer than the last stored one"""
+    resources = resource_data.get('resources', {})
+    session_values = (resources.get('active_sessions', np.nan),
+                      resources.get('transcoding_sessions', np.nan),
+                      resources.get('direct_play_sessions', np.nan),
+                      resources.get('hw_transcoding_sessions', np.nan),
+                      resources.get('fourk_transcoding_sessions', np.nan))
+    nan_sessions = (np.nan,) * len(session_values)
+    
+    history = [entry for entry in resource_data.get('resource_history', []) if entry[0] > last_ts]
+    samples = [(at, *[np.nan if value is None else value for value in values], *nan_sessions)
+               for at, *values in history]
+    
+    # Session counts are only known for "now", so they go on the newest row
+    if samples:
+        samples[-1] = samples[-1][:5] + session_values
+    elif resource_data.get('success'):
+        samples.append((int(time.time()), np.nan, np.nan, np.nan, np.nan, *session_values))
+    
+    # Only the live poll counts as measured; a failed poll's zeroed counts would skew the model
+    if not resource_data.get('success'):
+        samples = [sample[:5] + nan_sessions for sample in samples]
+    return samples
+
+def rows_to_columns(rows):
+    """JSON-friendly sample or rollup rows as one list per field (NaN becomes null), converted column by column"""
+    columns = {}
+    for name in rows.dtype.names:
+        column = rows[name]
+        if column.dtype.kind == 'f' and np.isnan(column).any():
+            column = np.where(np.isnan(column), None, column)
+        columns[name] = column.tolist()
+    return columns
+
+class ResourceSampler:
+    """Polls every server on a fixed interval and keeps a sample store per server"""
+    
+    def __init__(self, interval=SAMPLE_INTERVAL, data_dir=MONITOR_DATA_DIR):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.servers = list(iter_server_configs())
+        self.executor = ThreadPoolExecutor(max_workers=len(self.servers))
+        self.connections = {}
+        self.stores = {}
+        self.models = {}
+        self.latency = LatencyHistograms()
+        self.detectors = {}
+        self.alert_path = os.path.join(data_dir, 'alerts.ndjson') if data_dir else None
+        self.bandwidth_totals = {}
+        self.trackers = {}
+        self.stream_trackers = {}
+        self.plays_fetched_at = {}
+        self.activity_state_path = os.path.join(data_dir, 'activities.json') if data_dir else None
+        self.current = {server_group: {} for server_group in PLEX_SERVERS}
+        for server_group, server_type, _ in self.servers:
+            server_key = f"{server_group}.{server_type}"
+            self.stores[server_key] = ServerStore(server_key, data_dir=data_dir)
+            self.models[server_key] = CapacityModel(capacity_model_path(server_key, data_dir))
+            self.detectors[server_key] = AnomalyDetector(server_key)
+            self.trackers[server_key] = ActivityTracker()
+            self.stream_trackers[server_key] = StreamTracker(interval)
+    
+    def connect(self, server_key, server_config):
+        """Long-lived connection whose requests feed the latency histograms"""
+        return connect_server(server_config, session=self.latency.timed_session(server_key))
+    
+    def poll_server(self, server_group, server_type, server_config):
+        """Sample one server over its long-lived connection"""
+        server_key = f"{server_group}.{server_type}"
+        plex = self.connections.get(server_key)
+        if plex is None:
+            try:
+                plex = self.connections[server_key] = self.connect(server_key, server_config)
+            except Exception as e:
+                print(f"[ERROR] Connection failed for {server_config['name']}: {e}", file=sys.stderr)
+                resource_data = connection_error_result(server_config, e)
+        if plex is not None:
+            resource_data = get_server_resource_usage(server_config, include_history=True, plex=plex,
+                                                      capacity_model=self.models[server_key])
+            if not resource_data.get('success'):
+                # Reconnect on the next poll
+                self.connections.pop(server_key, None)
+                plex = None
+        
+        store = self.stores[server_key]
+        bandwidth = None
+        activities = None
+        plays = None
+        if plex is not None:
+            try:
+                bandwidth = fetch_bandwidth(plex, store.bandwidth.last_ts)
+            except Exception as e:
+                print(f"[ERROR] Bandwidth fetch failed for {server_config['name']}: {e}", file=sys.stderr)
+            try:
+                activities = parse_activities(plex.query('/activities'))
+            except Exception as e:
+                print(f"[ERROR] Activity fetch failed for {server_config['name']}: {e}", file=sys.stderr)
+            # Play history for --sharing, every few minutes (the store is only written here)
+            if time.time() - self.plays_fetched_at.get(server_key, 0) >= PLAY_POLL_INTERVAL:
+                try:
+                    plays = fetch_plays(plex, max(store.plays.last_ts, int(time.time()) - SHARING_DAYS * 86400))
+                    self.plays_fetched_at[server_key] = time.time()
+                except Exception as e:
+                    print(f"[ERROR] Play history fetch failed for {server_config['name']}: {e}", file=sys.stderr)
+        
+        model = self.models[server_key]
+        detector = self.detectors[server_key]
+        with self.lock:
+            model_updated = False
+            alerts = []
+            for sample in build_samples(resource_data, store.last_ts):
+                store.append(sample)
+                row = dict(zip(SAMPLE_DTYPE.names, sample))
+                model_updated |= model.update(row)
+                alerts += detector.update(row)
+            tracker = self.trackers[server_key]
+            if activities is not None:
+                store.append_activities(tracker.update(activities, int(time.time())), activities)
+            # Attribute resource anomalies to whatever the server was busy with
+            for alert in alerts:
+                alert['activities'] = [f"{activity['type']}: {activity['title']}" for activity in tracker.active.values()]
+            append_alerts(alerts, self.alert_path)
+            if resource_data.get('success') and 'session_streams' in resource_data['resources']:
+                streams = resource_data['resources']['session_streams']
+                store.append_streams(self.stream_trackers[server_key].update(streams, int(time.time())),
+                                     {account: username for _, account, username, *_ in streams if username})
+            if plays:
+                store.append_plays(plays)
+            if bandwidth:
+                store.append_bandwidth(*bandwidth)
+                totals = self.bandwidth_totals.setdefault(server_key, {'lan': 0, 'wan': 0})
+                for _, _, _, lan, byte_count in bandwidth[0]:
+                    totals['lan' if lan else 'wan'] += byte_count
+            store.flush()
+            if model_updated:
+                model.save()
+            resource_data.pop('resource_history', None)
+            resource_data['sampled_at'] = datetime.now().isoformat()
+            self.current[server_group][server_type] = resource_data
+    
+    def poll_once(self):
+        """Sample every server once, concurrently"""
+        list(self.executor.map(lambda server: self.poll_server(*server), self.servers))
+        with self.lock:
+            write_activity_state(self.activity_state_path, self.trackers)
+    
+    def run(self):
+        """Poll forever on a fixed schedule"""
+        while True:
+            started = time.time()
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"[ERROR] Sampling pass failed: {e}", file=sys.stderr)
+            time.sleep(max(0, self.interval - (time.time() - started)))
+    
+    def query_current(self):
+        with self.lock:
+            return json.loads(json.dumps(self.current))
+    
+    def query_history(self, minutes, server_key=None, resolution='auto'):
+        with self.lock:
+            return {key: rows_to_columns(store.since(minutes, resolution))
+                    for key, store in self.stores.items() if server_key in (None, key)}
+    
+    def query_capacity(self):
+        with self.lock:
+            report = {key: describe_capacity_model(model) for key, model in self.models.items()}
+        for key, entry in report.items():
+            server_group, server_type = key.split('.', 1)
+            capacity = self.current.get(server_group, {}).get(server_type, {}).get('resources', {}).get('capacity')
+            if capacity:
+                entry['current'] = capacity
+        return report
+    
+    def query_bandwidth(self, minutes, server_key=None, bucket_seconds=BANDWIDTH_BUCKET):
+        with self.lock:
+            return {key: summarize_bandwidth(store.bandwidth_since(minutes), store.bandwidth_names, bucket_seconds)
+                    for key, store in self.stores.items() if server_key in (None, key)}
+    
+    def query_activities(self, minutes, server_key=None):
+        with self.lock:
+            return {key: {'active': list(self.trackers[key].active.values()),
+                          'events': activity_rows_to_dicts(store.activities_since(minutes), store.activity_names)}
+                    for key, store in self.stores.items() if server_key in (None, key)}
+    
+    def query_alerts(self):
+        with self.lock:
+            return {key: detector.active() for key, detector in self.detectors.items()}
+    
+    def query_metrics(self):
+        with self.lock:
+            return render_openmetrics(self.current, self.bandwidth_totals, self.latency)
+    
+    def query_sessions(self):
+        # Live fetch over the sampler's connections (dict ops are atomic across threads)
+        return get_session_snapshot(self.connections, self.connect)
+    
+    def query_peak(self, minutes, server_key=None):
+        peaks = {}
+        with self.lock:
+            for key, store in self.stores.items():
+                if server_key not in (None, key):
+                    continue
+                rows = store.since(minutes)
+                peaks[key] = {}
+                for metric in SAMPLE_METRICS:
+                    # Rollup rows keep the bucket maximum in <metric>_max
+                    values = rows[metric] if metric in rows.dtype.names else rows[f"{metric}_max"]
+                    if values.size == 0 or np.all(np.isnan(values)):
+                        peaks[key][metric] = None
+                        continue
+                    i = int(np.nanargmax(values))
+                    peak_ts = int(rows['ts'][i])
+                    events = store.activities.since(peak_ts - ACTIVITY_LOOKBACK)
+                    peaks[key][metric] = {
+                        'value': values[i].item(),
+                        'ts': peak_ts,
+                        # Background work running when the peak was sampled
+                        'activities': [store.activity_names.get(str(activity), {}).get('title')
+                                       for activity in active_at(events, peak_ts)]
+                    }
+        return peaks
+
+def positive_int_param(query, name, default):
+    """A positive integer query parameter; ValueError (answered with 400) for anything else"""
+    value = query.get(name, [str(default)])[0]
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number <= 0:
+        raise ValueError(f"{name} must be a positive integer, got {value!r}")
+    return number
+
+def make_request_handler(sampler):
+    """HTTP handler answering current/history/peak/activities/alerts/capacity/bandwidth/sessions queries and /metrics from the sampler's store"""
+    
+    class SamplerRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            try:
+                minutes = positive_int_param(query, 'minutes', 60)
+                bucket_seconds = positive_int_param(query, 'bucket', BANDWIDTH_BUCKET)
+            except ValueError as e:
+                self.send_payload(json.dumps({'error': str(e)}).encode(), 'application/json', 400)
+                return
+            server_key = query.get('server', [None])[0]
+            resolution = query.get('resolution', ['auto'])[0]
+            
+            if url.path == '/metrics':
+                self.send_payload(sampler.query_metrics().encode(), OPENMETRICS_CONTENT_TYPE)
+                return
+            elif url.path == '/current':
+                body = sampler.query_current()
+            elif url.path == '/history':
+                body = sampler.query_history(minutes, server_key, resolution)
+            elif url.path == '/peak':
+                body = sampler.query_peak(minutes, server_key)
+            elif url.path == '/activities':
+                body = sampler.query_activities(minutes, server_key)
+            elif url.path == '/alerts':
+                body = sampler.query_alerts()
+            elif url.path == '/capacity':
+                body = sampler.query_capacity()
+            elif url.path == '/bandwidth':
+                body = sampler.query_bandwidth(minutes, server_key, bucket_seconds)
+            elif url.path == '/sessions':
+                body = sampler.query_sessions()
+            else:
+                self.send_error(404)
+                return
             
-        # Get 4K server resources  
-        if 'fourk' in servers:
-            fourk_resources = get_server_resource_usage(servers['fourk'])
-            all_resources[server_group]['fourk'] = fourk_resources
+            self.send_payload(json.dumps(body).encode(), 'application/json')
+        
+        def send_payload(self, payload, content_type, status=200):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        
+        def log_message(self, format, *args):
+            pass
     
-    return all_resources
+    return SamplerRequestHandler
+
+def run_daemon(interval, port):
+    """Start the sampler loop and serve its data over local HTTP"""
+    sampler = ResourceSampler(interval=interval)
+    server = ThreadingHTTPServer((DAEMON_HOST, port), make_request_handler(sampler))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"[START] Resource sampler polling every {interval}s, serving on http://{DAEMON_HOST}:{port}", file=sys.stderr)
+    sampler.run()
 
 def main():
     """Main function to collect and output Plex server resource usage"""
+    parser = argparse.ArgumentParser(description='Plex Resource Monitor')
+    parser.add_argument('--daemon', action='store_true',
+                       help='Keep polling all servers and serve current/history/peak over local HTTP')
+    parser.add_argument('--interval', type=int, default=SAMPLE_INTERVAL,
+                       help=f'Seconds between polls in daemon mode (default: {SAMPLE_INTERVAL})')
+    parser.add_argument('--port', type=int, default=DAEMON_PORT,
+                       help=f'Daemon HTTP port on {DAEMON_HOST} (default: {DAEMON_PORT})')
+    parser.add_argument('--activities', action='store_true',
+                       help='Print the scans, analysis and butler tasks running on every server and exit')
+    parser.add_argument('--placement', action='store_true',
+                       help='Recommend server groups for untagged users from sampled load and play history (needs --users-file)')
+    parser.add_argument('--rebalance', action='store_true',
+                       help='With --placement, also plan the fewest moves that even out peak CPU')
+    parser.add_argument('--users-file',
+                       help="JSON list of users with name/plex_email/plex_username/tags/device_count ('-' for stdin)")
+    parser.add_argument('--sharing', action='store_true',
+                       help='Flag accounts whose concurrent streams, devices or addresses exceed their device_count '
+                            '(device_count from --users-file)')
+    parser.add_argument('--sharing-days', type=int, default=SHARING_DAYS,
+                       help=f'History analysed by --sharing (default: {SHARING_DAYS})')
+    parser.add_argument('--servers-file',
+                       help='JSON file replacing the built-in server list (e.g. plex_mock_pms.py --write-servers)')
+    parser.add_argument('--capacity', action='store_true',
+                       help='Print the capacity models fitted by the daemon and exit')
+    parser.add_argument('--sessions', action='store_true',
+                       help='Print a detailed snapshot of every playing session and exit')
+    parser.add_argument('--bandwidth', type=int, metavar='MINUTES',
+                       help='Print per-server/per-user throughput for the last MINUTES from the running daemon (see --port)')
+    parser.add_argument('--bucket', type=int, default=BANDWIDTH_BUCKET,
+                       help=f'Seconds per throughput bucket for --bandwidth (default: {BANDWIDTH_BUCKET})')
+    
+    args = parser.parse_args()
+    
+    if args.servers_file:
+        load_servers_file(args.servers_file)
+    
+    if args.daemon:
+        run_daemon(args.interval, args.port)
+        return
+    
+    if args.capacity:
+        print(json.dumps(get_capacity_report(), indent=2))
+        return
+    
+    if args.activities:
+        print(json.dumps(get_all_activities()))
+        return
+    
+    if args.placement:
+        if not args.users_file:
+            parser.error('--placement needs --users-file')
+        print(json.dumps(get_placement_report(load_users_file(args.users_file), args.rebalance)))
+        return
+    
+    if args.sharing:
+        users = load_users_file(args.users_file) if args.users_file else None
+        print(json.dumps(get_sharing_report(users, args.sharing_days)))
+        return
+    
+    if args.bandwidth:
+        try:
+            print(json.dumps(collect_all_bandwidth(args.bandwidth, args.bucket, args.port)))
+        except Exception as e:
+            print(f"[ERROR] Bandwidth report failed: {e}", file=sys.stderr)
+            print(json.dumps({'error': str(e)}))
+            sys.exit(1)
+        return
+    
+    if args.sessions:
+        snapshot = get_session_snapshot()
+        aggregates = snapshot['aggregates']
+        print(json.dumps(snapshot))
+        print(f"[SUMMARY] {aggregates['sessions']} sessions, {aggregates['transcodes']} transcoding "
+              f"({aggregates['hw_transcodes']} hw), {aggregates['total_bandwidth_kbps']} kbps out", file=sys.stderr)
+        return
+    
     try:
         print("[START] Searching for Plex resource monitoring endpoints...", file=sys.stderr)
         resources = get_all_server_resources()
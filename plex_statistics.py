@@ -7,7 +7,11 @@ Gets content counts from Plex servers using PlexAPI
 import json
 import sys
 import os
+import time
+import argparse
+import numpy as np
 from plexapi.server import PlexServer
+from plex_db_sink import statistics_rows, write_rows
 
 # Plex server configurations - ONLY PLEX 1 SERVERS (no doubling)
 PLEX_SERVERS = {
@@ -28,7 +32,641 @@ PLEX_SERVERS = {
     # REMOVED plex2 to avoid doubling counts
 }
 
-def get_library_stats(server_config):
+# Local storage for count history (kept next to the script unless overridden)
+DATA_DIR = os.environ.get(
+    'PLEX_STATS_DATA_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'plex_stats')
+)
+HISTORY_DIR = os.path.join(DATA_DIR, 'history')
+CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+
+# Running scans published by the resource monitor daemon (plex_resource_monitor.py --daemon)
+ACTIVITY_STATE_PATH = os.path.join(
+    os.environ.get('PLEX_MONITOR_DATA_DIR',
+                   os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'plex_monitor')),
+    'activities.json'
+)
+ACTIVITY_STATE_MAX_AGE = 300  # seconds; older state means the daemon isn't running
+
+# One fixed-width record per (run, series): 16 bytes on disk
+HISTORY_DTYPE = np.dtype([('ts', '<i8'), ('series', '<u4'), ('value', '<i4')])
+GROWTH_WINDOWS = (7, 30, 365)
+SECONDS_PER_DAY = 86400
+
+# Paged section listings; DEEP_LIBTYPES maps a section type to the items carrying media parts
+PAGE_SIZE = 500
+LIBTYPE_IDS = {'movie': 1, 'show': 2, 'season': 3, 'episode': 4, 'artist': 8, 'album': 9, 'track': 10}
+DEEP_LIBTYPES = {'movie': 'movie', 'show': 'episode', 'artist': 'track'}
+BITRATE_BUCKETS_KBPS = [1, 2000, 5000, 10000, 20000, 40000]
+BITRATE_BUCKET_LABELS = ['unknown', '<2M', '2-5M', '5-10M', '10-20M', '20-40M', '40M+']
+
+# 4K report: GUID normalization and resolution ordering
+LEGACY_GUID_PREFIXES = {
+    'com.plexapp.agents.imdb://': 'imdb://',
+    'com.plexapp.agents.themoviedb://': 'tmdb://',
+    'com.plexapp.agents.thetvdb://': 'tvdb://'
+}
+# Only external agent IDs identify the same title on two servers (local:// and agents.none ids are per server)
+EXTERNAL_GUID_PREFIXES = ('imdb://', 'tmdb://', 'tvdb://')
+RESOLUTION_RANK = {'sd': 1, '480': 1, '576': 2, '720': 3, '1080': 4, '2k': 5, '4k': 6}
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file and rename it over the target"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def history_paths(server_key):
+    """Record file and series index file for one server"""
+    return (os.path.join(HISTORY_DIR, f"{server_key}.bin"),
+            os.path.join(HISTORY_DIR, f"{server_key}.series.json"))
+
+def load_series_index(server_key):
+    """Get the list of [section, metric] pairs; list position is the series id"""
+    _, index_path = history_paths(server_key)
+    try:
+        with open(index_path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+def flatten_stats(stats):
+    """Turn one server's stats into (section, metric, value) triples"""
+    rows = []
+    for section_title, section_stats in stats.get('library_breakdown', {}).items():
+        for metric, value in section_stats.items():
+            if isinstance(value, int):
+                rows.append((section_title, metric, value))
+    for metric, value in stats.items():
+        if isinstance(value, int):
+            rows.append(('_totals', metric, value))
+    return rows
+
+def append_history(server_key, stats, ts=None):
+    """Append one collection run to the server's history file"""
+    ts = int(ts if ts is not None else time.time())
+    series_index = load_series_index(server_key)
+    series_ids = {tuple(pair): i for i, pair in enumerate(series_index)}
+    
+    rows = flatten_stats(stats)
+    records = np.empty(len(rows), dtype=HISTORY_DTYPE)
+    for i, (section_title, metric, value) in enumerate(rows):
+        key = (section_title, metric)
+        if key not in series_ids:
+            series_ids[key] = len(series_index)
+            series_index.append([section_title, metric])
+        records[i] = (ts, series_ids[key], value)
+    
+    # Index first, so a record never points at an unknown series
+    records_path, index_path = history_paths(server_key)
+    write_json_atomic(index_path, series_index)
+    with open(records_path, 'ab') as f:
+        records.tofile(f)
+    
+    print(f"  💾 Stored {len(records)} history points for {server_key}", file=sys.stderr)
+
+def load_history(server_key):
+    """Load a server's history sorted by (series, ts)"""
+    records_path, _ = history_paths(server_key)
+    if not os.path.exists(records_path):
+        return np.empty(0, dtype=HISTORY_DTYPE)
+    records = np.fromfile(records_path, dtype=HISTORY_DTYPE)
+    return records[np.lexsort((records['ts'], records['series']))]
+
+def compute_growth(records, now=None, windows=GROWTH_WINDOWS):
+    """Growth per series over each window, computed across all series at once"""
+    now = int(now if now is not None else time.time())
+    series, ts, values = records['series'], records['ts'], records['value'].astype(np.int64)
+    
+    # Series boundaries in the (series, ts) sorted arrays
+    ends = np.flatnonzero(np.r_[series[1:] != series[:-1], True])
+    starts = np.r_[0, ends[:-1] + 1]
+    series_ids = series[ends]
+    
+    growth = {'series': series_ids, 'latest': values[ends], 'latest_ts': ts[ends]}
+    for days in windows:
+        cutoff = now - days * SECONDS_PER_DAY
+        
+        # Baseline is the last point at or before the cutoff, else the oldest point
+        baseline_idx = starts.copy()
+        before = np.flatnonzero(ts <= cutoff)
+        if before.size:
+            before_series = series[before]
+            last_before = before[np.r_[before_series[1:] != before_series[:-1], True]]
+            baseline_idx[np.searchsorted(series_ids, series[last_before])] = last_before
+        
+        delta = values[ends] - values[baseline_idx]
+        span_days = (ts[ends] - ts[baseline_idx]) / SECONDS_PER_DAY
+        per_day = np.divide(delta, span_days, out=np.zeros(len(delta)), where=span_days > 0)
+        
+        growth[f"{days}d"] = {
+            'delta': delta,
+            'per_day': per_day,
+            'span_days': span_days,
+            'complete': ts[baseline_idx] <= cutoff
+        }
+    return growth
+
+def compute_daily_additions(records, days, now=None):
+    """Additions per calendar day (UTC) for every series over the last N days"""
+    now = int(now if now is not None else time.time())
+    first_day = now // SECONDS_PER_DAY - days
+    series, day = records['series'], records['ts'] // SECONDS_PER_DAY
+    values = records['value'].astype(np.int64)
+    
+    # Last value of each (series, day), then difference within each series
+    last_of_day = np.flatnonzero(np.r_[(series[1:] != series[:-1]) | (day[1:] != day[:-1]), True])
+    series, day, values = series[last_of_day], day[last_of_day], values[last_of_day]
+    same_series = np.r_[False, series[1:] == series[:-1]]
+    added = np.where(same_series, values - np.r_[0, values[:-1]], 0)
+    
+    keep = same_series & (day > first_day)
+    return series[keep], day[keep], added[keep]
+
+def get_history_growth(server_key, daily_days=None):
+    """Build the growth report for one server from its stored history"""
+    series_index = load_series_index(server_key)
+    records = load_history(server_key)
+    report = {}
+    if records.size == 0:
+        return report
+    
+    growth = compute_growth(records)
+    for i, series_id in enumerate(growth['series']):
+        section_title, metric = series_index[series_id]
+        entry = {
+            'latest': int(growth['latest'][i]),
+            'last_updated': int(growth['latest_ts'][i]),
+            'growth': {}
+        }
+        for days in GROWTH_WINDOWS:
+            window = growth[f"{days}d"]
+            entry['growth'][f"{days}d"] = {
+                'delta': int(window['delta'][i]),
+                'per_day': round(float(window['per_day'][i]), 2),
+                'span_days': round(float(window['span_days'][i]), 1),
+                'complete': bool(window['complete'][i])
+            }
+        report.setdefault(section_title, {})[metric] = entry
+    
+    if daily_days:
+        series, day, added = compute_daily_additions(records, daily_days)
+        for series_id, day_number, count in zip(series.tolist(), day.tolist(), added.tolist()):
+            section_title, metric = series_index[series_id]
+            date = time.strftime('%Y-%m-%d', time.gmtime(day_number * SECONDS_PER_DAY))
+            report[section_title][metric].setdefault('daily_additions', {})[date] = count
+    
+    return report
+
+def record_history(all_stats):
+    """Append every successful server result to the history store"""
+    for server_group, group_data in all_stats.items():
+        for server_type, server_data in group_data.items():
+            if server_data.get('success'):
+                try:
+                    append_history(f"{server_group}.{server_type}", server_data['stats'])
+                except Exception as e:
+                    print(f"⚠️ Could not store history for {server_group}.{server_type}: {e}", file=sys.stderr)
+
+def get_all_history_growth(daily_days=None):
+    """Growth report for all configured servers, without contacting Plex"""
+    report = {}
+    for server_group, servers in PLEX_SERVERS.items():
+        report[server_group] = {}
+        for server_type in servers:
+            report[server_group][server_type] = get_history_growth(f"{server_group}.{server_type}", daily_days)
+    return report
+
+def load_section_cache(server_key):
+    """Get the per-section cache (signature, counts, deep stats) for one server"""
+    try:
+        with open(os.path.join(CACHE_DIR, f"{server_key}.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_section_cache(server_key, cache):
+    """Persist the per-section cache for one server"""
+    write_json_atomic(os.path.join(CACHE_DIR, f"{server_key}.json"), cache)
+
+def load_scanning_sections(server_key):
+    """Section keys the resource monitor last saw being scanned on a server"""
+    try:
+        with open(ACTIVITY_STATE_PATH) as f:
+            state = json.load(f).get(server_key, {})
+    except (FileNotFoundError, ValueError):
+        return set()
+    if time.time() - state.get('updated_at', 0) > ACTIVITY_STATE_MAX_AGE:
+        return set()
+    return {str(key) for key in state.get('scanning_sections', [])}
+
+def section_signature(section):
+    """Value that changes whenever the section's content changes"""
+    attrib = section._data.attrib
+    # contentChangedAt is bumped on every content change; older servers only
+    # have updatedAt/scannedAt, which change more often but never miss a change
+    if attrib.get('contentChangedAt'):
+        return f"c{attrib.get('contentChangedAt')}"
+    return f"u{attrib.get('updatedAt')}:s{attrib.get('scannedAt')}"
+
+class MediaRecord:
+    """One media version of an item, holding only the fields the stats use"""
+    __slots__ = ('duration', 'bitrate', 'resolution', 'video_codec', 'audio_codec',
+                 'container', 'size', 'parts')
+    
+    def __init__(self, element):
+        attrib = element.attrib
+        parts = element.findall('Part')
+        self.duration = int(attrib.get('duration') or 0)
+        self.bitrate = int(attrib.get('bitrate') or 0)
+        self.resolution = attrib.get('videoResolution') or 'unknown'
+        self.video_codec = attrib.get('videoCodec') or 'none'
+        self.audio_codec = attrib.get('audioCodec') or 'none'
+        self.container = attrib.get('container') or 'unknown'
+        self.size = sum(int(part.attrib.get('size') or 0) for part in parts)
+        self.parts = len(parts)
+
+class SectionItem:
+    """One library item, holding only the fields the stats use"""
+    __slots__ = ('rating_key', 'guid', 'guids', 'title', 'year', 'child_count', 'leaf_count', 'media')
+    
+    def __init__(self, element):
+        attrib = element.attrib
+        self.rating_key = attrib.get('ratingKey')
+        self.guid = attrib.get('guid')
+        self.guids = [guid.attrib.get('id') for guid in element.findall('Guid')]
+        self.title = attrib.get('title')
+        self.year = int(attrib.get('year') or 0)
+        self.child_count = int(attrib.get('childCount') or 0)
+        self.leaf_count = int(attrib.get('leafCount') or 0)
+        self.media = [MediaRecord(media) for media in element.findall('Media')]
+
+class EpisodeRecord:
+    """Index numbers of one episode, for gap analysis"""
+    __slots__ = ('show_key', 'show_title', 'season', 'episode')
+    
+    def __init__(self, element):
+        attrib = element.attrib
+        self.show_key = int(attrib.get('grandparentRatingKey') or 0)
+        self.show_title = attrib.get('grandparentTitle')
+        self.season = int(attrib.get('parentIndex') or -1)
+        self.episode = int(attrib.get('index') or -1)
+
+class EpisodeMedia:
+    """Show and best media resolution of one episode, for show-level resolution"""
+    __slots__ = ('show_key', 'resolution')
+    
+    def __init__(self, element):
+        self.show_key = element.attrib.get('grandparentRatingKey')
+        self.resolution = best_resolution(media.attrib.get('videoResolution') for media in element.findall('Media'))
+
+def fetch_section_page(plex, section_key, libtype, start, size, include_guids=False):
+    """Fetch one page of a section listing as raw XML elements"""
+    container = plex.query(
+        f"/library/sections/{section_key}/all?type={LIBTYPE_IDS[libtype]}",
+        headers={'X-Plex-Container-Start': str(start), 'X-Plex-Container-Size': str(size)},
+        params={'includeGuids': 1} if include_guids else None
+    )
+    total_size = int(container.attrib.get('totalSize') or container.attrib.get('size') or 0)
+    return list(container), total_size
+
+def iter_section_pages(plex, section_key, libtype, page_size=PAGE_SIZE, include_guids=False, record=SectionItem):
+    """Yield a section's items one page of records (SectionItem by default) at a time"""
+    start = 0
+    while True:
+        elements, total_size = fetch_section_page(plex, section_key, libtype, start, page_size, include_guids)
+        if not elements:
+            return
+        yield [record(element) for element in elements]
+        start += page_size
+        if start >= total_size:
+            return
+
+def iter_section_items(plex, section_key, libtype, page_size=PAGE_SIZE, include_guids=False, record=SectionItem):
+    """Stream a section's items; only one page is held in memory at a time"""
+    for page in iter_section_pages(plex, section_key, libtype, page_size, include_guids, record):
+        yield from page
+
+def get_section_total(plex, section_key, libtype):
+    """Number of items of one type in a section, without listing them"""
+    _, total_size = fetch_section_page(plex, section_key, libtype, 0, 0)
+    return total_size
+
+def count_section(plex, section):
+    """Count the items in one section (the expensive part of a refresh)"""
+    if section.type == 'movie':
+        return {
+            'type': 'movie',
+            'count': get_section_total(plex, section.key, 'movie')
+        }
+    
+    if section.type == 'show':
+        # Count shows, seasons and episodes for this library in one streamed pass
+        show_count = 0
+        library_seasons = 0
+        library_episodes = 0
+        
+        for show in iter_section_items(plex, section.key, 'show'):
+            show_count += 1
+            library_seasons += show.child_count    # Seasons in this show
+            library_episodes += show.leaf_count    # Episodes in this show
+        
+        return {
+            'type': 'show',
+            'shows': show_count,
+            'seasons': library_seasons,
+            'episodes': library_episodes
+        }
+    
+    if section.type == 'artist':
+        return {
+            'type': 'artist',
+            'artists': get_section_total(plex, section.key, 'artist'),
+            'albums': get_section_total(plex, section.key, 'album')
+        }
+    
+    return None
+
+def new_deep_stats():
+    """Empty accumulator for a deep-stats pass"""
+    return {
+        'items': 0,
+        'parts': 0,
+        'total_bytes': 0,
+        'total_duration_ms': 0,
+        'resolution': {},
+        'video_codec': {},
+        'audio_codec': {},
+        'container': {},
+        'bitrate_kbps': {}
+    }
+
+def add_distribution(target, values):
+    """Merge value counts from one page into a running distribution"""
+    labels, counts = np.unique(values, return_counts=True)
+    for label, count in zip(labels.tolist(), counts.tolist()):
+        target[label] = target.get(label, 0) + count
+
+def accumulate_deep_page(deep, items):
+    """Aggregate one page of SectionItem records into the deep-stats accumulator"""
+    media = [record for item in items for record in item.media]
+    deep['items'] += len(items)
+    if not media:
+        return
+    
+    deep['parts'] += sum(record.parts for record in media)
+    deep['total_bytes'] += int(np.sum(np.fromiter((m.size for m in media), dtype=np.int64, count=len(media))))
+    deep['total_duration_ms'] += int(np.sum(np.fromiter((m.duration for m in media), dtype=np.int64, count=len(media))))
+    add_distribution(deep['resolution'], np.array([m.resolution for m in media]))
+    add_distribution(deep['video_codec'], np.array([m.video_codec for m in media]))
+    add_distribution(deep['audio_codec'], np.array([m.audio_codec for m in media]))
+    add_distribution(deep['container'], np.array([m.container for m in media]))
+    
+    bitrates = np.fromiter((m.bitrate for m in media), dtype=np.int64, count=len(media))
+    buckets = np.digitize(bitrates, BITRATE_BUCKETS_KBPS)
+    add_distribution(deep['bitrate_kbps'], np.array(BITRATE_BUCKET_LABELS)[buckets])
+
+def get_section_deep_stats(plex, section):
+    """Walk every media part in a section page by page and aggregate storage/runtime"""
+    libtype = DEEP_LIBTYPES.get(section.type)
+    deep = new_deep_stats()
+    if not libtype:
+        return deep
+    
+    for page in iter_section_pages(plex, section.key, libtype):
+        accumulate_deep_page(deep, page)
+    
+    deep['total_gb'] = round(deep['total_bytes'] / 1024 ** 3, 2)
+    deep['total_hours'] = round(deep['total_duration_ms'] / 3600000, 1)
+    return deep
+
+def normalize_guid(guid):
+    """Map legacy agent GUIDs onto the imdb:// / tmdb:// / tvdb:// forms; None for anything else"""
+    guid = guid.split('?', 1)[0]
+    for legacy, modern in LEGACY_GUID_PREFIXES.items():
+        if guid.startswith(legacy):
+            guid = modern + guid[len(legacy):]
+            break
+    return guid if guid.startswith(EXTERNAL_GUID_PREFIXES) else None
+
+def best_resolution(resolutions):
+    """Highest of some media resolutions (None if there are none)"""
+    resolutions = [resolution for resolution in resolutions if resolution]
+    if not resolutions:
+        return None
+    return max(resolutions, key=lambda r: RESOLUTION_RANK.get(r, 0))
+
+def build_guid_index(plex, section_type):
+    """Index every item of one type on a server by its external (imdb/tmdb/tvdb) GUIDs, in one paged pass
+    (plus one paged episode pass per show section, since a show's resolution is the best of its episodes)"""
+    items = []
+    index = {}
+    for section in plex.library.sections():
+        if section.type != section_type:
+            continue
+        print(f"  📇 Indexing {section.title} ({section_type})", file=sys.stderr)
+        positions = {}
+        for item in iter_section_items(plex, section.key, section_type, include_guids=True):
+            position = positions[item.rating_key] = len(items)
+            items.append({
+                'title': item.title,
+                'year': item.year,
+                'section': section.title,
+                'resolution': best_resolution(media.resolution for media in item.media),
+                'episodes': item.leaf_count if section_type == 'show' else None
+            })
+            for guid in [item.guid] + item.guids:
+                guid = normalize_guid(guid) if guid else None
+                if guid:
+                    index.setdefault(guid, position)
+        
+        if section_type == 'show':
+            for episode in iter_section_items(plex, section.key, 'episode', record=EpisodeMedia):
+                position = positions.get(episode.show_key)
+                if position is not None:
+                    items[position]['resolution'] = best_resolution([items[position]['resolution'], episode.resolution])
+    return items, index
+
+def join_guid_indexes(regular_items, regular_index, fourk_items, fourk_index):
+    """Hash join of two GUID indexes: only on regular, only on 4K, and on both"""
+    # Any shared GUID links a regular item to a 4K item
+    regular_to_fourk = {}
+    for guid, regular_position in regular_index.items():
+        fourk_position = fourk_index.get(guid)
+        if fourk_position is not None:
+            regular_to_fourk.setdefault(regular_position, fourk_position)
+    matched_fourk = set(regular_to_fourk.values())
+    
+    both = []
+    for regular_position, fourk_position in sorted(regular_to_fourk.items()):
+        regular_item = regular_items[regular_position]
+        fourk_item = fourk_items[fourk_position]
+        both.append({
+            'title': regular_item['title'],
+            'year': regular_item['year'],
+            'regular_resolution': regular_item['resolution'],
+            'fourk_resolution': fourk_item['resolution'],
+            'regular_episodes': regular_item['episodes'],
+            'fourk_episodes': fourk_item['episodes'],
+            'fourk_section': fourk_item['section']
+        })
+    
+    return {
+        'only_regular': [item for position, item in enumerate(regular_items) if position not in regular_to_fourk],
+        'only_fourk': [item for position, item in enumerate(fourk_items) if position not in matched_fourk],
+        'both': both
+    }
+
+def get_fourk_report(server_group, servers):
+    """Compare a group's regular and 4K servers for upgrade candidates and orphans"""
+    regular = PlexServer(servers['regular']['url'], servers['regular']['token'], timeout=30)
+    fourk = PlexServer(servers['fourk']['url'], servers['fourk']['token'], timeout=30)
+    
+    report = {}
+    for section_type in ('movie', 'show'):
+        print(f"🔍 {server_group}: comparing {section_type} libraries...", file=sys.stderr)
+        regular_items, regular_index = build_guid_index(regular, section_type)
+        fourk_items, fourk_index = build_guid_index(fourk, section_type)
+        
+        comparison = join_guid_indexes(regular_items, regular_index, fourk_items, fourk_index)
+        comparison['summary'] = {key: len(value) for key, value in comparison.items()}
+        report[section_type] = comparison
+        
+        print(f"  ✅ {section_type}: {comparison['summary']}", file=sys.stderr)
+    return report
+
+def get_all_fourk_reports():
+    """4K upgrade-candidate report for every group with both server types"""
+    reports = {}
+    for server_group, servers in PLEX_SERVERS.items():
+        if 'regular' not in servers or 'fourk' not in servers:
+            continue
+        try:
+            reports[server_group] = {'success': True, 'report': get_fourk_report(server_group, servers)}
+        except Exception as e:
+            print(f"❌ 4K report failed for {server_group}: {e}", file=sys.stderr)
+            reports[server_group] = {'success': False, 'error': str(e)}
+    return reports
+
+def get_section_episode_indexes(plex, section):
+    """Show/season/episode numbers for every episode in a section, one paged episode query"""
+    shows, seasons, episodes = [], [], []
+    show_titles = {}
+    for episode in iter_section_items(plex, section.key, 'episode', record=EpisodeRecord):
+        show_titles.setdefault(episode.show_key, episode.show_title)
+        shows.append(episode.show_key)
+        seasons.append(episode.season)
+        episodes.append(episode.episode)
+    return (np.array(shows, dtype=np.int64), np.array(seasons, dtype=np.int32),
+            np.array(episodes, dtype=np.int32), show_titles)
+
+def format_ranges(starts, ends):
+    """Render missing number ranges compactly: [3, 5-7]"""
+    return [str(a) if a == b else f"{a}-{b}" for a, b in zip(starts, ends)]
+
+def find_episode_gaps(shows, seasons, episodes, show_titles):
+    """Missing episodes and seasons per show, found with sorted-array differences"""
+    # Specials (season 0) and unnumbered episodes can't have gaps
+    keep = (seasons > 0) & (episodes > 0)
+    shows, seasons, episodes = shows[keep], seasons[keep], episodes[keep]
+    if not len(shows):
+        return {}
+    order = np.lexsort((episodes, seasons, shows))
+    shows, seasons, episodes = shows[order], seasons[order], episodes[order]
+    
+    # Drop duplicate episodes (multiple files of the same episode)
+    unique = np.r_[True, (shows[1:] != shows[:-1]) | (seasons[1:] != seasons[:-1]) | (episodes[1:] != episodes[:-1])]
+    shows, seasons, episodes = shows[unique], seasons[unique], episodes[unique]
+    
+    # Within a season, a step of more than one is a gap; a season not starting at 1 has a leading gap
+    same_season = (shows[1:] == shows[:-1]) & (seasons[1:] == seasons[:-1])
+    inner = np.flatnonzero(same_season & (episodes[1:] - episodes[:-1] > 1))
+    season_starts = np.flatnonzero(np.r_[True, ~same_season])
+    leading = season_starts[episodes[season_starts] > 1]
+    
+    gap_show = np.r_[shows[inner + 1], shows[leading]]
+    gap_season = np.r_[seasons[inner + 1], seasons[leading]]
+    gap_first = np.r_[episodes[inner] + 1, np.ones(len(leading), dtype=np.int32)]
+    gap_last = np.r_[episodes[inner + 1] - 1, episodes[leading] - 1]
+    gap_order = np.lexsort((gap_first, gap_season, gap_show))
+    gap_show, gap_season, gap_first, gap_last = (
+        gap_show[gap_order], gap_season[gap_order], gap_first[gap_order], gap_last[gap_order])
+    
+    # Same idea one level up: seasons missing between the ones present
+    season_show, season_number = shows[season_starts], seasons[season_starts]
+    same_show = season_show[1:] == season_show[:-1]
+    season_gap = np.flatnonzero(same_show & (season_number[1:] - season_number[:-1] > 1))
+    
+    report = {}
+    def show_entry(show_key):
+        return report.setdefault(str(show_key), {
+            'title': show_titles.get(show_key),
+            'missing_episodes': 0,
+            'incomplete_seasons': {},
+            'missing_seasons': []
+        })
+    
+    for show_key, season, first, last in zip(gap_show.tolist(), gap_season.tolist(), gap_first.tolist(), gap_last.tolist()):
+        entry = show_entry(show_key)
+        entry['incomplete_seasons'].setdefault(str(season), []).extend(format_ranges([first], [last]))
+        entry['missing_episodes'] += last - first + 1
+    
+    for i in season_gap.tolist():
+        entry = show_entry(int(season_show[i]))
+        entry['missing_seasons'].extend(format_ranges([int(season_number[i]) + 1], [int(season_number[i + 1]) - 1]))
+    
+    return report
+
+def get_server_gaps(server_config, server_key, full_refresh=False):
+    """Gap report for every show section on a server, cached until a section changes;
+    a section that fails is reported in errors and retried next run"""
+    plex = PlexServer(server_config['url'], server_config['token'], timeout=30)
+    cache = load_section_cache(server_key)
+    report = {}
+    errors = []
+    
+    for section in plex.library.sections():
+        if section.type != 'show':
+            continue
+        signature = section_signature(section)
+        cached = cache.get(str(section.key))
+        if full_refresh or cached is None or cached.get('signature') != signature:
+            cached = {}
+        
+        if 'gaps' in cached:
+            print(f"  📚 Unchanged: {section.title} - using cached gap report", file=sys.stderr)
+        else:
+            print(f"  🔎 Gap analysis: {section.title}", file=sys.stderr)
+            try:
+                cached['gaps'] = find_episode_gaps(*get_section_episode_indexes(plex, section))
+            except Exception as e:
+                print(f"  ❌ Gap analysis failed for {section.title}: {e}", file=sys.stderr)
+                errors.append({'section': section.title, 'error': str(e)})
+                continue
+        
+        cache[str(section.key)] = dict(cached, signature=signature, title=section.title)
+        report[section.title] = cached['gaps']
+    
+    save_section_cache(server_key, cache)
+    return report, errors
+
+def get_all_gap_reports(full_refresh=False):
+    """Missing-episode report for every configured server"""
+    reports = {}
+    for server_group, servers in PLEX_SERVERS.items():
+        reports[server_group] = {}
+        for server_type, server_config in servers.items():
+            try:
+                sections, errors = get_server_gaps(server_config, f"{server_group}.{server_type}", full_refresh)
+                reports[server_group][server_type] = {'success': True, 'sections': sections, 'errors': errors}
+            except Exception as e:
+                print(f"❌ Gap analysis failed for {server_config['name']}: {e}", file=sys.stderr)
+                reports[server_group][server_type] = {'success': False, 'error': str(e)}
+    return reports
+
+def get_library_stats(server_config, server_key=None, deep=False, full_refresh=False):
     """Get detailed content statistics from a Plex server with your specific library breakdown"""
     try:
         plex = PlexServer(server_config['url'], server_config['token'], timeout=10)
@@ -45,22 +683,56 @@ def get_library_stats(server_config):
             'audio_albums': 0,        # Albums
             'library_breakdown': {}
         }
+        if deep:
+            stats['storage_breakdown'] = {}
         
         print(f"🔍 Connecting to {server_config['name']}...", file=sys.stderr)
         
+        # Unchanged sections reuse their cached counts instead of being walked again
+        cache = load_section_cache(server_key) if server_key else {}
+        scanning = load_scanning_sections(server_key) if server_key else set()
+        new_cache = {}
+        
         # Get all library sections
         for section in plex.library.sections():
             section_type = section.type
             section_title = section.title
+            signature = section_signature(section)
+            cached = cache.get(str(section.key))
+            mid_scan = str(section.key) in scanning or getattr(section, 'refreshing', False)
+            if mid_scan and cached and 'counts' in cached:
+                # Mid-scan counts are partial; keep the last complete ones (and their old
+                # signature, so the section is recounted on the first run after the scan)
+                signature = cached['signature']
+            elif full_refresh or cached is None or cached.get('signature') != signature:
+                # Content changed: every cached result for the section is stale
+                cached = {}
+            
+            if 'counts' in cached:
+                breakdown = cached['counts']
+                if mid_scan:
+                    print(f"  ⏳ Scanning: {section_title} ({section_type}) - keeping previous counts", file=sys.stderr)
+                else:
+                    print(f"  📚 Unchanged: {section_title} ({section_type}) - using cached counts", file=sys.stderr)
+            else:
+                print(f"  📚 Processing: {section_title} ({section_type})", file=sys.stderr)
+                breakdown = count_section(plex, section)
             
-            print(f"  📚 Processing: {section_title} ({section_type})", file=sys.stderr)
+            if breakdown is None:
+                continue
+            
+            entry = dict(cached, signature=signature, title=section_title, counts=breakdown)
+            if deep and section_type in DEEP_LIBTYPES:
+                if 'deep' not in entry:
+                    print(f"  💽 Deep stats pass: {section_title}", file=sys.stderr)
+                    entry['deep'] = get_section_deep_stats(plex, section)
+                stats['storage_breakdown'][section_title] = entry['deep']
+            new_cache[str(section.key)] = entry
+            
+            stats['library_breakdown'][section_title] = breakdown
             
             if section_type == 'movie':
-                movie_count = len(section.all())
-                stats['library_breakdown'][section_title] = {
-                    'type': 'movie',
-                    'count': movie_count
-                }
+                movie_count = breakdown['count']
                 
                 # Map your specific movie libraries
                 if section_title == 'HD Movies':
@@ -75,16 +747,9 @@ def get_library_stats(server_config):
                     print(f"  📽️ Other Movies ({section_title}): {movie_count} → HD Movies", file=sys.stderr)
                 
             elif section_type == 'show':
-                shows = section.all()
-                show_count = len(shows)
-                
-                # Count seasons and episodes for this library
-                library_seasons = 0
-                library_episodes = 0
-                
-                for show in shows:
-                    library_seasons += show.childCount    # Seasons in this show
-                    library_episodes += show.leafCount    # Episodes in this show
+                show_count = breakdown['shows']
+                library_seasons = breakdown['seasons']
+                library_episodes = breakdown['episodes']
                 
                 # Add to totals
                 stats['total_seasons'] += library_seasons
@@ -108,30 +773,12 @@ def get_library_stats(server_config):
                     stats['regular_tv_shows'] += show_count
                     print(f"  📺 Other Shows ({section_title}): {show_count} → TV Shows", file=sys.stderr)
                 
-                stats['library_breakdown'][section_title] = {
-                    'type': 'show',
-                    'shows': show_count,
-                    'seasons': library_seasons,
-                    'episodes': library_episodes
-                }
-                
             elif section_type == 'artist':
-                artists = section.all()
-                artist_count = len(artists)
-                stats['audio_artists'] += artist_count
-                
-                library_albums = 0
-                for artist in artists:
-                    albums = artist.albums()
-                    library_albums += len(albums)
-                        
-                stats['audio_albums'] += library_albums
-                
-                stats['library_breakdown'][section_title] = {
-                    'type': 'artist',
-                    'artists': artist_count,
-                    'albums': library_albums
-                }
+                stats['audio_artists'] += breakdown['artists']
+                stats['audio_albums'] += breakdown['albums']
+        
+        if server_key:
+            save_section_cache(server_key, new_cache)
                 
         print(f"✅ {server_config['name']} totals: HD({stats['hd_movies']}) + Anime({stats['anime_movies']}) movies, TV({stats['regular_tv_shows']}) + AnimeTV({stats['anime_tv_shows']}) + Kids({stats['kids_tv_shows']}) + Fitness({stats['fitness_tv_shows']}) shows, {stats['total_seasons']} seasons, {stats['total_episodes']} episodes, {stats['audio_albums']} albums", file=sys.stderr)
         
@@ -161,7 +808,7 @@ def get_library_stats(server_config):
             'server': server_config['name']
         }
 
-def get_all_plex_stats():
+def get_all_plex_stats(deep=False, full_refresh=False):
     """Get statistics from all configured Plex servers"""
     all_stats = {}
     
@@ -172,22 +819,60 @@ def get_all_plex_stats():
         # Get regular server stats
         if 'regular' in servers:
             print(f"  🔍 Connecting to {servers['regular']['name']}...", file=sys.stderr)
-            regular_stats = get_library_stats(servers['regular'])
+            regular_stats = get_library_stats(servers['regular'], f"{server_group}.regular", deep, full_refresh)
             all_stats[server_group]['regular'] = regular_stats
             
         # Get 4K server stats  
         if 'fourk' in servers:
             print(f"  🔍 Connecting to {servers['fourk']['name']}...", file=sys.stderr)
-            fourk_stats = get_library_stats(servers['fourk'])
+            fourk_stats = get_library_stats(servers['fourk'], f"{server_group}.fourk", deep, full_refresh)
             all_stats[server_group]['fourk'] = fourk_stats
     
     return all_stats
 
 def main():
     """Main function to collect and output Plex statistics"""
+    parser = argparse.ArgumentParser(description='Plex Statistics Collector')
+    parser.add_argument('--growth', action='store_true',
+                       help='Print growth over 7/30/365 days from stored history (no Plex calls)')
+    parser.add_argument('--daily', type=int, metavar='DAYS',
+                       help='With --growth, include additions per day for the last DAYS days')
+    parser.add_argument('--no-history', action='store_true',
+                       help='Do not append this run to the history store')
+    parser.add_argument('--deep', action='store_true',
+                       help='Also aggregate storage, runtime and codec stats (cached per section)')
+    parser.add_argument('--full', action='store_true',
+                       help='Ignore the section cache and recount every section')
+    parser.add_argument('--fourk-report', action='store_true',
+                       help='Compare regular and 4K servers: only on regular, only on 4K, on both')
+    parser.add_argument('--gaps', action='store_true',
+                       help='Report missing episodes and seasons per show (cached per section)')
+    parser.add_argument('--sink', metavar='SINK',
+                       help='Also write plex_statistics rows: mysql, sqlite:PATH or csv:DIR (one transaction)')
+    
+    args = parser.parse_args()
+    
     try:
+        if args.growth:
+            print(json.dumps(get_all_history_growth(args.daily), indent=2))
+            return
+        
+        if args.fourk_report:
+            print(json.dumps(get_all_fourk_reports(), indent=2))
+            return
+        
+        if args.gaps:
+            print(json.dumps(get_all_gap_reports(args.full), separators=(',', ':')))
+            return
+        
         print("🚀 Starting Plex statistics collection...", file=sys.stderr)
-        stats = get_all_plex_stats()
+        stats = get_all_plex_stats(args.deep, args.full)
+        
+        if not args.no_history:
+            record_history(stats)
+        
+        if args.sink:
+            write_rows(args.sink, 'plex_statistics', statistics_rows(stats))
         
         # Output JSON to stdout for Node.js to consume
         print(json.dumps(stats, indent=2))
@@ -4,6 +4,11 @@ const db = require('./database-config');
 const router = express.Router();
 const { spawn } = require('child_process');
 
+const PLEX_MONITOR_PORT = process.env.PLEX_MONITOR_PORT || 9595;
+const PLEX_WEBHOOK_PORT = process.env.PLEX_WEBHOOK_PORT || 9596;
+// Server tags that limit which server's activity counts for a user (the script's PLEX_SERVERS names)
+const PLEX_SERVER_TAGS = ['Plex 1', 'Plex 2'];
+
 // Get libraries for a server group (plex1 or plex2) - FIXED
 router.get('/libraries/:serverGroup', async (req, res) => {
   try {
@@ -588,6 +593,152 @@ router.post('/refresh-stats', async (req, res) => {
   }
 });
 
+// GET /api/plex/stats-growth - Library growth trends from the local stats history (no Plex calls)
+router.get('/stats-growth', async (req, res) => {
+  try {
+    const days = parseInt(req.query.days, 10) || 30;
+    const growth = await getPlexStatsGrowth(days);
+    
+    res.json({
+      success: true,
+      growth: growth,
+      timestamp: new Date().toISOString()
+    });
+    
+  } catch (error) {
+    console.error('❌ Error getting Plex stats growth:', error);
+    res.status(500).json({
+      success: false,
+      error: 'Failed to get Plex statistics growth',
+      message: error.message
+    });
+  }
+});
+
+// GET /api/plex/viewing-stats - Per-user plays/hours/titles/active days over 7/30/90 days
+router.get('/viewing-stats', async (req, res) => {
+  try {
+    const stats = await getPlexUserReport('--viewing-stats');
+    
+    res.json({
+      success: true,
+      columns: stats.columns,
+      rows: stats.rows,
+      errors: stats.errors,
+      generatedAt: stats.generated_at
+    });
+    
+  } catch (error) {
+    console.error('❌ Error getting Plex viewing stats:', error);
+    res.status(500).json({
+      success: false,
+      error: 'Failed to get Plex viewing statistics',
+      message: error.message
+    });
+  }
+});
+
+// GET /api/plex/churn-risk - Per-user churn risk from viewing history, highest first
+router.get('/churn-risk', async (req, res) => {
+  try {
+    const report = await getPlexUserReport('--churn-report');
+    
+    res.json({
+      success: true,
+      columns: report.columns,
+      rows: report.rows,
+      errors: report.errors,
+      generatedAt: report.generated_at
+    });
+    
+  } catch (error) {
+    console.error('❌ Error getting Plex churn risk:', error);
+    res.status(500).json({
+      success: false,
+      error: 'Failed to get Plex churn risk',
+      message: error.message
+    });
+  }
+});
+
+// GET /api/plex/sharing - Accounts whose concurrent streams, devices or IPs exceed their device count
+router.get('/sharing', async (req, res) => {
+  try {
+    const report = await getPlexSharingReport(req.query.days);
+    
+    res.json({
+      success: true,
+      ...report,
+      timestamp: new Date().toISOString()
+    });
+    
+  } catch (error) {
+    console.error('❌ Error getting Plex sharing report:', error);
+    res.status(500).json({
+      success: false,
+      error: 'Failed to get Plex sharing report',
+      message: error.message
+    });
+  }
+});
+
+// POST /api/plex/webhook - Plex webhook target (multipart), forwarded to the Python webhook receiver
+router.post('/webhook', async (req, res) => {
+  try {
+    const chunks = [];
+    for await (const chunk of req) {
+      chunks.push(chunk);
+    }
+    
+    const response = await fetch(`http://127.0.0.1:${PLEX_WEBHOOK_PORT}/webhook`, {
+      method: 'POST',
+      headers: { 'Content-Type': req.headers['content-type'] || '' },
+      body: Buffer.concat(chunks),
+      signal: AbortSignal.timeout(5000)
+    });
+    const result = await response.json();
+    
+    // Keep the activity row current between syncs (rows exist once the sync has matched the account)
+    if (result.applied) {
+      await recordPlexWebhookActivity(result.entry);
+    }
+    
+    res.status(response.status).json(result);
+    
+  } catch (error) {
+    console.error('❌ Error handling Plex webhook:', error);
+    res.status(502).json({
+      success: false,
+      error: 'Plex webhook receiver not reachable',
+      message: error.message
+    });
+  }
+});
+
+// GET /api/plex/webhook-state - Latest webhook activity per server (plex1/plex2) and account
+router.get('/webhook-state', async (req, res) => {
+  try {
+    const query = req.query.server ? `?server=${encodeURIComponent(req.query.server)}` : '';
+    const response = await fetch(`http://127.0.0.1:${PLEX_WEBHOOK_PORT}/state${query}`, {
+      signal: AbortSignal.timeout(2000)
+    });
+    
+    res.json({
+      success: true,
+      state: await response.json(),
+      timestamp: new Date().toISOString()
+    });
+    
+  } catch (error) {
+    console.error('❌ Error getting Plex webhook state:', error);
+    res.status(502).json({
+      success: false,
+      error: 'Plex webhook receiver not reachable',
+      message: error.message
+    });
+  }
+});
+
 // GET /api/plex/dashboard-resources - Get cached server resources for dashboard
 router.get('/dashboard-resources', async (req, res) => {
   try {
@@ -814,8 +965,28 @@ router.post('/refresh-resources', async (req, res) => {
   }
 });
 
-// Helper function to get live server resources using Python
+// Helper function to get server resources, preferring the resource sampler daemon
 async function getPlexServerResources() {
+  try {
+    const response = await fetch(`http://127.0.0.1:${PLEX_MONITOR_PORT}/current`, {
+      signal: AbortSignal.timeout(2000)
+    });
+    if (response.ok) {
+      const resources = await response.json();
+      if (Object.values(resources).some(servers => Object.keys(servers).length > 0)) {
+        console.log('📊 Got server resources from resource sampler daemon');
+        return resources;
+      }
+    }
+  } catch (error) {
+    console.log('⚠️ Resource sampler daemon not reachable, running one-shot Python monitor');
+  }
+  
+  return getPlexServerResourcesFromScript();
+}
+
+// Helper function to get live server resources using Python
+async function getPlexServerResourcesFromScript() {
   return new Promise((resolve, reject) => {
     console.log('🐍 Executing Python script for Plex server resources...');
     
@@ -1078,16 +1249,17 @@ const statsToStore = [
   ['audiobooks', plex1Regular.audio_albums || 0]
 ];
         
-        // Clear old stats and insert new ones
-await db.query('DELETE FROM plex_statistics WHERE stat_key IN (?, ?, ?, ?, ?, ?, ?, ?)', 
-  ['hd_movies', 'anime_movies', 'fourk_movies', 'tv_shows', 'anime_tv_shows', 'tv_seasons', 'tv_episodes', 'audiobooks']);
-        
-        for (const [key, value] of statsToStore) {
-          await db.query(
-            `INSERT INTO plex_statistics (stat_key, stat_value, last_updated) VALUES (?, ?, NOW())`,
-            [key, value]
-          );
-        }
+        // Swap the stats in one transaction so a failed insert keeps the old values
+        await db.transaction([
+          {
+            sql: `DELETE FROM plex_statistics WHERE stat_key IN (${statsToStore.map(() => '?').join(', ')})`,
+            params: statsToStore.map(([key]) => key)
+          },
+          {
+            sql: `INSERT INTO plex_statistics (stat_key, stat_value, last_updated) VALUES ${statsToStore.map(() => '(?, ?, NOW())').join(', ')}`,
+            params: statsToStore.flat()
+          }
+        ]);
         
         console.log('✅ Plex statistics cached in database');
         resolve();
@@ -1105,14 +1277,97 @@ await db.query('DELETE FROM plex_statistics WHERE stat_key IN (?, ?, ?, ?, ?, ?,
   });
 }
 
-// In routes-plex.js, update the syncPlexUserActivity function:
+// Helper function to read growth trends from the Python stats history store
+async function getPlexStatsGrowth(days) {
+  return new Promise((resolve, reject) => {
+    const python = spawn('python3', ['plex_statistics.py', '--growth', '--daily', String(days)], {
+      cwd: __dirname,
+      stdio: ['pipe', 'pipe', 'pipe']
+    });
+    
+    let dataString = '';
+    let errorString = '';
+    
+    python.stdout.on('data', (data) => {
+      dataString += data.toString();
+    });
+    
+    python.stderr.on('data', (data) => {
+      errorString += data.toString();
+    });
+    
+    python.on('close', (code) => {
+      if (code !== 0) {
+        reject(new Error(`Python stats growth failed: ${errorString}`));
+        return;
+      }
+      
+      try {
+        resolve(JSON.parse(dataString));
+      } catch (parseError) {
+        reject(parseError);
+      }
+    });
+    
+    python.on('error', (err) => {
+      reject(err);
+    });
+  });
+}
 
-async function syncPlexUserActivity() {
+// Per-user report table (--viewing-stats / --churn-report) from the last-watched script's cached history
+async function getPlexUserReport(mode) {
+  const users = await loadPlexUsersExport();
+  
   return new Promise((resolve, reject) => {
-    console.log('🔄 Executing Python script for Plex user activity...');
+    const python = spawn('python3', ['plex_last_watched_script.py', mode, '--users-file', '-'], {
+      cwd: __dirname,
+      stdio: ['pipe', 'pipe', 'pipe']
+    });
     
-    // UPDATED: Use new script name and parameters
-    const python = spawn('python3', ['plex_last_watched_script.py', '--format', 'json'], {
+    let dataString = '';
+    let errorString = '';
+    
+    python.stdin.end(JSON.stringify(users));
+    
+    python.stdout.on('data', (data) => {
+      dataString += data.toString();
+    });
+    
+    python.stderr.on('data', (data) => {
+      errorString += data.toString();
+    });
+    
+    python.on('close', (code) => {
+      if (code !== 0) {
+        reject(new Error(`Python ${mode} failed: ${errorString}`));
+        return;
+      }
+      
+      try {
+        resolve(JSON.parse(dataString));
+      } catch (parseError) {
+        reject(parseError);
+      }
+    });
+    
+    python.on('error', (err) => {
+      reject(err);
+    });
+  });
+}
+
+// Sharing report from the resource monitor's stream rings and play history
+async function getPlexSharingReport(days) {
+  // Accounts are matched on plex_username/plex_email and flagged against users.device_count
+  const users = await db.query('SELECT id, name, plex_email, plex_username, tags, device_count FROM users');
+  const args = ['plex_resource_monitor.py', '--sharing', '--users-file', '-'];
+  if (parseInt(days) > 0) {
+    args.push('--sharing-days', String(parseInt(days)));
+  }
+  
+  return new Promise((resolve, reject) => {
+    const python = spawn('python3', args, {
       cwd: __dirname,
       stdio: ['pipe', 'pipe', 'pipe']
     });
@@ -1120,6 +1375,8 @@ async function syncPlexUserActivity() {
     let dataString = '';
     let errorString = '';
     
+    python.stdin.end(JSON.stringify(users));
+    
     python.stdout.on('data', (data) => {
       dataString += data.toString();
     });
@@ -1128,109 +1385,215 @@ async function syncPlexUserActivity() {
       errorString += data.toString();
     });
     
-    python.on('close', async (code) => {
+    python.on('close', (code) => {
       if (code !== 0) {
-        console.error('❌ Python activity script failed:', errorString);
-        reject(new Error(`Python script failed: ${errorString}`));
+        reject(new Error(`Python sharing report failed: ${errorString}`));
         return;
       }
       
       try {
-        const activityData = JSON.parse(dataString);
-        console.log(`📊 Processing ${activityData.length} user activity records`);
-        
-        // Clear old data and insert new
-        await db.query('DELETE FROM plex_user_activity');
-        
-for (const record of activityData) {
-  // Find the user in our database to check their tags
-  const [user] = await db.query(`
-    SELECT id, name, tags FROM users 
-    WHERE plex_email = ? OR plex_username = ?
-  `, [record.email, record.username]);
+        resolve(JSON.parse(dataString));
+      } catch (parseError) {
+        reject(parseError);
+      }
+    });
+    
+    python.on('error', (err) => {
+      reject(err);
+    });
+  });
+}
+
+// Users table export the last-watched script joins activity records against
+async function loadPlexUsersExport() {
+  return db.query('SELECT id, name, plex_email, plex_username, tags FROM users');
+}
+
+// Replace the activity rows of the synced accounts in one transaction; with the complete list of
+// current account ids, rows for accounts that left the servers are deleted in the same transaction
+async function writePlexUserActivity(records, accountIds = null) {
+  const queries = [];
   
-  if (!user) {
-    console.log(`⚠️ No user found for ${record.email}/${record.username}, skipping...`);
-    continue;
+  if (records.length > 0) {
+    const rows = records.map(record => [
+      record.plex_account_id,
+      record.username,
+      record.username,
+      record.email,
+      record.server,
+      record.days_since_last_watch,
+      record.last_watched_date,
+      record.last_watched_title,
+      record.days_since_last_watch !== null,
+      record.sync_timestamp
+    ]);
+    
+    queries.push(
+      {
+        sql: `DELETE FROM plex_user_activity WHERE plex_account_id IN (${records.map(() => '?').join(', ')})`,
+        params: records.map(record => record.plex_account_id)
+      },
+      {
+        sql: `INSERT INTO plex_user_activity 
+          (plex_account_id, plex_account_name, plex_account_username, plex_account_email,
+           server_name, days_since_last_watch, last_watched_date, last_watched_title, 
+           has_recent_activity, sync_timestamp)
+          VALUES ${rows.map(row => `(${row.map(() => '?').join(', ')})`).join(', ')}`,
+        params: rows.flat()
+      }
+    );
   }
   
-  // Add this debug code right after finding the user
-console.log(`🔍 Raw tags for ${user.name}:`, user.tags);
-console.log(`🔍 Tags type:`, typeof user.tags);
-console.log(`🔍 Tags length:`, user.tags ? user.tags.length : 'null');
-  
-  // Parse user tags
-let userTags = [];
-try {
-  if (user.tags === null || user.tags === undefined) {
-    userTags = [];
-  } else if (Array.isArray(user.tags)) {
-    // Already parsed by MySQL
-    userTags = user.tags;
-  } else if (typeof user.tags === 'string') {
-    // String that needs parsing
-    userTags = JSON.parse(user.tags);
-  } else {
-    console.log(`⚠️ Unexpected tags type for ${user.name}:`, typeof user.tags);
-    userTags = [];
+  if (accountIds && accountIds.length > 0) {
+    queries.push({
+      sql: `DELETE FROM plex_user_activity WHERE plex_account_id NOT IN (${accountIds.map(() => '?').join(', ')})`,
+      params: accountIds
+    });
   }
   
-  console.log(`🏷️ Parsed tags for ${user.name}:`, userTags);
+  if (queries.length > 0) {
+    await db.transaction(queries);
+    console.log(`✅ Wrote activity for ${records.length} users${accountIds ? ', removed accounts no longer on the servers' : ''}`);
+  }
   
-} catch (e) {
-  console.log(`❌ Error parsing tags for ${user.name}:`, e.message);
-  console.log(`🔍 Raw value was:`, user.tags);
-  userTags = [];
+  // Rows written above are current; only rows from earlier syncs need aging
+  const syncedAt = records.map(record => record.sync_timestamp).filter(Boolean).sort()[0];
+  await refreshPlexActivityAges(syncedAt ? syncedAt.replace('T', ' ').slice(0, 19) : new Date());
 }
-  
-  // Check if this server record should be saved for this user
-  const serverName = record.server;
-  const hasPlex1Tag = userTags.includes('Plex 1');
-  const hasPlex2Tag = userTags.includes('Plex 2');
-  const hasNoPlexTags = !hasPlex1Tag && !hasPlex2Tag;
-  
-  let shouldSave = false;
-  
-  if (serverName.includes('Plex 1') && hasPlex1Tag) {
-    shouldSave = true;
-  } else if (serverName.includes('Plex 2') && hasPlex2Tag) {
-    shouldSave = true;
-  } else if (hasNoPlexTags) {
-    shouldSave = true; // Users with no Plex tags get data from any server
+
+// Let the script move its high-water marks past a sync once its rows are in the database
+async function commitPlexWatchState(syncId) {
+  return new Promise((resolve, reject) => {
+    const python = spawn('python3', ['plex_last_watched_script.py', '--commit-state', syncId], {
+      cwd: __dirname,
+      stdio: ['ignore', 'pipe', 'pipe']
+    });
+    
+    let errorString = '';
+    
+    python.stderr.on('data', (data) => {
+      errorString += data.toString();
+    });
+    
+    python.on('close', (code) => {
+      if (code !== 0) {
+        reject(new Error(`Python --commit-state failed: ${errorString}`));
+        return;
+      }
+      resolve();
+    });
+    
+    python.on('error', (err) => {
+      reject(err);
+    });
+  });
+}
+
+// Move an account's last watch forward from a webhook event. entry.server is the config name the
+// receiver resolved from the event's Server.uuid, and like the sync, only counts if the user's
+// Plex 1/Plex 2 tags allow that server (untagged users: any server)
+async function recordPlexWebhookActivity(entry) {
+  const [activity] = await db.query(
+    'SELECT plex_account_email, plex_account_username FROM plex_user_activity WHERE plex_account_id = ?',
+    [entry.account_id]
+  );
+  if (!activity) {
+    return;
   }
   
-  if (!shouldSave) {
-    console.log(`🚫 Skipping ${serverName} activity for ${user.name} (has tags: ${userTags.join(', ')})`);
-    continue;
+  const email = (activity.plex_account_email || '').toLowerCase();
+  const username = (activity.plex_account_username || '').toLowerCase();
+  const users = await db.query(
+    'SELECT plex_email, plex_username, tags FROM users WHERE LOWER(plex_email) = ? OR LOWER(plex_username) = ?',
+    [email, username]
+  );
+  const user = users.find(u => email && (u.plex_email || '').toLowerCase() === email) ||
+               users.find(u => username && (u.plex_username || '').toLowerCase() === username);
+  if (!user) {
+    return;
   }
   
-  console.log(`✅ Saving ${serverName} activity for ${user.name} (${record.days_since_last_watch} days ago)`);
+  let tags = [];
+  try {
+    tags = Array.isArray(user.tags) ? user.tags : JSON.parse(user.tags || '[]');
+  } catch (error) {
+    tags = [];
+  }
+  const serverTags = tags.filter(tag => PLEX_SERVER_TAGS.includes(tag));
+  if (serverTags.length > 0 && !serverTags.includes(entry.server)) {
+    return;
+  }
   
+  const viewedAt = new Date(entry.viewed_at * 1000);
   await db.query(`
-    INSERT INTO plex_user_activity 
-    (plex_account_id, plex_account_name, plex_account_username, plex_account_email,
-     server_name, days_since_last_watch, last_watched_date, last_watched_title, 
-     has_recent_activity, sync_timestamp)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-  `, [
-    record.plex_account_id,
-    record.username,
-    record.username,
-    record.email,
-    record.server,
-    record.days_since_last_watch,
-    record.last_watched_date,
-    record.last_watched_title,
-    record.days_since_last_watch !== null,
-    record.sync_timestamp
-  ]);
+    UPDATE plex_user_activity
+    SET last_watched_date = ?, last_watched_title = ?, server_name = ?,
+        days_since_last_watch = 0, has_recent_activity = TRUE
+    WHERE plex_account_id = ? AND (last_watched_date IS NULL OR last_watched_date < ?)
+  `, [viewedAt, entry.title, entry.server, entry.account_id, viewedAt]);
 }
+
+// Unchanged accounts aren't re-sent by the incremental sync, so age the rows older than this sync here
+async function refreshPlexActivityAges(syncedAt) {
+  await db.query(`
+    UPDATE plex_user_activity
+    SET days_since_last_watch = DATEDIFF(NOW(), last_watched_date)
+    WHERE last_watched_date IS NOT NULL AND sync_timestamp < ?
+  `, [syncedAt]);
+}
+
+// In routes-plex.js, update the syncPlexUserActivity function:
+
+async function syncPlexUserActivity() {
+  return new Promise((resolve, reject) => {
+    console.log('🔄 Executing Python script for Plex user activity...');
+    
+    // UPDATED: Use new script name and parameters
+    const python = spawn('python3', ['plex_last_watched_script.py', '--format', 'json', '--incremental', '--users-file', '-'], {
+      cwd: __dirname,
+      stdio: ['pipe', 'pipe', 'pipe']
+    });
+    
+    let dataString = '';
+    let errorString = '';
+    
+    // The script matches Plex accounts to our users itself
+    loadPlexUsersExport()
+      .then(users => python.stdin.end(JSON.stringify(users)))
+      .catch(error => {
+        console.error('❌ Failed to export users for activity sync:', error);
+        python.kill();
+      });
+    
+    python.stdout.on('data', (data) => {
+      dataString += data.toString();
+    });
+    
+    python.stderr.on('data', (data) => {
+      errorString += data.toString();
+    });
+    
+    python.on('close', async (code) => {
+      if (code !== 0) {
+        console.error('❌ Python activity script failed:', errorString);
+        reject(new Error(`Python script failed: ${errorString}`));
+        return;
+      }
+      
+      try {
+        const { sync_id: syncId, records: activityData, account_ids: accountIds } = JSON.parse(dataString);
+        console.log(`📊 Processing ${activityData.length} user activity records`);
+        
+        // One row per user (already matched and tag-filtered), only for users whose last watch changed
+        await writePlexUserActivity(activityData, accountIds);
+        // Only now can the script's state move past these changes
+        await commitPlexWatchState(syncId);
         
         console.log('✅ Plex user activity synced to database');
         resolve();
         
       } catch (parseError) {
-        console.error('❌ Error parsing Python output:', parseError);
+        console.error('❌ Error syncing Python output:', parseError);
         reject(parseError);
       }
     });
@@ -1248,7 +1611,7 @@ async function syncPlexUserActivityWithStatus(syncId) {
     
     const result = await new Promise((resolve, reject) => {
       // UPDATED: Use new script name (no --days parameter needed since it gets all history)
-      const python = spawn('python3', ['plex_last_watched_script.py', '--format', 'json'], {
+      const python = spawn('python3', ['plex_last_watched_script.py', '--format', 'json', '--incremental', '--users-file', '-'], {
         cwd: __dirname,
         stdio: ['pipe', 'pipe', 'pipe']
       });
@@ -1256,6 +1619,14 @@ async function syncPlexUserActivityWithStatus(syncId) {
       let dataString = '';
       let errorString = '';
       
+      // The script matches Plex accounts to our users itself
+      loadPlexUsersExport()
+        .then(users => python.stdin.end(JSON.stringify(users)))
+        .catch(error => {
+          console.error(`❌ Sync ${syncId}: failed to export users:`, error);
+          python.kill();
+        });
+      
       python.stdout.on('data', (data) => {
         dataString += data.toString();
       });
@@ -1272,94 +1643,13 @@ async function syncPlexUserActivityWithStatus(syncId) {
         }
         
         try {
-          const activityData = JSON.parse(dataString);
+          const { sync_id: stateSyncId, records: activityData, account_ids: accountIds } = JSON.parse(dataString);
           console.log(`📊 Sync ${syncId}: Processing ${activityData.length} records`);
           
-          // Clear old data and insert new
-          await db.query('DELETE FROM plex_user_activity');
-          
-for (const record of activityData) {
-  // Find the user in our database to check their tags
-  const [user] = await db.query(`
-    SELECT id, name, tags FROM users 
-    WHERE plex_email = ? OR plex_username = ?
-  `, [record.email, record.username]);
-  
-  if (!user) {
-    console.log(`⚠️ No user found for ${record.email}/${record.username}, skipping...`);
-    continue;
-  }
-  // Add this debug code right after finding the user
-console.log(`🔍 Raw tags for ${user.name}:`, user.tags);
-console.log(`🔍 Tags type:`, typeof user.tags);
-console.log(`🔍 Tags length:`, user.tags ? user.tags.length : 'null');
-  // Parse user tags
-
-let userTags = [];
-try {
-  if (user.tags === null || user.tags === undefined) {
-    userTags = [];
-  } else if (Array.isArray(user.tags)) {
-    // Already parsed by MySQL
-    userTags = user.tags;
-  } else if (typeof user.tags === 'string') {
-    // String that needs parsing
-    userTags = JSON.parse(user.tags);
-  } else {
-    console.log(`⚠️ Unexpected tags type for ${user.name}:`, typeof user.tags);
-    userTags = [];
-  }
-  
-  console.log(`🏷️ Parsed tags for ${user.name}:`, userTags);
-  
-} catch (e) {
-  console.log(`❌ Error parsing tags for ${user.name}:`, e.message);
-  console.log(`🔍 Raw value was:`, user.tags);
-  userTags = [];
-}
-  
-  // Check if this server record should be saved for this user
-  const serverName = record.server;
-  const hasPlex1Tag = userTags.includes('Plex 1');
-  const hasPlex2Tag = userTags.includes('Plex 2');
-  const hasNoPlexTags = !hasPlex1Tag && !hasPlex2Tag;
-  
-  let shouldSave = false;
-  
-  if (serverName.includes('Plex 1') && hasPlex1Tag) {
-    shouldSave = true;
-  } else if (serverName.includes('Plex 2') && hasPlex2Tag) {
-    shouldSave = true;
-  } else if (hasNoPlexTags) {
-    shouldSave = true; // Users with no Plex tags get data from any server
-  }
-  
-  if (!shouldSave) {
-    console.log(`🚫 Skipping ${serverName} activity for ${user.name} (has tags: ${userTags.join(', ')})`);
-    continue;
-  }
-  
-  console.log(`✅ Saving ${serverName} activity for ${user.name} (${record.days_since_last_watch} days ago)`);
-  
-  await db.query(`
-    INSERT INTO plex_user_activity 
-    (plex_account_id, plex_account_name, plex_account_username, plex_account_email,
-     server_name, days_since_last_watch, last_watched_date, last_watched_title, 
-     has_recent_activity, sync_timestamp)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-  `, [
-    record.plex_account_id,
-    record.username,
-    record.username,
-    record.email,
-    record.server,
-    record.days_since_last_watch,
-    record.last_watched_date,
-    record.last_watched_title,
-    record.days_since_last_watch !== null,
-    record.sync_timestamp
-  ]);
-}
+          // One row per user (already matched and tag-filtered), only for users whose last watch changed
+          await writePlexUserActivity(activityData, accountIds);
+          // Only now can the script's state move past these changes
+          await commitPlexWatchState(stateSyncId);
           
           resolve({
             success: true,
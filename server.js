@@ -390,6 +390,56 @@ app.use((req, res) => {
   res.status(404).json({ error: 'Route not found' });
 });
 
+// Plex resource sampler daemon - polls Plex servers in the background so
+// dashboard loads read cached samples instead of calling Plex live
+function startPlexResourceSampler() {
+  const { spawn } = require('child_process');
+  
+  const sampler = spawn('python3', ['plex_resource_monitor.py', '--daemon'], {
+    cwd: __dirname,
+    stdio: ['ignore', 'ignore', 'pipe']
+  });
+  
+  sampler.stderr.on('data', (data) => {
+    const lines = data.toString().split('\n').filter(line => line.includes('[ERROR]') || line.includes('[START]'));
+    lines.forEach(line => console.log('🐍 Resource sampler:', line.trim()));
+  });
+  
+  sampler.on('close', (code) => {
+    console.error(`❌ Plex resource sampler exited with code ${code}, restarting in 60 seconds...`);
+    setTimeout(startPlexResourceSampler, 60 * 1000);
+  });
+  
+  sampler.on('error', (err) => {
+    console.error('❌ Failed to start Plex resource sampler:', err.message);
+  });
+}
+
+// Plex webhook receiver - keeps a per-account last-activity index from Plex
+// media events (forwarded by /api/plex/webhook) between activity syncs
+function startPlexWebhookReceiver() {
+  const { spawn } = require('child_process');
+  
+  const receiver = spawn('python3', ['plex_last_watched_script.py', '--webhook'], {
+    cwd: __dirname,
+    stdio: ['ignore', 'ignore', 'pipe']
+  });
+  
+  receiver.stderr.on('data', (data) => {
+    const lines = data.toString().split('\n').filter(line => line.includes('[ERROR]') || line.includes('[START]'));
+    lines.forEach(line => console.log('🐍 Webhook receiver:', line.trim()));
+  });
+  
+  receiver.on('close', (code) => {
+    console.error(`❌ Plex webhook receiver exited with code ${code}, restarting in 60 seconds...`);
+    setTimeout(startPlexWebhookReceiver, 60 * 1000);
+  });
+  
+  receiver.on('error', (err) => {
+    console.error('❌ Failed to start Plex webhook receiver:', err.message);
+  });
+}
+
 // Initialize database and start scheduled tasks
 async function initializeApp() {
   try {
@@ -407,6 +457,14 @@ async function initializeApp() {
       console.log(`📺 EPG Guide available at http://localhost:${PORT}/guide/guide`);
     });
 
+    // Start background Plex resource sampling
+    startPlexResourceSampler();
+    console.log('✅ Plex resource sampler started');
+
+    // Start the Plex webhook receiver (Plex webhook URL: http://<host>/api/plex/webhook)
+    startPlexWebhookReceiver();
+    console.log('✅ Plex webhook receiver started');
+
     // Test email service immediately on startup
     console.log('🧪 Testing email service on startup...');
     setTimeout(async () => {
@@ -483,6 +541,22 @@ async function initializeApp() {
     });
     console.log('✅ Daily renewal reminder scheduler activated (12 PM UTC)');
 
+    // Every minute forward new Plex resource anomaly alerts from the sampler
+    cron.schedule('* * * * *', async () => {
+      try {
+        if (!emailService.transporter) {
+          return;
+        }
+        const result = await emailService.processResourceAlerts();
+        if (result.sent > 0) {
+          console.log(`🚨 Sent ${result.sent} Plex resource alert(s)`);
+        }
+      } catch (error) {
+        console.error('❌ Error processing Plex resource alerts:', error);
+      }
+    });
+    console.log('✅ Plex resource alert emails activated (every minute)');
+
     // Every 5 minutes check for immediate scheduled emails (for testing and urgent emails)
     cron.schedule('*/5 * * * *', async () => {
       try {